@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark for the UEFIReader command line tool.
+
+Runs the interpreter with -X importtime on the CLI entry module a number of
+times and reports the median cumulative import time of the package and of
+the slowest modules it pulls in, plus the median wall time of a full
+`python -m python_uefi_reader --help` process.
+
+Usage: python benchmark_startup.py [--runs N] [--top N]
+"""
+
+import argparse
+import compileall
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ENTRY_MODULE = 'python_uefi_reader.__main__'
+
+
+def import_times(runs: int) -> dict:
+    """Return the cumulative import times in microseconds of each module, per run."""
+    samples = {}
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {ENTRY_MODULE}'],
+                                env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            samples.setdefault(name.strip(), []).append(int(cumulative))
+    return samples
+
+
+def process_time(runs: int) -> float:
+    """Return the median wall time in milliseconds of a `--help` invocation."""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'python_uefi_reader', '--help'], env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure UEFIReader CLI startup time.")
+    parser.add_argument('--runs', type=int, default=10, help="runs per measurement (default: 10)")
+    parser.add_argument('--top', type=int, default=15, help="slowest modules to list (default: 15)")
+    args = parser.parse_args()
+
+    # Compile up front so that bytecode compilation is not measured, even
+    # when PYTHONDONTWRITEBYTECODE keeps imports from writing .pyc files
+    compileall.compile_dir(os.path.join(ROOT, 'python_uefi_reader'), quiet=1)
+    import_times(1)
+
+    samples = import_times(args.runs)
+    medians = {name: statistics.median(values) for name, values in samples.items()}
+    print(f"{ENTRY_MODULE}: {medians.get(ENTRY_MODULE, 0) / 1000:.2f} ms cumulative import time")
+    print(f"{'cumulative ms':>14}  module")
+    for name, value in sorted(medians.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{value / 1000:14.2f}  {name}")
+    print(f"--help process: {process_time(args.runs):.1f} ms median wall time")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,9 +3,56 @@ UEFIReader - Python implementation
 
 Tool to generate .inf payloads for use in various other UEFI projects
 out of an existing UEFI volume.
+
+Public names are imported from their submodules on first access, so the
+command line tool and thin clients such as the daemon client do not pay for
+modules they never use.
 """
 
-from .uefi import UEFI, EFI, EFISection
+import importlib
+import sys
 
 __version__ = '1.0.0'
-__all__ = ['UEFI', 'EFI', 'EFISection']
+
+# Public name -> submodule defining it
+_EXPORTS = {
+    'UEFI': 'uefi', 'EFI': 'uefi', 'EFISection': 'uefi', 'EFIContainer': 'uefi',
+    'DependencyGraph': 'depex',
+    'GUID': 'guids',
+    'DecompressionError': 'limits', 'DecompressionLimitError': 'limits',
+    'CancellationToken': 'progress', 'OperationCancelled': 'progress', 'DeadlineExceeded': 'progress',
+    'SharedResult': 'shared',
+    'UEFIIndex': 'index',
+    'IndexFile': 'index_file',
+    'BlobStore': 'blob_store',
+    'Corpus': 'corpus',
+    'DirectoryOutput': 'output', 'ArchiveOutput': 'output',
+    'ProbeResult': 'probe',
+    'ImageDiff': 'diff', 'diff_images': 'diff',
+    'CompressionCache': 'repack',
+}
+
+__all__ = ['UEFI', 'EFI', 'EFISection', 'EFIContainer', 'GUID', 'UEFIIndex', 'IndexFile',
+           'BlobStore', 'DirectoryOutput', 'ArchiveOutput', 'ProbeResult',
+           'ImageDiff', 'diff_images', 'CompressionCache', 'DependencyGraph',
+           'Corpus', 'DecompressionError', 'DecompressionLimitError', 'CancellationToken',
+           'OperationCancelled', 'DeadlineExceeded', 'SharedResult']
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'.{module}', __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
+
+
+if sys.version_info < (3, 7):
+    # Module __getattr__ (PEP 562) is not available; import everything up front
+    for _name in __all__:
+        globals()[_name] = __getattr__(_name)
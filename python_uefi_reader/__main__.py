@@ -6,32 +6,142 @@ out of an existing UEFI volume.
 Python port from the original C# implementation.
 """
 
+import argparse
 import sys
 import os
-from .uefi import UEFI
+from typing import TYPE_CHECKING, Sequence
+from .blob_store import BlobStore, LINK_MODES
+from .output import ArchiveOutput, ARCHIVE_FORMATS
+from .templates import MANIFEST_FORMATS
 
+if TYPE_CHECKING:
+    from datetime import datetime
+    from .uefi import UEFI
 
-def extract_qualcomm_uefi_image(uefi_path: str, output: str):
+
+def extract_qualcomm_uefi_image(uefi_path: str, output: str, store: BlobStore = None,
+                                archive_format: str = None, timestamp: 'datetime' = None,
+                                manifests: Sequence[str] = (), memory_budget: int = None):
     """Extract Qualcomm UEFI image."""
+    from .uefi import UEFI
     with open(uefi_path, 'rb') as f:
         uefi_data = f.read()
-    
-    uefi = UEFI(uefi_data)
-    
+
+    with UEFI(uefi_data, memory_budget=memory_budget) as uefi:
+        extract_parsed_image(uefi, output, store, archive_format, timestamp, manifests)
+
+
+def extract_parsed_image(uefi: 'UEFI', output: str, store: BlobStore = None, archive_format: str = None,
+                         timestamp: 'datetime' = None, manifests: Sequence[str] = (), timeout: float = None):
+    """Extract an already parsed image into output, under its build ID."""
+    if archive_format:
+        mtime = timestamp.timestamp() if timestamp is not None else None
+        uefi.extract_uefi(ArchiveOutput(output, archive_format, prefix=uefi.build_id, mtime=mtime),
+                          timestamp=timestamp, manifests=manifests, timeout=timeout)
+        return
+
     if uefi.build_id:
         output = os.path.join(output, uefi.build_id)
-    
-    uefi.extract_uefi(output)
 
+    uefi.extract_uefi(output, store, timestamp, manifests, timeout=timeout)
+
+
+def write_inventory(uefi_path: str, output: str):
+    """Write an NDJSON inventory of a UEFI image to output ('-' for stdout)."""
+    from .uefi import UEFI
+    with open(uefi_path, 'rb') as f:
+        uefi_data = f.read()
+
+    if output == '-':
+        UEFI.write_inventory(uefi_data, sys.stdout)
+        return
+
+    with open(output, 'w') as f:
+        UEFI.write_inventory(uefi_data, f)
+
+
+def epoch_timestamp(value) -> 'datetime':
+    """Return the UTC time value seconds after the epoch; ValueError if it is not an integer in range."""
+    from datetime import datetime, timezone
+    try:
+        return datetime.fromtimestamp(int(value), timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError(f"invalid timestamp: {value!r}") from None
 
-def main():
+
+def parse_timestamp(value: str) -> 'datetime':
+    """Parse a --timestamp value: seconds since the epoch."""
+    try:
+        return epoch_timestamp(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def source_date_epoch(parser: argparse.ArgumentParser) -> 'datetime':
+    """Return the SOURCE_DATE_EPOCH timestamp, or None if it is unset or empty; exit through parser if invalid."""
+    value = os.environ.get('SOURCE_DATE_EPOCH', '').strip()
+    if not value:
+        return None
+    try:
+        return epoch_timestamp(value)
+    except ValueError as e:
+        parser.error(f"SOURCE_DATE_EPOCH: {e}")
+
+
+def build_parser(prog: str = None) -> argparse.ArgumentParser:
+    """Build the command line parser."""
+    parser = argparse.ArgumentParser(
+        prog=prog,
+        description="Generate .inf payloads out of an existing UEFI volume.")
+    parser.add_argument('image', help="Path to UEFI image/XBL image")
+    parser.add_argument('output', help="Output Directory (or archive/inventory file, '-' for stdout, "
+                                       "with --archive or --inventory)")
+    parser.add_argument('--store', metavar='DIR',
+                        help="write payloads to a content-addressed store and link them into the output")
+    parser.add_argument('--link', choices=LINK_MODES, default='hardlink',
+                        help="how payloads are linked from the store (default: hardlink)")
+    parser.add_argument('--archive', choices=ARCHIVE_FORMATS,
+                        help="write the extracted tree into an archive instead of a directory")
+    parser.add_argument('--inventory', action='store_true',
+                        help="write an NDJSON inventory of files and sections to output ('-' for stdout) "
+                             "instead of extracting")
+    parser.add_argument('--timestamp', metavar='EPOCH', type=parse_timestamp,
+                        help="generation time written into .inf files, in seconds since the epoch "
+                             "(default: SOURCE_DATE_EPOCH, else now)")
+    parser.add_argument('--manifest', choices=MANIFEST_FORMATS, action='append', default=[],
+                        help="also write a manifest of the extracted modules (may be repeated)")
+    parser.add_argument('--memory-budget', metavar='MIB', type=int,
+                        help="keep at most this many MiB of decompressed payloads in memory, "
+                             "spilling the rest to a temp file")
+    return parser
+
+
+def main(prog: str = None):
     """Main entry point."""
-    if len(sys.argv) == 3 and os.path.exists(sys.argv[1]):
-        extract_qualcomm_uefi_image(sys.argv[1], sys.argv[2])
-    else:
-        print("Usage: <Path to UEFI image/XBL image> <Output Directory>")
+    parser = build_parser(prog)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.image):
+        parser.print_usage()
         sys.exit(1)
 
+    if args.inventory:
+        if args.archive or args.store or args.manifest:
+            parser.error("--inventory cannot be combined with --archive, --store or --manifest")
+        write_inventory(args.image, args.output)
+        return
+
+    if args.archive and args.store:
+        parser.error("--store cannot be combined with --archive")
+
+    if args.timestamp is None:
+        args.timestamp = source_date_epoch(parser)
+
+    store = BlobStore(args.store, args.link) if args.store else None
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget is not None else None
+    extract_qualcomm_uefi_image(args.image, args.output, store, args.archive, args.timestamp, args.manifest,
+                                memory_budget)
+
 
 if __name__ == '__main__':
     main()
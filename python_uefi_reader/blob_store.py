@@ -0,0 +1,95 @@
+"""
+Content-addressed store for extracted payloads.
+
+Payloads are written once under their hash and linked into the extracted
+tree, so identical payloads across builds share storage.
+"""
+
+import errno
+import os
+
+LINK_MODES = ('hardlink', 'symlink', 'reflink', 'copy')
+
+# From <linux/fs.h>: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def _reflink(source: str, destination: str) -> None:
+    """Clone source into destination sharing extents (Linux btrfs/xfs)."""
+    import fcntl
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+class BlobStore:
+    """Directory of payloads keyed by content hash."""
+
+    def __init__(self, root: str, link: str = 'hardlink', algorithm: str = 'sha256'):
+        if link not in LINK_MODES:
+            raise ValueError(f"Unsupported link mode: {link}")
+        self.root = root
+        self.link = link
+        self.algorithm = algorithm
+        self.blobs_written = 0
+        self.blobs_reused = 0
+
+    def blob_path(self, digest: str) -> str:
+        """Return the path of the blob with the given hex digest."""
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        """Store data if not already present and return its blob path."""
+        import hashlib
+        digest = hashlib.new(self.algorithm, data).hexdigest()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            self.blobs_reused += 1
+            return path
+
+        directory = os.path.dirname(path)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary name first so concurrent extractions never see partial blobs.
+        # Created with mode 0666 so blobs (and hard links to them) get the umask default,
+        # as the plain extractor's files do; mkstemp would make them 0600.
+        temp_path = os.path.join(directory, f'.tmp-{os.getpid()}-{os.urandom(8).hex()}')
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        self.blobs_written += 1
+        return path
+
+    def write(self, path: str, data: bytes) -> None:
+        """Store data and link it into the tree at path."""
+        blob = self.put(data)
+        if os.path.lexists(path):
+            os.unlink(path)
+
+        if self.link == 'hardlink':
+            try:
+                os.link(blob, path)
+                return
+            except OSError as e:
+                # Cross-device stores and link count limits fall back to a copy
+                if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP):
+                    raise
+        elif self.link == 'symlink':
+            os.symlink(os.path.abspath(blob), path)
+            return
+        elif self.link == 'reflink':
+            try:
+                _reflink(blob, path)
+                return
+            except (OSError, ImportError):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+        import shutil
+        shutil.copyfile(blob, path)
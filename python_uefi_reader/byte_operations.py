@@ -21,17 +21,18 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import struct
-import uuid
+
+from .guids import GUID, intern_guid
 
 
 def read_ascii_string(byte_array: bytes, offset: int, length: int) -> str:
     """Read ASCII string from byte array."""
-    return byte_array[offset:offset + length].decode('ascii')
+    return bytes(byte_array[offset:offset + length]).decode('ascii')
 
 
 def read_unicode_string(byte_array: bytes, offset: int, length: int) -> str:
     """Read Unicode (UTF-16) string from byte array."""
-    return byte_array[offset:offset + length].decode('utf-16le')
+    return bytes(byte_array[offset:offset + length]).decode('utf-16le')
 
 
 def read_uint32(byte_array: bytes, offset: int) -> int:
@@ -69,10 +70,9 @@ def read_uint64(byte_array: bytes, offset: int) -> int:
     return struct.unpack_from('<Q', byte_array, offset)[0]
 
 
-def read_guid(byte_array: bytes, offset: int) -> uuid.UUID:
-    """Read GUID (16 bytes) from byte array."""
-    guid_bytes = byte_array[offset:offset + 16]
-    return uuid.UUID(bytes_le=guid_bytes)
+def read_guid(byte_array: bytes, offset: int) -> GUID:
+    """Read GUID (16 bytes) from byte array, interned (see guids)."""
+    return intern_guid(bytes(byte_array[offset:offset + 16]))
 
 
 def write_uint16(byte_array: bytearray, offset: int, value: int) -> None:
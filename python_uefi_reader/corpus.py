@@ -0,0 +1,325 @@
+"""
+Persistent query index over a corpus of UEFI images.
+
+A Corpus is an SQLite database holding, for every indexed image, its build
+ID and the GUID, type, UI name and module path of each file, the type and
+digest of each section, and the build paths embedded in its PE32 images.
+Queries by GUID, digest, UI name, module path or build ID are answered from
+the database without opening any image. Exact lookups and glob patterns
+that start with a literal prefix, such as 'Usb*' or 'QcomPkg/*', are served
+by indexes; patterns starting with a wildcard, such as '*Dxe', scan every
+file (or build path) in the corpus.
+
+Corpus.update parses new and changed images in a process pool and only
+writes from the calling process; images whose size and modification time
+are unchanged since they were indexed are skipped.
+"""
+
+import os
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+from .guids import intern_guid
+from .index import GuidLike, to_guid
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+CORPUS_VERSION = 1
+DEFAULT_HASH_ALGORITHM = 'sha256'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    build_id TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    image_id INTEGER NOT NULL,
+    file_index INTEGER NOT NULL,
+    guid BLOB NOT NULL,
+    type TEXT NOT NULL,
+    name TEXT,
+    module TEXT,
+    digest TEXT
+);
+CREATE TABLE IF NOT EXISTS sections (
+    image_id INTEGER NOT NULL,
+    file_index INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT
+);
+CREATE TABLE IF NOT EXISTS build_paths (
+    image_id INTEGER NOT NULL,
+    file_index INTEGER NOT NULL,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_build_id ON images (build_id);
+CREATE INDEX IF NOT EXISTS files_image ON files (image_id, file_index);
+CREATE INDEX IF NOT EXISTS files_guid ON files (guid);
+CREATE INDEX IF NOT EXISTS files_name ON files (name);
+CREATE INDEX IF NOT EXISTS files_module ON files (module);
+CREATE INDEX IF NOT EXISTS sections_image ON sections (image_id);
+CREATE INDEX IF NOT EXISTS sections_digest ON sections (digest);
+CREATE INDEX IF NOT EXISTS build_paths_image ON build_paths (image_id);
+CREATE INDEX IF NOT EXISTS build_paths_path ON build_paths (path);
+"""
+
+# Columns of a match, joined from the file and its image
+_MATCH_COLUMNS = "images.path, images.build_id, files.guid, files.type, files.name, files.module"
+_FILE_JOIN = "files JOIN images ON images.id = files.image_id"
+
+
+class CorpusMatch:
+    """A file of an indexed image matching a corpus query."""
+    def __init__(self, row: tuple):
+        path, build_id, guid, file_type, name, module = row[:6]
+        self.path: str = path
+        self.build_id: str = build_id
+        self.guid = intern_guid(guid)
+        self.type: str = file_type
+        self.name: Optional[str] = name
+        self.module: Optional[str] = module
+        # Type of the matching section, for digest queries
+        self.section_type: Optional[str] = row[6] if len(row) > 6 else None
+
+
+class CorpusUpdate:
+    """Outcome of Corpus.update."""
+    def __init__(self):
+        self.indexed: List[str] = []
+        self.unchanged: List[str] = []
+        self.removed: List[str] = []
+        # (path, error message) of images that could not be parsed
+        self.failed: List[Tuple[str, str]] = []
+
+
+def _index_image(path: str, hash_algorithm: str) -> tuple:
+    """Parse one image; runs in a worker process and returns only plain rows."""
+    from .uefi import UEFI
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        uefi = UEFI(f.read(), verbose=False, hash_algorithm=hash_algorithm)
+
+    files = []
+    sections = []
+    build_paths = []
+    for file_index, efi in enumerate(uefi.efis):
+        names = [s.name for s in efi.section_elements if s.type == 'UI']
+        try:
+            module = uefi._module_path(efi)
+        except ValueError:
+            module = None
+        files.append((file_index, efi.guid.raw, efi.type, names[0] if names else None, module, efi.digest))
+        seen = set()
+        for section in efi.section_elements:
+            sections.append((file_index, section.type, len(section.decompressed_image), section.digest))
+            if section.type == 'PE32':
+                for build_path in uefi._try_get_file_path(section.decompressed_image):
+                    if build_path not in seen:
+                        seen.add(build_path)
+                        build_paths.append((file_index, build_path))
+    return path, stat.st_size, stat.st_mtime_ns, uefi.build_id, files, sections, build_paths
+
+
+class Corpus:
+    """Persistent, incrementally updated index over many UEFI images."""
+
+    def __init__(self, path: str, hash_algorithm: Optional[str] = None):
+        """Open or create the corpus at path.
+
+        Digests made with different algorithms cannot be compared, so the
+        hash_algorithm (a hashlib name) is recorded in the corpus. None uses
+        the recorded one, or DEFAULT_HASH_ALGORITHM for a new corpus; any
+        other algorithm than the recorded one raises ValueError.
+        """
+        import sqlite3
+        self.path = path
+        self._db = sqlite3.connect(path)
+        try:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            version = self._db.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, CORPUS_VERSION):
+                raise ValueError(f"Unsupported corpus version {version}")
+            self._db.executescript(SCHEMA)
+            self._db.execute(f"PRAGMA user_version={CORPUS_VERSION}")
+            self.hash_algorithm = self._hash_algorithm(hash_algorithm)
+        except BaseException:
+            self._db.close()
+            raise
+
+    def _hash_algorithm(self, requested: Optional[str]) -> str:
+        """Return the recorded hash algorithm, recording requested if there is none yet."""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'hash_algorithm'").fetchone()
+        if row is not None:
+            if requested is not None and requested.lower() != row[0]:
+                raise ValueError(f"Corpus {self.path} holds {row[0]} digests, not {requested}")
+            return row[0]
+        # New corpus, or one written before the algorithm was recorded
+        import hashlib
+        algorithm = (requested or DEFAULT_HASH_ALGORITHM).lower()
+        hashlib.new(algorithm)
+        with self._db:
+            self._db.execute("INSERT INTO meta (key, value) VALUES ('hash_algorithm', ?)", (algorithm,))
+        return algorithm
+
+    def close(self) -> None:
+        """Close the database."""
+        self._db.close()
+
+    def __enter__(self) -> 'Corpus':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+    def __contains__(self, path: str) -> bool:
+        return self._image_id(os.path.abspath(path)) is not None
+
+    def _image_id(self, path: str) -> Optional[int]:
+        row = self._db.execute("SELECT id FROM images WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def _is_current(self, path: str) -> bool:
+        row = self._db.execute("SELECT size, mtime_ns FROM images WHERE path = ?", (path,)).fetchone()
+        if row is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return row == (stat.st_size, stat.st_mtime_ns)
+
+    def _delete(self, image_id: int) -> None:
+        for table in ('files', 'sections', 'build_paths'):
+            self._db.execute(f"DELETE FROM {table} WHERE image_id = ?", (image_id,))
+        self._db.execute("DELETE FROM images WHERE id = ?", (image_id,))
+
+    def _store(self, result: tuple) -> None:
+        path, size, mtime_ns, build_id, files, sections, build_paths = result
+        with self._db:
+            image_id = self._image_id(path)
+            if image_id is not None:
+                self._delete(image_id)
+            image_id = self._db.execute("INSERT INTO images (path, size, mtime_ns, build_id) VALUES (?, ?, ?, ?)",
+                                        (path, size, mtime_ns, build_id)).lastrowid
+            self._db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                 [(image_id,) + row for row in files])
+            self._db.executemany("INSERT INTO sections VALUES (?, ?, ?, ?, ?)",
+                                 [(image_id,) + row for row in sections])
+            self._db.executemany("INSERT INTO build_paths VALUES (?, ?, ?)",
+                                 [(image_id,) + row for row in build_paths])
+
+    def update(self, paths: Iterable[str], executor: Optional['Executor'] = None,
+               prune: bool = False) -> CorpusUpdate:
+        """Index new and changed images among paths.
+
+        Images are parsed in executor, a process pool if None. With prune,
+        indexed images that are not in paths are removed from the corpus.
+        """
+        result = CorpusUpdate()
+        paths = [os.path.abspath(p) for p in paths]
+        pending = []
+        for path in paths:
+            if self._is_current(path):
+                result.unchanged.append(path)
+            else:
+                pending.append(path)
+
+        if pending:
+            own_executor = executor is None
+            if own_executor:
+                from concurrent.futures import ProcessPoolExecutor
+                executor = ProcessPoolExecutor()
+            try:
+                futures = [(path, executor.submit(_index_image, path, self.hash_algorithm)) for path in pending]
+                for path, future in futures:
+                    try:
+                        self._store(future.result())
+                    except Exception as e:
+                        result.failed.append((path, str(e)))
+                    else:
+                        result.indexed.append(path)
+            finally:
+                if own_executor:
+                    executor.shutdown()
+
+        if prune:
+            keep = set(paths)
+            for image_id, path in self._db.execute("SELECT id, path FROM images").fetchall():
+                if path not in keep:
+                    with self._db:
+                        self._delete(image_id)
+                    result.removed.append(path)
+        return result
+
+    def remove(self, path: str) -> bool:
+        """Remove an image from the corpus; return False if it was not indexed."""
+        image_id = self._image_id(os.path.abspath(path))
+        if image_id is None:
+            return False
+        with self._db:
+            self._delete(image_id)
+        return True
+
+    def images(self) -> List[Tuple[str, str]]:
+        """Return (path, build ID) of every indexed image."""
+        return self._db.execute("SELECT path, build_id FROM images ORDER BY path").fetchall()
+
+    def build_ids(self) -> List[str]:
+        """Return the distinct build IDs in the corpus."""
+        return [row[0] for row in self._db.execute("SELECT DISTINCT build_id FROM images ORDER BY build_id")]
+
+    def by_build_id(self, build_id: str) -> List[str]:
+        """Return the paths of the images with the given build ID."""
+        return [row[0] for row in self._db.execute("SELECT path FROM images WHERE build_id = ? ORDER BY path",
+                                                   (build_id,))]
+
+    def _matches(self, query: str, parameters: tuple) -> List[CorpusMatch]:
+        return [CorpusMatch(row) for row in self._db.execute(query, parameters)]
+
+    def find_guid(self, guid: GuidLike) -> List[CorpusMatch]:
+        """Return the files with the given GUID across the corpus."""
+        return self._matches(f"SELECT {_MATCH_COLUMNS} FROM {_FILE_JOIN} WHERE files.guid = ? "
+                             "ORDER BY images.path, files.file_index", (to_guid(guid).bytes_le,))
+
+    def find_name(self, pattern: str) -> List[CorpusMatch]:
+        """Return the files whose UI name matches a case-sensitive glob pattern, such as 'Usb*Dxe'.
+
+        Served by an index unless the pattern starts with a wildcard.
+        """
+        return self._matches(f"SELECT {_MATCH_COLUMNS} FROM {_FILE_JOIN} WHERE files.name GLOB ? "
+                             "ORDER BY images.path, files.file_index", (pattern,))
+
+    def find_module(self, pattern: str) -> List[CorpusMatch]:
+        """Return the files whose .inf path or embedded build path matches a glob pattern.
+
+        Served by indexes unless the pattern starts with a wildcard.
+        """
+        # A UNION of two indexed lookups; an OR across both tables would scan every file
+        return self._matches(
+            f"SELECT {_MATCH_COLUMNS} FROM {_FILE_JOIN} WHERE files.rowid IN ("
+            "SELECT rowid FROM files WHERE module GLOB ? UNION "
+            "SELECT files.rowid FROM build_paths JOIN files ON files.image_id = build_paths.image_id "
+            "AND files.file_index = build_paths.file_index WHERE build_paths.path GLOB ?) "
+            "ORDER BY images.path, files.file_index", (pattern, pattern))
+
+    def find_digest(self, digest: str, section_type: Optional[str] = None) -> List[CorpusMatch]:
+        """Return the files holding a section with the given digest, optionally of one section type."""
+        query = (f"SELECT {_MATCH_COLUMNS}, sections.type FROM sections "
+                 "JOIN files ON files.image_id = sections.image_id AND files.file_index = sections.file_index "
+                 "JOIN images ON images.id = sections.image_id WHERE sections.digest = ?")
+        parameters: tuple = (digest.lower(),)
+        if section_type is not None:
+            query += " AND sections.type = ?"
+            parameters += (section_type,)
+        return self._matches(query + " ORDER BY images.path, files.file_index", parameters)
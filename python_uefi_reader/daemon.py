@@ -0,0 +1,538 @@
+"""
+Long-running daemon that keeps recently parsed images warm.
+
+The daemon listens on a Unix socket (or a localhost TCP port) and answers
+probe, inventory, extract and section requests from an LRU cache of parsed
+UEFI objects, keyed by path, size and modification time, or by content hash.
+Repeated requests against the same image skip both interpreter startup and
+parsing.
+
+Requests read and write files as the user running the daemon, so only that
+user may reach it: the Unix socket is created with mode 0600 (clients
+refuse a socket another user owns or others can use), and a TCP daemon
+writes a random token to a file only its user can read (see
+default_token_path), which every TCP request must carry.
+
+Each request is one JSON line; each response is one JSON line with "ok" and
+"length", followed by length bytes of payload (inventory text or a section
+payload). A connection may carry several requests. A request's optional
+"timeout" (seconds) stops its parse and extraction once passed, without
+affecting the daemon or its cache.
+
+    python -m python_uefi_reader.daemon serve [--socket PATH | --port N]
+    python -m python_uefi_reader.daemon inventory IMAGE [OUTPUT]
+    python -m python_uefi_reader.daemon section IMAGE GUID [TYPE] [OUTPUT]
+    python -m python_uefi_reader.daemon extract IMAGE OUTPUT [--archive FORMAT]
+"""
+
+import argparse
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from .uefi import UEFI
+
+CACHE_KEYS = ('mtime', 'hash')
+
+# Bytes of parsed images (see UEFI.resident_bytes) the cache keeps by default
+DEFAULT_CACHE_BYTES = 1024 * 1024 * 1024
+
+Address = Union[str, Tuple[str, int]]
+
+
+def _user() -> str:
+    return str(os.getuid()) if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'default')
+
+
+def default_socket_path() -> str:
+    """Default Unix socket path: UEFIREADER_SOCKET, else one per user in the temp directory."""
+    return os.environ.get('UEFIREADER_SOCKET', os.path.join(tempfile.gettempdir(), f"uefireader-{_user()}.sock"))
+
+
+def default_token_path(port: int) -> str:
+    """Default token file of a TCP daemon: one per user and port in the temp directory."""
+    return os.path.join(tempfile.gettempdir(), f"uefireader-{_user()}-{port}.token")
+
+
+def write_token(path: str) -> str:
+    """Write a new random token to path, readable by the current user only, and return it."""
+    import secrets
+    token = secrets.token_hex(32)
+    if os.path.lexists(path):
+        os.unlink(path)
+    # O_EXCL refuses a file or symlink planted after the unlink
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token
+
+
+def check_socket(path: str) -> None:
+    """Check that a daemon socket belongs to the current user and only they can use it.
+
+    Raises ValueError otherwise, so a client never talks to a socket planted
+    by someone else, e.g. in a shared temp directory.
+    """
+    import stat
+    info = os.stat(path)
+    if not stat.S_ISSOCK(info.st_mode):
+        raise ValueError(f"{path} is not a socket")
+    if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o077):
+        raise ValueError(f"Socket {path} must be private to the current user")
+
+
+def read_token(path: str) -> str:
+    """Read the token of a TCP daemon.
+
+    Raises ValueError if the file belongs to another user or others can
+    access it, so a client never trusts a token planted by someone else.
+    """
+    with open(path) as f:
+        if hasattr(os, 'getuid'):
+            info = os.fstat(f.fileno())
+            if info.st_uid != os.getuid() or info.st_mode & 0o077:
+                raise ValueError(f"Token file {path} must be private to the current user")
+        return f.read().strip()
+
+
+class ImageCache:
+    """LRU cache of parsed images.
+
+    With key 'mtime' an entry is reused while the file keeps its path, size
+    and modification time; with key 'hash' entries are keyed by a SHA-256 of
+    the contents, so copies of an image share one entry.
+
+    At most capacity images are kept, holding at most max_bytes together as
+    measured by UEFI.resident_bytes when they are cached. An image larger
+    than max_bytes on its own is returned without being cached.
+    """
+    def __init__(self, capacity: int = 8, key: str = 'mtime', max_bytes: Optional[int] = DEFAULT_CACHE_BYTES):
+        if key not in CACHE_KEYS:
+            raise ValueError(f"Unsupported cache key: {key}")
+        if capacity < 1:
+            raise ValueError("Cache capacity must be at least 1")
+        if max_bytes is not None and max_bytes < 0:
+            raise ValueError("Cache size in bytes must not be negative")
+        self.capacity = capacity
+        self.key = key
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[object, Tuple[UEFI, int]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, path: str, timeout: Optional[float] = None) -> 'UEFI':
+        """Return the parsed image at path, parsing it if not cached or changed.
+
+        A parse running past timeout seconds raises DeadlineExceeded and
+        caches nothing.
+        """
+        path = os.path.abspath(path)
+        data = None
+        if self.key == 'mtime':
+            stat = os.stat(path)
+            key = (path, stat.st_size, stat.st_mtime_ns)
+        else:
+            import hashlib
+            with open(path, 'rb') as f:
+                data = f.read()
+            key = hashlib.sha256(data).digest()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Parse outside the lock so requests for other images are not held up
+        from .uefi import UEFI
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        uefi = UEFI(data, verbose=False, timeout=timeout)
+        size = uefi.resident_bytes
+
+        with self._lock:
+            if self.key == 'mtime':
+                # Drop entries of earlier versions of the same file
+                for stale in [k for k in self._entries if k[0] == path]:
+                    self._remove(stale)
+            if key in self._entries:
+                self._remove(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return uefi
+            self._entries[key] = (uefi, size)
+            self.bytes += size
+            while len(self._entries) > self.capacity or (self.max_bytes is not None and self.bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+        return uefi
+
+    def _remove(self, key) -> None:
+        _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def clear(self) -> None:
+        """Drop every cached image."""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+class Daemon:
+    """Answers requests against an ImageCache; see serve for the transport."""
+
+    def __init__(self, cache: Optional[ImageCache] = None):
+        self.cache = cache if cache is not None else ImageCache()
+
+    def handle(self, request: dict) -> Tuple[dict, bytes]:
+        """Answer one request, returning the response header and payload."""
+        command = request.get('command')
+        deadline = time.monotonic() + request['timeout'] if request.get('timeout') is not None else None
+        if command == 'probe':
+            from .probe import probe
+            result = probe(request['image'])
+            return {'build_id': result.build_id, 'image_size': result.image_size,
+                    'volumes': result.volumes, 'file_count': result.file_count,
+                    'compressed_sections': result.compressed_sections}, b''
+        if command == 'inventory':
+            text = io.StringIO()
+            self.cache.get(request['image'], _remaining(deadline)).write_inventory_to(text)
+            return {}, text.getvalue().encode('utf-8')
+        if command == 'section':
+            uefi = self.cache.get(request['image'], _remaining(deadline))
+            section = uefi.index.section(request['guid'], request.get('type', 'PE32'))
+            if section is None:
+                raise ValueError(f"No {request.get('type', 'PE32')} section in file {request['guid']}")
+            return {'offset': section.offset, 'size': section.size}, bytes(section.decompressed_image)
+        if command == 'extract':
+            return self._extract(request, deadline), b''
+        if command == 'stats':
+            return {'cached': len(self.cache), 'capacity': self.cache.capacity,
+                    'bytes': self.cache.bytes, 'max_bytes': self.cache.max_bytes,
+                    'hits': self.cache.hits, 'misses': self.cache.misses}, b''
+        if command == 'shutdown':
+            return {}, b''
+        raise ValueError(f"Unknown command: {command}")
+
+    def _extract(self, request: dict, deadline: Optional[float]) -> dict:
+        from .__main__ import extract_parsed_image
+        from .blob_store import BlobStore
+        uefi = self.cache.get(request['image'], _remaining(deadline))
+        timestamp = None
+        if request.get('timestamp') is not None:
+            from .__main__ import epoch_timestamp
+            timestamp = epoch_timestamp(request['timestamp'])
+        store = BlobStore(request['store'], request.get('link', 'hardlink')) if request.get('store') else None
+        extract_parsed_image(uefi, request['output'], store, request.get('archive'), timestamp,
+                             request.get('manifests', ()), _remaining(deadline))
+        return {'build_id': uefi.build_id}
+
+
+def _remaining(deadline: Optional[float]) -> Optional[float]:
+    """Seconds left until deadline, or None without one."""
+    return max(deadline - time.monotonic(), 0.0) if deadline is not None else None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            command = None
+            authorized = True
+            try:
+                request = json.loads(line)
+                authorized = self._authorized(request)
+                if not authorized:
+                    raise PermissionError("Missing or invalid token")
+                command = request.get('command')
+                header, payload = self.server.daemon.handle(request)
+                header['ok'] = True
+            except Exception as e:
+                header, payload = {'ok': False, 'error': f"{type(e).__name__}: {e}"}, b''
+            header['length'] = len(payload)
+            try:
+                self.wfile.write(json.dumps(header).encode('utf-8') + b'\n' + payload)
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client went away
+                return
+            if command == 'shutdown':
+                threading.Thread(target=self.server.shutdown).start()
+                return
+            if not authorized:
+                return
+
+    def _authorized(self, request) -> bool:
+        if self.server.token is None:
+            return True
+        import hmac
+        token = request.get('token') if isinstance(request, dict) else None
+        return isinstance(token, str) and hmac.compare_digest(token, self.server.token)
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    token = None
+
+    def server_bind(self):
+        # Only the daemon's user may connect. Nobody can connect before
+        # server_activate listens, so restricting the mode after binding
+        # leaves no window, and the process umask is left alone.
+        super().server_bind()
+        os.chmod(self.server_address, 0o600)
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    token = None
+
+
+def _remove_stale_socket(path: str) -> None:
+    """Remove a socket left behind by a daemon that is gone.
+
+    Raises ValueError if a daemon still answers on path, or if path is not
+    a socket.
+    """
+    import stat
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(info.st_mode):
+        raise ValueError(f"{path} exists and is not a socket")
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise ValueError(f"A daemon is already listening on {path}")
+
+
+def serve(address: Address, daemon: Optional[Daemon] = None, ready: Optional[threading.Event] = None,
+          token_path: Optional[str] = None):
+    """Serve requests on a Unix socket path or a (host, port) address until shut down.
+
+    A TCP daemon writes its token to token_path (default_token_path of its
+    port if None) and removes it on exit. Raises ValueError if another
+    daemon is already serving address.
+    """
+    if isinstance(address, str):
+        _remove_stale_socket(address)
+        server = _UnixServer(address, _RequestHandler)
+    else:
+        server = _TCPServer(address, _RequestHandler)
+        if token_path is None:
+            token_path = default_token_path(server.server_address[1])
+        try:
+            server.token = write_token(token_path)
+        except BaseException:
+            server.server_close()
+            raise
+    server.daemon = daemon if daemon is not None else Daemon()
+    try:
+        if ready is not None:
+            ready.set()
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if isinstance(address, str):
+            if os.path.exists(address):
+                os.unlink(address)
+        elif os.path.exists(token_path):
+            os.unlink(token_path)
+
+
+class DaemonClient:
+    """Thin client for a running daemon.
+
+    For a TCP daemon the token is read from token_path (default_token_path
+    of its port if None).
+    """
+
+    def __init__(self, address: Optional[Address] = None, token_path: Optional[str] = None):
+        address = address if address is not None else default_socket_path()
+        self._token = None
+        if isinstance(address, str):
+            check_socket(address)
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._token = read_token(token_path if token_path is not None else default_token_path(address[1]))
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.connect(address)
+        self._file = self._socket.makefile('rwb')
+
+    def close(self) -> None:
+        """Close the connection."""
+        self._file.close()
+        self._socket.close()
+
+    def __enter__(self) -> 'DaemonClient':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def request(self, command: str, **arguments) -> Tuple[dict, bytes]:
+        """Send one request and return the response header and payload.
+
+        Raises ValueError with the daemon's message if the request failed.
+        """
+        arguments['command'] = command
+        if self._token is not None:
+            arguments['token'] = self._token
+        self._file.write(json.dumps(arguments).encode('utf-8') + b'\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ValueError("Daemon closed the connection")
+        header = json.loads(line)
+        length = header.pop('length')
+        payload = self._file.read(length) if length else b''
+        if not header.pop('ok'):
+            raise ValueError(header['error'])
+        return header, payload
+
+    def probe(self, image: str) -> dict:
+        """Return the probe summary of an image."""
+        return self.request('probe', image=os.path.abspath(image))[0]
+
+    def inventory(self, image: str, timeout: Optional[float] = None) -> str:
+        """Return the NDJSON inventory of an image."""
+        return self.request('inventory', image=os.path.abspath(image), timeout=timeout)[1].decode('utf-8')
+
+    def section(self, image: str, guid: str, section_type: str = 'PE32', timeout: Optional[float] = None) -> bytes:
+        """Return the payload of the first section of a type in the file with a GUID."""
+        return self.request('section', image=os.path.abspath(image), guid=str(guid), type=section_type,
+                            timeout=timeout)[1]
+
+    def extract(self, image: str, output: str, archive: Optional[str] = None, timestamp: Optional[int] = None,
+                manifests=(), store: Optional[str] = None, link: str = 'hardlink',
+                timeout: Optional[float] = None) -> str:
+        """Extract an image as the CLI does and return its build ID."""
+        header, _ = self.request('extract', image=os.path.abspath(image), output=os.path.abspath(output),
+                                 archive=archive, timestamp=timestamp, manifests=list(manifests),
+                                 store=os.path.abspath(store) if store else None, link=link, timeout=timeout)
+        return header['build_id']
+
+    def stats(self) -> dict:
+        """Return cache statistics."""
+        return self.request('stats')[0]
+
+    def shutdown(self) -> None:
+        """Stop the daemon."""
+        self.request('shutdown')
+
+
+def _address(args) -> Address:
+    return ('127.0.0.1', args.port) if args.port else args.socket
+
+
+def _write_output(data: bytes, output: Optional[str]):
+    if output is None or output == '-':
+        sys.stdout.buffer.write(data)
+        sys.stdout.flush()
+    else:
+        with open(output, 'wb') as f:
+            f.write(data)
+
+
+def main():
+    """Daemon and client entry point."""
+    from .__main__ import parse_timestamp, source_date_epoch
+    parser = argparse.ArgumentParser(prog='python -m python_uefi_reader.daemon',
+                                     description="Serve parsed UEFI images from a warm cache.")
+    parser.add_argument('--socket', default=default_socket_path(),
+                        help="Unix socket path (default: UEFIREADER_SOCKET or a per-user socket in the temp directory)")
+    parser.add_argument('--port', type=int, help="use a localhost TCP port instead of a Unix socket")
+    parser.add_argument('--token-file', help="token file of a TCP daemon (default: a per-user file "
+                                             "in the temp directory)")
+    parser.add_argument('--timeout', type=float, help="seconds the daemon may spend on a request")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    serve_parser = commands.add_parser('serve', help="run the daemon")
+    serve_parser.add_argument('--cache-size', type=int, default=8, help="images kept parsed (default: 8)")
+    serve_parser.add_argument('--cache-memory', metavar='MIB', type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                              help="MiB of parsed images kept (default: %(default)s)")
+    serve_parser.add_argument('--cache-key', choices=CACHE_KEYS, default='mtime',
+                              help="reuse parses by path and mtime, or by content hash (default: mtime)")
+
+    probe_parser = commands.add_parser('probe', help="print the probe summary of an image")
+    probe_parser.add_argument('image')
+
+    inventory_parser = commands.add_parser('inventory', help="write the NDJSON inventory of an image")
+    inventory_parser.add_argument('image')
+    inventory_parser.add_argument('output', nargs='?', help="output file (default: stdout)")
+
+    section_parser = commands.add_parser('section', help="write a section payload")
+    section_parser.add_argument('image')
+    section_parser.add_argument('guid')
+    section_parser.add_argument('type', nargs='?', default='PE32', help="section type (default: PE32)")
+    section_parser.add_argument('output', nargs='?', help="output file (default: stdout)")
+
+    extract_parser = commands.add_parser('extract', help="extract an image as the CLI does")
+    extract_parser.add_argument('image')
+    extract_parser.add_argument('output')
+    extract_parser.add_argument('--archive')
+    extract_parser.add_argument('--store')
+    extract_parser.add_argument('--link', default='hardlink')
+    extract_parser.add_argument('--timestamp', type=parse_timestamp)
+    extract_parser.add_argument('--manifest', action='append', default=[])
+
+    commands.add_parser('stats', help="print cache statistics")
+    commands.add_parser('stop', help="stop the daemon")
+
+    args = parser.parse_args()
+    if args.command == 'extract' and args.timestamp is None:
+        args.timestamp = source_date_epoch(parser)
+
+    if args.command == 'serve':
+        try:
+            cache = ImageCache(args.cache_size, args.cache_key, args.cache_memory * 1024 * 1024)
+            serve(_address(args), Daemon(cache), token_path=args.token_file)
+        except (OSError, ValueError) as e:
+            parser.exit(1, f"{e}\n")
+        return
+
+    try:
+        with DaemonClient(_address(args), args.token_file) as client:
+            if args.command == 'probe':
+                print(json.dumps(client.probe(args.image), indent=2))
+            elif args.command == 'inventory':
+                _write_output(client.inventory(args.image, args.timeout).encode('utf-8'), args.output)
+            elif args.command == 'section':
+                _write_output(client.section(args.image, args.guid, args.type, args.timeout), args.output)
+            elif args.command == 'extract':
+                timestamp = int(args.timestamp.timestamp()) if args.timestamp is not None else None
+                client.extract(args.image, args.output, args.archive, timestamp, args.manifest,
+                               args.store, args.link, args.timeout)
+            elif args.command == 'stats':
+                print(json.dumps(client.stats(), indent=2))
+            else:
+                client.shutdown()
+    except OSError as e:
+        parser.exit(1, f"Cannot reach the daemon: {e}\n")
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,335 @@
+"""
+DXE dependency expressions and the driver dependency graph.
+
+decode turns a DXE_DEPEX section payload into a DepexExpression, compiled
+once into the set of protocols it requires (the usual PUSH/AND-only case)
+or into an evaluator for the general case. DependencyGraph is built once
+per image from the expressions of all drivers and the APRIORI order, with a
+reverse index from protocol GUIDs to the drivers that reference them, so
+satisfiability, dispatch order and dependents queries never decode or walk
+an expression again.
+"""
+
+import heapq
+from typing import Callable, Dict, FrozenSet, Iterable, List, Mapping, Optional, Tuple
+
+from .guids import GUID, intern_guid
+from .index import GuidLike, to_guid
+
+BEFORE = 0x00
+AFTER = 0x01
+PUSH = 0x02
+AND = 0x03
+OR = 0x04
+NOT = 0x05
+TRUE = 0x06
+FALSE = 0x07
+END = 0x08
+SOR = 0x09
+
+OPCODE_NAMES = {
+    BEFORE: 'BEFORE', AFTER: 'AFTER', PUSH: 'PUSH', AND: 'AND', OR: 'OR',
+    NOT: 'NOT', TRUE: 'TRUE', FALSE: 'FALSE', END: 'END', SOR: 'SOR',
+}
+
+# Opcodes followed by a GUID operand
+_GUID_OPCODES = (BEFORE, AFTER, PUSH)
+
+# Nesting allowed in an expression; real ones are a few levels deep
+MAX_DEPTH = 256
+
+
+class DepexExpression:
+    """A decoded dependency expression.
+
+    instructions holds (opcode name, GUID operand or None) in payload order.
+    before/after name the driver this one is scheduled around, and
+    schedule_on_request is set for SOR expressions. protocols holds every
+    PUSHed GUID.
+    """
+    def __init__(self):
+        self.instructions: List[Tuple[str, Optional[GUID]]] = []
+        self.before: Optional[GUID] = None
+        self.after: Optional[GUID] = None
+        self.schedule_on_request: bool = False
+        self.protocols: FrozenSet[GUID] = frozenset()
+        # Protocols that must all be installed, when the expression is a plain conjunction
+        self.required: Optional[FrozenSet[GUID]] = None
+        self._evaluate: Callable[[Iterable], bool] = _constant(True)
+        self._text: str = 'TRUE'
+
+    def evaluate(self, installed) -> bool:
+        """Evaluate against a set of installed protocol GUIDs."""
+        if self.required is not None:
+            return self.required.issubset(installed)
+        return self._evaluate(installed)
+
+    def __str__(self) -> str:
+        return self._text
+
+
+def _constant(value: bool) -> Callable:
+    return lambda installed: value
+
+
+def _name(guid: GUID) -> str:
+    return guid.name or str(guid)
+
+
+# An operand stack entry while decoding: (evaluator, text, required protocols or None, depth)
+_Operand = Tuple[Callable, str, Optional[FrozenSet[GUID]], int]
+
+
+def _push(guid: GUID) -> _Operand:
+    return (lambda installed: guid in installed), _name(guid), frozenset((guid,)), 1
+
+
+def _not(operand: _Operand) -> _Operand:
+    evaluate, text, _, depth = operand
+    return (lambda installed: not evaluate(installed)), f"NOT {text}", None, depth + 1
+
+
+def _binary(opcode: int, left: _Operand, right: _Operand) -> _Operand:
+    left_evaluate, left_text, left_required, left_depth = left
+    right_evaluate, right_text, right_required, right_depth = right
+    depth = max(left_depth, right_depth) + 1
+    if opcode == AND:
+        required = left_required | right_required if left_required is not None and right_required is not None else None
+        return ((lambda installed: left_evaluate(installed) and right_evaluate(installed)),
+                f"({left_text} AND {right_text})", required, depth)
+    return ((lambda installed: left_evaluate(installed) or right_evaluate(installed)),
+            f"({left_text} OR {right_text})", None, depth)
+
+
+def decode(data) -> DepexExpression:
+    """Decode a DXE_DEPEX section payload.
+
+    Each opcode is compiled as it is read, on the operand stack, so no
+    expression tree is walked recursively. Raises ValueError for unknown
+    opcodes, truncated operands, expressions nested deeper than MAX_DEPTH
+    and expressions that do not reduce to a single value at END.
+    """
+    expression = DepexExpression()
+    stack = []
+    protocols = set()
+    offset = 0
+    while True:
+        if offset >= len(data):
+            raise ValueError("Dependency expression has no END opcode")
+        opcode = data[offset]
+        if opcode not in OPCODE_NAMES:
+            raise ValueError(f"Unknown dependency expression opcode 0x{opcode:02X} at 0x{offset:X}")
+        guid = None
+        if opcode in _GUID_OPCODES:
+            if offset + 17 > len(data):
+                raise ValueError(f"Truncated GUID operand at 0x{offset + 1:X}")
+            guid = intern_guid(bytes(data[offset + 1:offset + 17]))
+        expression.instructions.append((OPCODE_NAMES[opcode], guid))
+        offset += 17 if guid is not None else 1
+
+        if opcode == END:
+            break
+        if opcode in (BEFORE, AFTER):
+            if offset >= len(data) or data[offset] != END or expression.instructions[:-1]:
+                raise ValueError(f"{OPCODE_NAMES[opcode]} must be the only opcode before END")
+            if opcode == BEFORE:
+                expression.before = guid
+            else:
+                expression.after = guid
+        elif opcode == SOR:
+            if len(expression.instructions) != 1:
+                raise ValueError("SOR must be the first opcode")
+            expression.schedule_on_request = True
+        elif opcode == PUSH:
+            protocols.add(guid)
+            stack.append(_push(guid))
+        elif opcode == TRUE:
+            stack.append((_constant(True), 'TRUE', frozenset(), 1))
+        elif opcode == FALSE:
+            stack.append((_constant(False), 'FALSE', None, 1))
+        else:
+            if opcode == NOT:
+                if not stack:
+                    raise ValueError(f"Stack underflow at 0x{offset - 1:X}")
+                stack.append(_not(stack.pop()))
+            else:
+                if len(stack) < 2:
+                    raise ValueError(f"Stack underflow at 0x{offset - 1:X}")
+                right = stack.pop()
+                stack.append(_binary(opcode, stack.pop(), right))
+            if stack[-1][3] > MAX_DEPTH:
+                raise ValueError(f"Dependency expression nested deeper than {MAX_DEPTH} levels at 0x{offset - 1:X}")
+
+    if expression.before is not None or expression.after is not None:
+        return expression
+    if len(stack) != 1:
+        raise ValueError(f"Dependency expression leaves {len(stack)} values on the stack")
+    expression.protocols = frozenset(protocols)
+    expression._evaluate, expression._text, expression.required, _ = stack[0]
+    if expression.schedule_on_request:
+        expression._text = f"SOR {expression._text}"
+    return expression
+
+
+class DriverNode:
+    """A driver in the dependency graph.
+
+    expression is None for drivers without a DXE_DEPEX section (treated as
+    always satisfiable; the architectural protocols the DXE core waits for
+    are not modeled) and for drivers whose expression failed to decode, in
+    which case error holds the reason and the driver is never satisfiable.
+    """
+    def __init__(self, guid: GUID, efi, position: int):
+        self.guid = guid
+        self.efi = efi
+        self.position = position
+        self.expression: Optional[DepexExpression] = None
+        self.error: Optional[str] = None
+        self.apriori: bool = False
+
+    def evaluate(self, installed) -> bool:
+        """True if the driver's expression is satisfied by the installed protocols."""
+        if self.error is not None:
+            return False
+        return self.expression is None or self.expression.evaluate(installed)
+
+
+class DependencyGraph:
+    """Dependency graph of the DXE drivers of an image, built once.
+
+    installed arguments are the protocol GUIDs assumed present before
+    dispatch; produces optionally maps driver GUIDs to the protocols they
+    install, which a firmware image does not record.
+    """
+    def __init__(self, efis: Iterable, apriori_order: Iterable[GUID] = ()):
+        self.drivers: Dict[GUID, DriverNode] = {}
+        self.apriori_order: List[GUID] = []
+        self._dependents: Dict[GUID, List[DriverNode]] = {}
+        self._before: Dict[GUID, List[DriverNode]] = {}
+        self._after: Dict[GUID, List[DriverNode]] = {}
+
+        for efi in efis:
+            depexes = [s for s in efi.section_elements if s.type == 'DXE_DEPEX']
+            if (efi.type != 'DRIVER' and not depexes) or efi.guid in self.drivers:
+                continue
+            node = DriverNode(efi.guid, efi, len(self.drivers))
+            self.drivers[efi.guid] = node
+            if depexes:
+                try:
+                    node.expression = decode(depexes[0].decompressed_image)
+                except ValueError as e:
+                    node.error = str(e)
+                    continue
+                for protocol in node.expression.protocols:
+                    self._dependents.setdefault(protocol, []).append(node)
+                if node.expression.before is not None:
+                    self._before.setdefault(node.expression.before, []).append(node)
+                if node.expression.after is not None:
+                    self._after.setdefault(node.expression.after, []).append(node)
+
+        for guid in apriori_order:
+            if guid in self.drivers and not self.drivers[guid].apriori:
+                self.drivers[guid].apriori = True
+                self.apriori_order.append(guid)
+
+    def __len__(self) -> int:
+        return len(self.drivers)
+
+    def __contains__(self, guid: GuidLike) -> bool:
+        return to_guid(guid) in self.drivers
+
+    def expression(self, guid: GuidLike) -> Optional[DepexExpression]:
+        """Return the decoded expression of a driver, or None."""
+        node = self.drivers.get(to_guid(guid))
+        return node.expression if node is not None else None
+
+    def dependents(self, protocol: GuidLike) -> List[GUID]:
+        """Return the drivers whose expression references protocol, in image order."""
+        return [node.guid for node in self._dependents.get(to_guid(protocol), ())]
+
+    def is_satisfiable(self, guid: GuidLike, installed: Iterable[GuidLike] = ()) -> bool:
+        """True if the driver's expression holds with the given protocols installed."""
+        return self.drivers[to_guid(guid)].evaluate(_as_set(installed))
+
+    def satisfiable(self, installed: Iterable[GuidLike] = ()) -> List[GUID]:
+        """Return the drivers whose expressions hold with the given protocols installed.
+
+        BEFORE/AFTER and SOR drivers are left out, as they are only scheduled
+        around another driver or on request.
+        """
+        installed = _as_set(installed)
+        return [node.guid for node in self.drivers.values()
+                if _is_dispatchable(node) and node.evaluate(installed)]
+
+    def missing(self, guid: GuidLike, installed: Iterable[GuidLike] = ()) -> List[GUID]:
+        """Return the protocols referenced by a driver's expression that are not installed."""
+        node = self.drivers[to_guid(guid)]
+        if node.expression is None:
+            return []
+        installed = _as_set(installed)
+        return sorted((p for p in node.expression.protocols if p not in installed), key=str)
+
+    def dispatch_order(self, installed: Iterable[GuidLike] = (),
+                       produces: Optional[Mapping[GuidLike, Iterable[GuidLike]]] = None) -> List[GUID]:
+        """Simulate the DXE dispatcher and return the drivers in dispatch order.
+
+        APRIORI drivers go first in APRIORI order. Then, pass by pass, every
+        driver whose expression holds is dispatched in image order, each
+        with its BEFORE and AFTER drivers around it; only drivers that
+        reference a protocol installed by the previous pass are evaluated
+        again. Drivers that are never satisfied are not listed.
+        """
+        installed = _as_set(installed)
+        produces = {to_guid(driver): [to_guid(p) for p in protocols] for driver, protocols in (produces or {}).items()}
+        order: List[GUID] = []
+        done = set()
+        changed = set()
+
+        def dispatch(node: DriverNode):
+            # Explicit stack of (node, visit): visit entries expand into the
+            # node's BEFORE drivers, the node itself and its AFTER drivers, so
+            # long BEFORE/AFTER chains do not recurse
+            stack = [(node, True)]
+            while stack:
+                node, visit = stack.pop()
+                if not visit:
+                    order.append(node.guid)
+                    for protocol in produces.get(node.guid, ()):
+                        if protocol not in installed:
+                            installed.add(protocol)
+                            changed.add(protocol)
+                    continue
+                if node.guid in done:
+                    continue
+                done.add(node.guid)
+                stack.extend((after, True) for after in reversed(self._after.get(node.guid, ())))
+                stack.append((node, False))
+                stack.extend((before, True) for before in reversed(self._before.get(node.guid, ())))
+
+        for guid in self.apriori_order:
+            dispatch(self.drivers[guid])
+
+        candidates = [node for node in self.drivers.values() if _is_dispatchable(node) and node.guid not in done]
+        while candidates:
+            ready = [(node.position, node) for node in candidates
+                     if node.guid not in done and node.evaluate(installed)]
+            if not ready:
+                break
+            heapq.heapify(ready)
+            changed.clear()
+            while ready:
+                dispatch(heapq.heappop(ready)[1])
+            candidates = {node.guid: node for protocol in changed for node in self._dependents.get(protocol, ())
+                          if _is_dispatchable(node) and node.guid not in done}.values()
+        return order
+
+
+def _is_dispatchable(node: DriverNode) -> bool:
+    expression = node.expression
+    return expression is None or not (expression.schedule_on_request or expression.before is not None
+                                      or expression.after is not None)
+
+
+def _as_set(installed: Iterable[GuidLike]) -> set:
+    """Copy installed into a set of GUIDs, accepting GUID strings as well."""
+    return {to_guid(guid) for guid in installed}
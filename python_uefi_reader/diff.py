@@ -0,0 +1,201 @@
+"""
+Comparison of two parsed UEFI images.
+
+Files are matched by GUID (and by occurrence, for GUIDs that repeat across
+volumes). Unchanged files are recognised from digests before any payload is
+compared; digests computed while parsing (UEFI hash_algorithm) are reused.
+With IndexFile inputs the raw, still-compressed bytes are digested
+first, so compressed sections are only decompressed for files that changed.
+"""
+
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .index_file import IndexFile
+
+
+def _digest(data: bytes, algorithm: str) -> str:
+    import hashlib
+    return hashlib.new(algorithm, data).hexdigest()
+
+
+class DiffEntry:
+    """A file taking part in a comparison."""
+    def __init__(self, guid: uuid.UUID, file_type: str, name: Optional[str],
+                 raw_key: Callable[[], Optional[tuple]], sections: Callable[[], list]):
+        self.guid = guid
+        self.type = file_type
+        self.name = name
+        self._raw_key = raw_key
+        self._sections = sections
+
+    def raw_key(self) -> Optional[tuple]:
+        """Key identifying the undecoded file bytes, or None if unknown."""
+        return self._raw_key()
+
+    def section_digests(self) -> List[Tuple[str, str]]:
+        """(type, hex digest) of each section payload, in file order."""
+        return self._sections()
+
+
+class SectionChange:
+    """A section added, removed or changed within a file."""
+    def __init__(self, section_type: str, ordinal: int, change: str):
+        self.type = section_type
+        self.ordinal = ordinal
+        self.change = change
+
+
+class FileChange:
+    """A file present in both images whose contents differ."""
+    def __init__(self, old: DiffEntry, new: DiffEntry):
+        self.guid = new.guid
+        self.name = new.name if new.name is not None else old.name
+        self.old_type = old.type
+        self.new_type = new.type
+        self.sections: List[SectionChange] = []
+
+
+class ImageDiff:
+    """Differences between two images."""
+    def __init__(self):
+        self.added: List[DiffEntry] = []
+        self.removed: List[DiffEntry] = []
+        self.changed: List[FileChange] = []
+        self.unchanged: int = 0
+        self.apriori_added: List[uuid.UUID] = []
+        self.apriori_removed: List[uuid.UUID] = []
+        # True if the drivers listed in both APRIORI files load in a different order
+        self.apriori_reordered: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed or self.apriori_added or self.apriori_removed
+                    or self.apriori_reordered)
+
+
+def _uefi_entries(uefi, algorithm: str) -> List[DiffEntry]:
+    # Digests computed while parsing are reused when they use the same algorithm
+    precomputed = uefi.hash_algorithm == algorithm
+    entries = []
+    for efi in uefi.efis:
+        uis = [s for s in efi.section_elements if s.type == 'UI']
+
+        def raw_key(efi=efi):
+            return ('file', efi.digest) if precomputed else None
+
+        def sections(efi=efi):
+            return [(s.type, s.digest if precomputed else _digest(s.decompressed_image, algorithm))
+                    for s in efi.section_elements]
+
+        entries.append(DiffEntry(efi.guid, efi.type, uis[0].name if uis else None, raw_key, sections))
+    return entries
+
+
+def _index_entries(index: IndexFile, algorithm: str) -> List[DiffEntry]:
+    entries = []
+    encapsulation_digests: Dict[int, str] = {}
+
+    for record in index.file_records():
+        def raw_key(record=record):
+            encapsulations = index.encapsulations(record)
+            if not encapsulations:
+                return ('raw', _digest(index.read_raw(record), algorithm))
+            # Identical compressed bytes decompress to identical contents, so a
+            # file is identified by its position inside the outermost one
+            outer = encapsulations[0]
+            if outer.index not in encapsulation_digests:
+                encapsulation_digests[outer.index] = _digest(index.read_raw(outer), algorithm)
+            positions = tuple((e.offset, e.size) for e in encapsulations[1:])
+            return ('encapsulated', encapsulation_digests[outer.index], positions, record.offset, record.size)
+
+        def sections(record=record):
+            return [(s.type, _digest(index.read(s), algorithm)) for s in index.sections(record)]
+
+        entries.append(DiffEntry(record.guid, record.type, record.name, raw_key, sections))
+    return entries
+
+
+def _entries(image, algorithm: str) -> List[DiffEntry]:
+    if isinstance(image, IndexFile):
+        return _index_entries(image, algorithm)
+    return _uefi_entries(image, algorithm)
+
+
+def _keyed(entries: List[DiffEntry]) -> Dict[Tuple[uuid.UUID, int], DiffEntry]:
+    """Key entries by GUID and occurrence of that GUID."""
+    keyed = {}
+    seen: Dict[uuid.UUID, int] = {}
+    for entry in entries:
+        occurrence = seen.get(entry.guid, 0)
+        seen[entry.guid] = occurrence + 1
+        keyed[(entry.guid, occurrence)] = entry
+    return keyed
+
+
+def _section_changes(old: DiffEntry, new: DiffEntry) -> List[SectionChange]:
+    def by_type(digests):
+        keyed = {}
+        counts: Dict[str, int] = {}
+        for section_type, digest in digests:
+            ordinal = counts.get(section_type, 0)
+            counts[section_type] = ordinal + 1
+            keyed[(section_type, ordinal)] = digest
+        return keyed
+
+    old_sections = by_type(old.section_digests())
+    new_sections = by_type(new.section_digests())
+    changes = []
+    for key, digest in old_sections.items():
+        if key not in new_sections:
+            changes.append(SectionChange(key[0], key[1], 'removed'))
+        elif new_sections[key] != digest:
+            changes.append(SectionChange(key[0], key[1], 'changed'))
+    for key in new_sections:
+        if key not in old_sections:
+            changes.append(SectionChange(key[0], key[1], 'added'))
+    return changes
+
+
+def diff_images(old, new) -> ImageDiff:
+    """Compare two images, each a UEFI or an IndexFile opened with its image."""
+    result = ImageDiff()
+
+    # Use the digests of a parse when both sides were hashed the same way
+    algorithm = getattr(old, 'hash_algorithm', None)
+    if algorithm is None or algorithm != getattr(new, 'hash_algorithm', None):
+        algorithm = 'sha256'
+
+    old_entries = _keyed(_entries(old, algorithm))
+    new_entries = _keyed(_entries(new, algorithm))
+
+    for key, entry in old_entries.items():
+        if key not in new_entries:
+            result.removed.append(entry)
+    for key, entry in new_entries.items():
+        if key not in old_entries:
+            result.added.append(entry)
+            continue
+
+        old_entry = old_entries[key]
+        old_key = old_entry.raw_key()
+        if old_key is not None and old_key == entry.raw_key() and old_entry.type == entry.type:
+            result.unchanged += 1
+            continue
+
+        change = FileChange(old_entry, entry)
+        change.sections = _section_changes(old_entry, entry)
+        if change.sections or old_entry.type != entry.type:
+            result.changed.append(change)
+        else:
+            result.unchanged += 1
+
+    # The APRIORI list is a load order, so it is compared as a sequence
+    old_order = old.apriori_order
+    new_order = new.apriori_order
+    old_priority = set(old_order)
+    new_priority = set(new_order)
+    result.apriori_added = sorted(new_priority - old_priority)
+    result.apriori_removed = sorted(old_priority - new_priority)
+    result.apriori_reordered = ([guid for guid in old_order if guid in new_priority]
+                                != [guid for guid in new_order if guid in old_priority])
+    return result
@@ -0,0 +1,119 @@
+"""
+ELF container front end.
+
+Qualcomm XBL images are ELF files with the UEFI firmware volume in one of
+their loadable segments. read_segments decodes the program headers, so
+volumes and the build ID are searched for within segment bounds only:
+signatures in the ELF and hash headers or in padding between segments are
+never considered, and a volume is never taken to start in one segment and
+continue into unrelated data.
+"""
+
+import struct
+from typing import List, Tuple
+
+ELF_MAGIC = b'\x7fELF'
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+PT_NULL = 0
+PT_LOAD = 1
+
+# e_phoff, e_phentsize, e_phnum
+_HEADER32 = (struct.Struct('<28xI10xHH'), struct.Struct('>28xI10xHH'))
+_HEADER64 = (struct.Struct('<32xQ14xHH'), struct.Struct('>32xQ14xHH'))
+# p_type, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz, p_flags
+_PROGRAM_HEADER32 = (struct.Struct('<IIIIIII4x'), struct.Struct('>IIIIIII4x'))
+# p_type, p_flags, p_offset, p_vaddr, p_paddr, p_filesz, p_memsz
+_PROGRAM_HEADER64 = (struct.Struct('<IIQQQQQ8x'), struct.Struct('>IIQQQQQ8x'))
+
+
+class ElfSegment:
+    """A program header of an ELF image.
+
+    end is clipped to the length of the file, so truncated dumps still yield
+    their segments.
+    """
+    def __init__(self, index: int, segment_type: int, offset: int, file_size: int,
+                 virtual_address: int, physical_address: int, flags: int, image_size: int):
+        self.index = index
+        self.type = segment_type
+        self.offset = offset
+        self.file_size = file_size
+        self.virtual_address = virtual_address
+        self.physical_address = physical_address
+        self.flags = flags
+        self.end = min(offset + file_size, image_size)
+
+    @property
+    def is_loadable(self) -> bool:
+        """True for PT_LOAD segments with data in the file."""
+        return self.type == PT_LOAD and self.end > self.offset
+
+
+def is_elf(data) -> bool:
+    """True if data starts with the ELF magic."""
+    return data[:4] == ELF_MAGIC
+
+
+def read_segments(data) -> List[ElfSegment]:
+    """Decode the program headers of an ELF image.
+
+    Raises ValueError for unknown classes or byte orders and for program
+    header tables that do not fit the file.
+    """
+    if len(data) < 0x34 or not is_elf(data):
+        raise ValueError("Not an ELF image")
+    elf_class = data[4]
+    byte_order = data[5]
+    if byte_order not in (ELFDATA2LSB, ELFDATA2MSB):
+        raise ValueError(f"Unknown ELF byte order {byte_order}")
+    big_endian = byte_order == ELFDATA2MSB
+    if elf_class == ELFCLASS32:
+        header, program_header = _HEADER32[big_endian], _PROGRAM_HEADER32[big_endian]
+    elif elf_class == ELFCLASS64:
+        header, program_header = _HEADER64[big_endian], _PROGRAM_HEADER64[big_endian]
+    else:
+        raise ValueError(f"Unknown ELF class {elf_class}")
+    if len(data) < header.size:
+        raise ValueError("Truncated ELF header")
+
+    table_offset, entry_size, count = header.unpack_from(data, 0)
+    if count and entry_size < program_header.size:
+        raise ValueError(f"Program header entry size {entry_size} is too small")
+    if table_offset + count * entry_size > len(data):
+        raise ValueError("Program header table extends beyond the end of the image")
+
+    segments = []
+    for index in range(count):
+        fields = program_header.unpack_from(data, table_offset + index * entry_size)
+        if elf_class == ELFCLASS32:
+            segment_type, offset, virtual_address, physical_address, file_size, _, flags = fields
+        else:
+            segment_type, flags, offset, virtual_address, physical_address, file_size, _ = fields
+        segments.append(ElfSegment(index, segment_type, offset, file_size,
+                                   virtual_address, physical_address, flags, len(data)))
+    return segments
+
+
+def loadable_ranges(segments: List[ElfSegment]) -> List[Tuple[int, int]]:
+    """Return the (start, end) file ranges of the loadable segments, in file order."""
+    return sorted((s.offset, s.end) for s in segments if s.is_loadable)
+
+
+def search_ranges(data) -> List[Tuple[int, int]]:
+    """Return the (start, end) ranges of data to search for volumes.
+
+    These are the loadable segments of an ELF image, or the whole of data
+    for anything else, including ELF files whose program headers cannot be
+    read.
+    """
+    if is_elf(data):
+        try:
+            return loadable_ranges(read_segments(data))
+        except ValueError:
+            pass
+    return [(0, len(data))]
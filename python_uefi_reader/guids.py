@@ -0,0 +1,111 @@
+"""
+Interned GUIDs.
+
+Every GUID read from an image goes through intern_guid, which returns one
+shared GUID object per distinct 16-byte value. GUID is a uuid.UUID, so it
+compares and hashes equal to plain uuid.UUID values, but it also keeps its
+raw (little-endian) bytes and its formatted strings, so hot paths can
+compare raw bytes and formatting is done once per distinct GUID.
+
+The intern table holds its GUIDs weakly: a GUID is shared while anything
+still refers to it and dropped with the last image that used it, so
+long-running processes do not keep every GUID they have ever read.
+"""
+
+import uuid
+import weakref
+from typing import Dict, Optional, Union
+
+
+class GUID(uuid.UUID):
+    """A uuid.UUID shared per value, keeping its raw bytes and strings."""
+
+    __slots__ = ('raw', '_text', '_upper')
+
+    def __init__(self, raw: bytes):
+        super().__init__(bytes_le=raw)
+        object.__setattr__(self, 'raw', raw)
+        object.__setattr__(self, '_text', uuid.UUID.__str__(self))
+        object.__setattr__(self, '_upper', self._text.upper())
+
+    def __str__(self) -> str:
+        return self._text
+
+    def __reduce__(self):
+        # Unpickling interns again, also in another process
+        return intern_guid, (self.raw,)
+
+    @property
+    def upper(self) -> str:
+        """The GUID as an uppercase string, as written into .inf and .inc files."""
+        return self._upper
+
+    @property
+    def name(self) -> Optional[str]:
+        """The name of a well-known GUID, or None."""
+        return WELL_KNOWN_GUIDS.get(self)
+
+
+_interned: 'weakref.WeakValueDictionary[bytes, GUID]' = weakref.WeakValueDictionary()
+
+
+def intern_guid(raw: bytes) -> GUID:
+    """Return the shared GUID for 16 raw little-endian bytes."""
+    guid = _interned.get(raw)
+    if guid is None:
+        guid = _interned.setdefault(raw, GUID(raw))
+    return guid
+
+
+def guid_from_string(text: str) -> GUID:
+    """Return the shared GUID for a GUID string."""
+    return intern_guid(uuid.UUID(text).bytes_le)
+
+
+def format_guid(guid: Union[uuid.UUID, GUID]) -> str:
+    """Return a GUID as an uppercase string, cached for interned GUIDs."""
+    return guid.upper if isinstance(guid, GUID) else str(guid).upper()
+
+
+def interned_count() -> int:
+    """Number of distinct GUIDs currently interned."""
+    return len(_interned)
+
+
+# Firmware file systems
+EFI_FIRMWARE_FILE_SYSTEM_GUID = guid_from_string('7a9354d9-0468-444a-81ce-0bf617d890df')
+EFI_FIRMWARE_FILE_SYSTEM2_GUID = guid_from_string('8c8ce578-8a3d-4f1c-9935-896185c32dd3')
+EFI_FIRMWARE_FILE_SYSTEM3_GUID = guid_from_string('5473c07a-3dcb-4dca-bd6f-1e9689e7349a')
+
+# Special files
+DXE_APRIORI_GUID = guid_from_string('fc510ee7-ffdc-11d4-bd41-0080c73c8881')
+PEI_APRIORI_GUID = guid_from_string('1b45cc0a-156a-428a-af62-49864da0e6e6')
+VOLUME_TOP_FILE_GUID = guid_from_string('1ba0062e-c779-4582-8566-336ae8f78f09')
+
+# GUID-defined section formats
+LZMA_CUSTOM_DECOMPRESS_GUID = guid_from_string('ee4e5898-3914-4259-9d6e-dc7bd79403cf')
+LZMA_F86_CUSTOM_DECOMPRESS_GUID = guid_from_string('d42ae6bd-1352-4bfb-909a-ca72a6eae889')
+# Also decoded as LZMA by this reader
+LZMA_ALTERNATE_DECOMPRESS_GUID = guid_from_string('bd9921ea-ed91-404a-8b2f-b4d724747c8c')
+GZIP_DECOMPRESS_GUID = guid_from_string('1d301fe9-be79-4353-91c2-d23bc959ae0c')
+TIANO_CUSTOM_DECOMPRESS_GUID = guid_from_string('a31280ad-481e-41b6-95e8-127f4c984779')
+BROTLI_CUSTOM_DECOMPRESS_GUID = guid_from_string('3d532050-5cda-4fd0-879e-0f7f630d5afb')
+CRC32_GUIDED_SECTION_GUID = guid_from_string('fc1bcdb0-7d31-49aa-936a-a4600d9dd083')
+RSA2048_SHA256_GUIDED_SECTION_GUID = guid_from_string('a7717414-c616-4977-9420-844712a735bf')
+
+WELL_KNOWN_GUIDS: Dict[uuid.UUID, str] = {
+    EFI_FIRMWARE_FILE_SYSTEM_GUID: 'EFI_FIRMWARE_FILE_SYSTEM_GUID',
+    EFI_FIRMWARE_FILE_SYSTEM2_GUID: 'EFI_FIRMWARE_FILE_SYSTEM2_GUID',
+    EFI_FIRMWARE_FILE_SYSTEM3_GUID: 'EFI_FIRMWARE_FILE_SYSTEM3_GUID',
+    DXE_APRIORI_GUID: 'DXE_APRIORI',
+    PEI_APRIORI_GUID: 'PEI_APRIORI',
+    VOLUME_TOP_FILE_GUID: 'EFI_FFS_VOLUME_TOP_FILE',
+    LZMA_CUSTOM_DECOMPRESS_GUID: 'LZMA_CUSTOM_DECOMPRESS',
+    LZMA_F86_CUSTOM_DECOMPRESS_GUID: 'LZMAF86_CUSTOM_DECOMPRESS',
+    LZMA_ALTERNATE_DECOMPRESS_GUID: 'LZMA_CUSTOM_DECOMPRESS (alternate)',
+    GZIP_DECOMPRESS_GUID: 'GZIP_DECOMPRESS',
+    TIANO_CUSTOM_DECOMPRESS_GUID: 'TIANO_CUSTOM_DECOMPRESS',
+    BROTLI_CUSTOM_DECOMPRESS_GUID: 'BROTLI_CUSTOM_DECOMPRESS',
+    CRC32_GUIDED_SECTION_GUID: 'CRC32_GUIDED_SECTION',
+    RSA2048_SHA256_GUIDED_SECTION_GUID: 'EFI_CERT_TYPE_RSA2048_SHA256',
+}
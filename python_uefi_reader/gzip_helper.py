@@ -20,19 +20,33 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
-import gzip
 import io
+from typing import Optional
 
+from .limits import DecompressionError, check_length
 
-def decompress(data: bytes, offset: int, input_size: int) -> bytes:
-    """Decompress GZip data."""
+
+def decompress(data: bytes, offset: int, input_size: int, max_length: Optional[int] = None) -> bytes:
+    """Decompress GZip data.
+    
+    With max_length, reading stops and DecompressionLimitError is raised
+    once the output would exceed max_length bytes. Corrupt or truncated
+    streams raise DecompressionError.
+    """
+    import gzip
+    import zlib
     compressed_data = data[offset:offset + input_size]
-    with gzip.GzipFile(fileobj=io.BytesIO(compressed_data)) as gz:
-        return gz.read()
+    try:
+        with gzip.GzipFile(fileobj=io.BytesIO(compressed_data)) as gz:
+            output = gz.read() if max_length is None else gz.read(max_length + 1)
+    except (zlib.error, EOFError, OSError) as e:
+        raise DecompressionError(f"Corrupt GZIP data: {e}") from e
+    return check_length(output, max_length, "GZIP")
 
 
 def compress(data: bytes, offset: int, input_size: int) -> bytes:
     """Compress data using GZip."""
+    import gzip
     input_data = data[offset:offset + input_size]
     output = io.BytesIO()
     with gzip.GzipFile(fileobj=output, mode='wb') as gz:
@@ -0,0 +1,100 @@
+"""
+Lookup index over the EFI files of a parsed UEFI image.
+"""
+
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+GuidLike = Union[uuid.UUID, str]
+
+
+def to_guid(guid: GuidLike) -> uuid.UUID:
+    """Convert a GUID or GUID string to a uuid.UUID."""
+    if isinstance(guid, uuid.UUID):
+        return guid
+    return uuid.UUID(guid)
+
+
+class UEFIIndex:
+    """Maps GUIDs, UI names and section types to parsed EFI files and sections."""
+
+    def __init__(self, efis: Iterable = ()):
+        self._by_guid: Dict[uuid.UUID, list] = {}
+        self._by_name: Dict[str, list] = {}
+        self._by_section_type: Dict[str, list] = {}
+        self._by_guid_and_type: Dict[Tuple[uuid.UUID, str], list] = {}
+        self._count = 0
+        for efi in efis:
+            self.add(efi)
+
+    def add(self, efi) -> None:
+        """Add an EFI file and its sections to the index."""
+        self._count += 1
+        self._by_guid.setdefault(efi.guid, []).append(efi)
+        for section in efi.section_elements:
+            self._by_section_type.setdefault(section.type, []).append((efi, section))
+            self._by_guid_and_type.setdefault((efi.guid, section.type), []).append(section)
+            if section.type == 'UI' and section.name is not None:
+                self._by_name.setdefault(section.name, []).append(efi)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, guid: GuidLike) -> bool:
+        return to_guid(guid) in self._by_guid
+
+    def guids(self) -> List[uuid.UUID]:
+        """Return all indexed file GUIDs in parse order."""
+        return list(self._by_guid)
+
+    def get(self, guid: GuidLike):
+        """Return the first EFI file with the given GUID, or None."""
+        files = self._by_guid.get(to_guid(guid))
+        return files[0] if files else None
+
+    def files(self, guid: GuidLike) -> list:
+        """Return every EFI file with the given GUID (GUIDs may repeat across volumes)."""
+        return list(self._by_guid.get(to_guid(guid), ()))
+
+    def sections(self, guid: GuidLike, section_type: Optional[str] = None) -> list:
+        """Return the sections of the files with the given GUID, optionally filtered by type."""
+        guid = to_guid(guid)
+        if section_type is not None:
+            return list(self._by_guid_and_type.get((guid, section_type), ()))
+        return [s for efi in self._by_guid.get(guid, ()) for s in efi.section_elements]
+
+    def section(self, guid: GuidLike, section_type: str):
+        """Return the first section of the given type in the file with the given GUID, or None."""
+        sections = self._by_guid_and_type.get((to_guid(guid), section_type))
+        return sections[0] if sections else None
+
+    def by_name(self, name: str) -> list:
+        """Return the EFI files whose UI section matches name."""
+        return list(self._by_name.get(name, ()))
+
+    def by_section_type(self, section_type: str) -> list:
+        """Return (efi, section) pairs for every section of the given type."""
+        return list(self._by_section_type.get(section_type, ()))
+
+    def names(self) -> List[str]:
+        """Return all indexed UI names."""
+        return list(self._by_name)
+
+    def image_info(self, guid: GuidLike):
+        """Return the PE/TE header metadata of the file with the given GUID, or None."""
+        guid = to_guid(guid)
+        for section_type in ('PE32', 'TE'):
+            for section in self._by_guid_and_type.get((guid, section_type), ()):
+                if section.image_info is not None:
+                    return section.image_info
+        return None
+
+    def images(self, machine: Optional[str] = None) -> list:
+        """Return (efi, section, image info) for every PE32/TE image, optionally of one machine type."""
+        result = []
+        for section_type in ('PE32', 'TE'):
+            for efi, section in self._by_section_type.get(section_type, ()):
+                info = section.image_info
+                if info is not None and (machine is None or info.machine_name == machine):
+                    result.append((efi, section, info))
+        return result
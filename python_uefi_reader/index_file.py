@@ -0,0 +1,404 @@
+"""
+Compact binary index format for parsed UEFI images.
+
+An index file stores the structure of a parsed image so it can be queried
+again without re-running the parser. Layout (little-endian):
+
+    header        HEADER struct
+    records       record_count * RECORD structs
+    guid table    file_count * GUID_ENTRY structs, sorted by GUID bytes
+    apriori table apriori_count raw GUIDs, in APRIORI load order
+    string table  NUL-terminated UTF-8 strings
+
+Every record holds a volume, encapsulation section, file or section. The
+parent of a section is its file; the parent of a file or container is its
+enclosing container. Offsets are relative to the original image, or to the
+decompressed data of the nearest encapsulation container (see
+EFIContainer.region). Payloads are read back from the original image on
+demand.
+"""
+
+import mmap
+import struct
+import uuid
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from . import gzip_helper
+from . import lzma_helper
+from . import pe
+from .guids import intern_guid
+from .index import GuidLike, to_guid
+from .limits import DEFAULT_MAX_IMAGE_SIZE, DEFAULT_MAX_SECTION_SIZE, DecompressionLimitError
+
+MAGIC = b'UEFIIDX\x00'
+VERSION = 3
+
+HEADER = struct.Struct('<8sHHIIIIIQI')
+# Sizes are 64-bit: large FFS files (FFS_ATTRIB_LARGE_FILE) can exceed 4 GiB
+RECORD = struct.Struct('<16sBBBBQQiiII')
+GUID_ENTRY = struct.Struct('<16sI')
+
+KIND_CONTAINER = 0
+KIND_FILE = 1
+KIND_SECTION = 2
+
+FLAG_APRIORI = 0x01
+
+NO_PARENT = -1
+NO_STRING = 0xFFFFFFFF
+
+TYPE_NAMES = [
+    'FV', 'LZMA', 'GZIP',
+    'RAW', 'FREEFORM', 'SECURITY_CORE', 'DXE_CORE', 'DRIVER', 'APPLICATION',
+    'PE32', 'PIC', 'TE', 'DXE_DEPEX', 'UI', 'PEI_DEPEX',
+]
+TYPE_CODES = {name: code for code, name in enumerate(TYPE_NAMES)}
+
+CODEC_NAMES = [None, 'LZMA', 'GZIP']
+CODEC_CODES = {name: code for code, name in enumerate(CODEC_NAMES)}
+
+
+class IndexRecord:
+    """One decoded record of an index file."""
+    def __init__(self, index: int, fields: tuple, strings: 'IndexFile'):
+        guid, kind, type_code, codec, flags, offset, length, parent, container, name, header_size = fields
+        self.index = index
+        self.guid: Optional[uuid.UUID] = intern_guid(guid) if kind != KIND_SECTION else None
+        self.kind = kind
+        self.type: str = TYPE_NAMES[type_code]
+        self.codec: Optional[str] = CODEC_NAMES[codec]
+        self.flags = flags
+        self.offset = offset
+        self.size = length
+        self.header_size = header_size
+        self.parent = parent
+        self.container = container
+        self.name: Optional[str] = strings.string(name)
+
+    @property
+    def in_apriori(self) -> bool:
+        """True if the file is listed in the APRIORI load list."""
+        return (self.flags & FLAG_APRIORI) != 0
+
+
+class _StringTable:
+    """Accumulates NUL-terminated strings, sharing duplicates."""
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets: Dict[str, int] = {}
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return NO_STRING
+        if value not in self.offsets:
+            self.offsets[value] = len(self.data)
+            self.data += value.encode('utf-8') + b'\x00'
+        return self.offsets[value]
+
+
+def _container_codec(container) -> Optional[str]:
+    """Return the codec of the nearest encapsulation container, if any."""
+    region = container.region if container is not None else None
+    return region.type if region is not None else None
+
+
+def write_index(uefi, path: str) -> None:
+    """Serialize the parsed structure of a UEFI object to an index file."""
+    strings = _StringTable()
+    records = []
+    guid_entries = []
+    container_ids: Dict[int, int] = {}
+
+    def add_container(container) -> int:
+        if container is None:
+            return NO_PARENT
+        key = id(container)
+        if key not in container_ids:
+            parent = add_container(container.parent)
+            codec = container.type if container.is_encapsulation else _container_codec(container.parent)
+            guid = container.guid.bytes_le if container.guid is not None else bytes(16)
+            container_ids[key] = len(records)
+            records.append(RECORD.pack(
+                guid, KIND_CONTAINER, TYPE_CODES[container.type], CODEC_CODES[codec], 0,
+                container.offset, container.size, parent, parent, NO_STRING,
+                container.data_offset - container.offset))
+        return container_ids[key]
+
+    for efi in uefi.efis:
+        parent = add_container(efi.container)
+        uis = [s for s in efi.section_elements if s.type == 'UI']
+        flags = FLAG_APRIORI if efi.guid in uefi.load_priority else 0
+        file_id = len(records)
+        guid_entries.append((efi.guid.bytes_le, file_id))
+        records.append(RECORD.pack(
+            efi.guid.bytes_le, KIND_FILE, TYPE_CODES[efi.type], CODEC_CODES[_container_codec(efi.container)],
+            flags, efi.offset, efi.size, parent, parent, strings.add(uis[0].name if uis else None),
+            efi.header_size))
+        for section in efi.section_elements:
+            container = add_container(section.container)
+            records.append(RECORD.pack(
+                bytes(16), KIND_SECTION, TYPE_CODES[section.type],
+                CODEC_CODES[_container_codec(section.container)], 0,
+                section.offset, section.size, file_id, container, strings.add(section.name),
+                section.header_size))
+
+    guid_entries.sort()
+    build_id = strings.add(uefi.build_id or None)
+    apriori = b''.join(guid.bytes_le for guid in uefi.apriori_order)
+    string_table_offset = (HEADER.size + len(records) * RECORD.size + len(guid_entries) * GUID_ENTRY.size
+                           + len(apriori))
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, len(records), len(guid_entries),
+                            string_table_offset, len(strings.data), build_id, uefi.image_size,
+                            len(uefi.apriori_order)))
+        f.write(b''.join(records))
+        f.write(b''.join(GUID_ENTRY.pack(guid, record) for guid, record in guid_entries))
+        f.write(apriori)
+        f.write(bytes(strings.data))
+
+
+class _GuidColumn:
+    """Sequence view over the sorted GUID table, for bisect."""
+    def __init__(self, buffer, offset: int, count: int):
+        self.buffer = buffer
+        self.offset = offset
+        self.count = count
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = self.offset + i * GUID_ENTRY.size
+        return bytes(self.buffer[start:start + 16])
+
+
+class IndexFile:
+    """Memory-mapped reader for an index file written by write_index.
+
+    Compressed sections read back from the image are limited to
+    max_section_size and, together, max_image_size decompressed bytes, as
+    when parsing (see limits).
+    """
+
+    def __init__(self, path: str, image_path: Optional[str] = None,
+                 max_section_size: Optional[int] = DEFAULT_MAX_SECTION_SIZE,
+                 max_image_size: Optional[int] = DEFAULT_MAX_IMAGE_SIZE):
+        self._image = None
+        self._image_file = None
+        self._buffer = None
+        self._file = open(path, 'rb')
+        try:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._read_header()
+        except BaseException:
+            self.close()
+            raise
+        self._image_path = image_path
+        self.max_section_size = max_section_size
+        self.max_image_size = max_image_size
+        self.decompressed_bytes = 0
+        self._regions: Dict[int, bytes] = {}
+        self._image_infos: Dict[int, Optional[pe.ImageInfo]] = {}
+
+    def _read_header(self) -> None:
+        """Decode and check the header and the table bounds."""
+        if len(self._buffer) < HEADER.size:
+            raise ValueError("Invalid UEFI index file")
+        (magic, version, record_size, self.record_count, self.file_count,
+         self._string_table_offset, self._string_table_size, build_id,
+         self.image_size, self._apriori_count) = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            raise ValueError("Invalid UEFI index file")
+        self._guid_table_offset = HEADER.size + self.record_count * RECORD.size
+        self._apriori_offset = self._guid_table_offset + self.file_count * GUID_ENTRY.size
+        if (self._apriori_offset + self._apriori_count * 16 != self._string_table_offset
+                or self._string_table_offset + self._string_table_size > len(self._buffer)):
+            raise ValueError("Truncated UEFI index file")
+        self._guids = _GuidColumn(self._buffer, self._guid_table_offset, self.file_count)
+        self.build_id: str = self.string(build_id) or ""
+
+    def close(self) -> None:
+        """Release the mapped index and image."""
+        if self._image_file is not None:
+            self._image.close()
+            self._image_file.close()
+            self._image_file = None
+        if self._buffer is not None:
+            self._buffer.close()
+        self._file.close()
+
+    def __enter__(self) -> 'IndexFile':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def string(self, offset: int) -> Optional[str]:
+        """Read a string from the string table."""
+        if offset == NO_STRING:
+            return None
+        start = self._string_table_offset + offset
+        end = self._buffer.find(b'\x00', start, self._string_table_offset + self._string_table_size)
+        if offset >= self._string_table_size or end == -1:
+            raise ValueError(f"Invalid string offset 0x{offset:X} in UEFI index file")
+        return self._buffer[start:end].decode('utf-8')
+
+    def record(self, index: int) -> IndexRecord:
+        """Decode the record at index."""
+        if not 0 <= index < self.record_count:
+            raise IndexError(index)
+        fields = RECORD.unpack_from(self._buffer, HEADER.size + index * RECORD.size)
+        return IndexRecord(index, fields, self)
+
+    def records(self) -> List[IndexRecord]:
+        """Decode every record in file order."""
+        return [self.record(i) for i in range(self.record_count)]
+
+    def files(self, guid: GuidLike) -> List[IndexRecord]:
+        """Return the file records with the given GUID."""
+        key = to_guid(guid).bytes_le
+        i = bisect_left(self._guids, key)
+        result = []
+        while i < self.file_count and self._guids[i] == key:
+            _, record = GUID_ENTRY.unpack_from(self._buffer, self._guid_table_offset + i * GUID_ENTRY.size)
+            result.append(self.record(record))
+            i += 1
+        return result
+
+    def file_records(self) -> List[IndexRecord]:
+        """Return every file record in parse order."""
+        return [r for r in self.records() if r.kind == KIND_FILE]
+
+    @property
+    def apriori_order(self) -> List[uuid.UUID]:
+        """GUIDs listed in the APRIORI file, in load order."""
+        return [intern_guid(bytes(self._buffer[offset:offset + 16]))
+                for offset in range(self._apriori_offset, self._string_table_offset, 16)]
+
+    @property
+    def load_priority(self) -> set:
+        """GUIDs listed in the APRIORI load list."""
+        return set(self.apriori_order)
+
+    def get(self, guid: GuidLike) -> Optional[IndexRecord]:
+        """Return the first file record with the given GUID, or None."""
+        files = self.files(guid)
+        return files[0] if files else None
+
+    def sections(self, file_record: IndexRecord, section_type: Optional[str] = None) -> List[IndexRecord]:
+        """Return the section records that follow a file record."""
+        result = []
+        i = file_record.index + 1
+        while i < self.record_count:
+            record = self.record(i)
+            if record.kind == KIND_CONTAINER:
+                i += 1
+                continue
+            if record.kind != KIND_SECTION or record.parent != file_record.index:
+                break
+            if section_type is None or record.type == section_type:
+                result.append(record)
+            i += 1
+        return result
+
+    def section(self, guid: GuidLike, section_type: str) -> Optional[IndexRecord]:
+        """Return the first section of the given type in the file with the given GUID, or None."""
+        for file_record in self.files(guid):
+            sections = self.sections(file_record, section_type)
+            if sections:
+                return sections[0]
+        return None
+
+    def _open_image(self):
+        if self._image is None:
+            if self._image_path is None:
+                raise ValueError("No image path given to read payloads from")
+            # Kept only once it is known to be the indexed image
+            image_file = open(self._image_path, 'rb')
+            try:
+                image = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except BaseException:
+                image_file.close()
+                raise
+            if len(image) != self.image_size:
+                image.close()
+                image_file.close()
+                raise ValueError("Image does not match the index")
+            self._image, self._image_file = image, image_file
+        return self._image
+
+    def _region_data(self, container: int):
+        """Return the buffer a container's offsets are relative to."""
+        while container != NO_PARENT:
+            record = self.record(container)
+            if record.codec == record.type:
+                break
+            container = record.parent
+        if container == NO_PARENT:
+            return self._open_image()
+        if container not in self._regions:
+            record = self.record(container)
+            data = self._region_data(record.parent)
+            data_offset = record.offset + record.header_size
+            data_size = record.size - record.header_size
+            codec = lzma_helper if record.type == 'LZMA' else gzip_helper
+            kind, limit, max_length = self._decompression_limit()
+            try:
+                region = codec.decompress(data, data_offset, data_size, max_length)
+            except DecompressionLimitError:
+                raise DecompressionLimitError(
+                    f"{record.type} section at 0x{record.offset:X} exceeds the per-{kind} limit "
+                    f"of {limit} decompressed bytes", limit, kind, record.offset) from None
+            self.decompressed_bytes += len(region)
+            self._regions[container] = region
+        return self._regions[container]
+
+    def _decompression_limit(self):
+        """Return the binding limit ('section' or 'image'), its size, and the bytes the next region may expand to."""
+        remaining = self.max_image_size - self.decompressed_bytes if self.max_image_size is not None else None
+        if self.max_section_size is not None and (remaining is None or self.max_section_size <= remaining):
+            return 'section', self.max_section_size, self.max_section_size
+        if remaining is not None:
+            return 'image', self.max_image_size, remaining
+        return None, None, None
+
+    def encapsulations(self, record: IndexRecord) -> List[IndexRecord]:
+        """Return the LZMA/GZIP containers enclosing a record, outermost first."""
+        result = []
+        container = record.container
+        while container != NO_PARENT:
+            parent = self.record(container)
+            if parent.codec == parent.type:
+                result.append(parent)
+            container = parent.parent
+        return list(reversed(result))
+
+    def read_raw(self, record: IndexRecord) -> bytes:
+        """Read a record including its header, decompressing enclosing sections as needed."""
+        data = self._region_data(record.container)
+        return bytes(data[record.offset:record.offset + record.size])
+
+    def read(self, record: IndexRecord) -> bytes:
+        """Read the payload of a record from the original image, decompressing as needed."""
+        data = self._region_data(record.container)
+        return bytes(data[record.offset + record.header_size:record.offset + record.size])
+
+    def image_info(self, record: IndexRecord) -> Optional[pe.ImageInfo]:
+        """Return the PE/TE header metadata of a PE32 or TE section record, or None.
+
+        Decoded from the original image on first use and kept per record.
+        """
+        if record.index not in self._image_infos:
+            info = None
+            if record.kind == KIND_SECTION and record.type in ('PE32', 'TE'):
+                try:
+                    info = pe.analyze(self.read(record))
+                except ValueError:
+                    pass
+            self._image_infos[record.index] = info
+        return self._image_infos[record.index]
@@ -0,0 +1,97 @@
+"""
+NDJSON inventory of a UEFI image.
+
+One JSON object per line: a "file" record for each EFI file followed by a
+"section" record for each of its sections, written as the parser reaches
+each file, and a closing "image" record with the build ID and the APRIORI
+load order. Records of PE32 and TE sections include the decoded image
+headers (see pe). No payload is written anywhere.
+"""
+
+from typing import List, Optional, TextIO
+
+from .guids import format_guid
+
+INVENTORY_VERSION = 2
+
+
+def _path(containers) -> List[dict]:
+    return [{'type': c.type, 'offset': c.offset, 'size': c.size} for c in containers]
+
+
+def _codec(container) -> Optional[str]:
+    region = container.region if container is not None else None
+    return region.type if region is not None else None
+
+
+def _image(section) -> Optional[dict]:
+    info = section.image_info
+    if info is None:
+        return None
+    return {
+        'format': info.format,
+        'machine': info.machine_name,
+        'entry_point': info.entry_point,
+        'image_base': info.image_base,
+        'image_size': info.image_size,
+        'subsystem': info.subsystem_name,
+        'sections': [{'name': s.name, 'virtual_address': s.virtual_address, 'virtual_size': s.virtual_size,
+                      'raw_offset': s.raw_offset, 'raw_size': s.raw_size} for s in info.sections],
+        'pdb_path': info.pdb_path,
+    }
+
+
+def file_record(efi, name: Optional[str], module: Optional[str]) -> dict:
+    """Return the inventory record of an EFI file."""
+    return {
+        'record': 'file',
+        'guid': format_guid(efi.guid),
+        'type': efi.type,
+        'name': name,
+        'module': module,
+        'offset': efi.offset,
+        'size': efi.size,
+        'header_size': efi.header_size,
+        'codec': _codec(efi.container),
+        'path': _path(efi.path),
+        'digest': efi.digest,
+    }
+
+
+def section_record(efi, ordinal: int, section) -> dict:
+    """Return the inventory record of a section of an EFI file."""
+    return {
+        'record': 'section',
+        'file': format_guid(efi.guid),
+        'ordinal': ordinal,
+        'type': section.type,
+        'name': section.name,
+        'offset': section.offset,
+        'size': section.size,
+        'header_size': section.header_size,
+        'payload_size': len(section.decompressed_image),
+        'codec': _codec(section.container),
+        'depth': section.depth,
+        'path': _path(section.path),
+        'digest': section.digest,
+        'image': _image(section),
+    }
+
+
+def image_record(uefi) -> dict:
+    """Return the closing inventory record of an image."""
+    return {
+        'record': 'image',
+        'version': INVENTORY_VERSION,
+        'build_id': uefi.build_id,
+        'image_size': uefi.image_size,
+        'files': len(uefi.efis),
+        'apriori': [format_guid(guid) for guid in uefi.apriori_order],
+    }
+
+
+def write_record(stream: TextIO, record: dict):
+    """Write one record as a line of NDJSON."""
+    import json
+    stream.write(json.dumps(record, separators=(',', ':')))
+    stream.write('\n')
@@ -0,0 +1,45 @@
+"""
+Limits on decompressed data.
+
+The parser passes the smaller of the per-section limit and what is left of
+the per-image limit to the LZMA and GZIP helpers as max_length. The helpers
+stop decompressing as soon as the output would exceed it, so an oversized
+or hostile stream costs at most max_length bytes of memory and the work to
+produce them. Nesting depth is limited separately by max_depth, when
+parsing and when probing.
+"""
+
+from typing import Optional
+
+# Volumes and encapsulation sections that may enclose one another
+DEFAULT_MAX_DEPTH = 32
+
+# Decompressed bytes allowed for one GUID-defined section
+DEFAULT_MAX_SECTION_SIZE = 256 * 1024 * 1024
+# Decompressed bytes allowed across all GUID-defined sections of an image
+DEFAULT_MAX_IMAGE_SIZE = 1024 * 1024 * 1024
+
+
+class DecompressionLimitError(ValueError):
+    """Decompressed data would exceed a size limit.
+
+    limit is the limit in bytes that was hit; kind is 'section' or 'image'
+    when raised by the parser, and offset is the offset of the GUID-defined
+    section, as for EFISection.offset.
+    """
+    def __init__(self, message: str, limit: int, kind: Optional[str] = None, offset: Optional[int] = None):
+        super().__init__(message)
+        self.limit = limit
+        self.kind = kind
+        self.offset = offset
+
+
+class DecompressionError(ValueError):
+    """Compressed data is corrupt or truncated."""
+
+
+def check_length(output: bytes, max_length: Optional[int], codec: str) -> bytes:
+    """Raise DecompressionLimitError if output is longer than max_length."""
+    if max_length is not None and len(output) > max_length:
+        raise DecompressionLimitError(f"{codec} data expands beyond {max_length} bytes", max_length)
+    return output
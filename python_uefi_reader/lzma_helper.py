@@ -20,16 +20,38 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
-import lzma
+import struct
+from typing import Optional
 from . import byte_operations
+from .limits import DecompressionError, DecompressionLimitError, check_length
 
+# Output size of a stream that records no size
+UNKNOWN_SIZE = 0xFFFFFFFFFFFFFFFF
 
-def decompress(data: bytes, offset: int, input_size: int) -> bytes:
-    """Decompress LZMA data."""
+
+def _bounded(decompressor, data: bytes, max_length: Optional[int]) -> bytes:
+    """Decompress with decompressor, producing at most one byte more than max_length."""
+    if max_length is None:
+        return decompressor.decompress(data)
+    return check_length(decompressor.decompress(data, max_length + 1), max_length, "LZMA")
+
+
+def decompress(data: bytes, offset: int, input_size: int, max_length: Optional[int] = None) -> bytes:
+    """Decompress LZMA data.
+    
+    With max_length, decompression stops and DecompressionLimitError is
+    raised once the output would exceed max_length bytes, or up front if
+    the header records a larger size. Corrupt or truncated streams raise
+    DecompressionError.
+    """
+    import lzma
     # LZMA format: 5 bytes properties + 8 bytes size + compressed data
     properties = data[offset:offset + 5]
     output_size = byte_operations.read_uint64(data, offset + 5)
     compressed_data = data[offset + 0x0D:offset + input_size]
+    if max_length is not None and output_size != UNKNOWN_SIZE and output_size > max_length:
+        raise DecompressionLimitError(f"LZMA header records {output_size} bytes, over {max_length} bytes",
+                                      max_length)
     
     # Create LZMA decompressor with properties
     filters = [
@@ -46,32 +68,59 @@ def decompress(data: bytes, offset: int, input_size: int) -> bytes:
     # Try to decompress using raw format
     try:
         decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=filters)
-        return decompressor.decompress(compressed_data)
+        return _bounded(decompressor, compressed_data, max_length)
+    except DecompressionLimitError:
+        raise
     except Exception:
         # Fallback: try with the full data including header
         full_data = data[offset:offset + input_size]
         try:
-            return lzma.decompress(full_data)
+            return _bounded(lzma.LZMADecompressor(), full_data, max_length)
+        except DecompressionLimitError:
+            raise
         except Exception:
             # Last resort: use the properties-based approach
-            import struct
-            dict_size = struct.unpack('<I', properties[1:5])[0]
-            filters = [
-                {
-                    "id": lzma.FILTER_LZMA1,
-                    "dict_size": dict_size,
-                    "lc": properties[0] % 9,
-                    "lp": (properties[0] // 9) % 5,
-                    "pb": (properties[0] // 45),
-                }
-            ]
-            decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=filters)
-            result = decompressor.decompress(compressed_data)
+            try:
+                dict_size = struct.unpack('<I', properties[1:5])[0]
+                filters = [
+                    {
+                        "id": lzma.FILTER_LZMA1,
+                        "dict_size": dict_size,
+                        "lc": properties[0] % 9,
+                        "lp": (properties[0] // 9) % 5,
+                        "pb": (properties[0] // 45),
+                    }
+                ]
+                decompressor = lzma.LZMADecompressor(format=lzma.FORMAT_RAW, filters=filters)
+                result = _bounded(decompressor, compressed_data, max_length)
+            except (lzma.LZMAError, EOFError, OSError, struct.error, IndexError) as e:
+                raise DecompressionError(f"Corrupt LZMA data: {e}") from e
             # Truncate to expected output size if necessary
             return result[:output_size] if len(result) > output_size else result
 
 
-def compress(data: bytes, offset: int, input_size: int) -> bytes:
-    """Compress data using LZMA."""
+def compress(data: bytes, offset: int, input_size: int, preset: int = 9,
+             properties: Optional[bytes] = None) -> bytes:
+    """Compress data using LZMA.
+    
+    properties is the 5-byte properties header of an existing stream; when
+    given, its lc/lp/pb and dictionary size are used on top of preset.
+    """
+    import lzma
     input_data = data[offset:offset + input_size]
-    return lzma.compress(input_data, format=lzma.FORMAT_ALONE, preset=9)
+    if properties is not None:
+        filters = [
+            {
+                "id": lzma.FILTER_LZMA1,
+                "preset": preset,
+                "dict_size": struct.unpack('<I', properties[1:5])[0],
+                "lc": properties[0] % 9,
+                "lp": (properties[0] // 9) % 5,
+                "pb": (properties[0] // 45),
+            }
+        ]
+        output = lzma.compress(input_data, format=lzma.FORMAT_ALONE, filters=filters)
+    else:
+        output = lzma.compress(input_data, format=lzma.FORMAT_ALONE, preset=preset)
+    # FORMAT_ALONE leaves the size unknown; UEFI decoders size their buffer from it
+    return output[:5] + struct.pack('<Q', len(input_data)) + output[13:]
@@ -0,0 +1,152 @@
+"""
+Output backends for extract_uefi.
+
+Extraction writes files by their path relative to the output root; the
+backend decides whether they end up in a directory tree or an archive.
+"""
+
+import io
+import os
+import sys
+import time
+from typing import BinaryIO, Callable, Iterable, Optional, Set, Tuple, Union
+
+from .blob_store import BlobStore
+
+ARCHIVE_FORMATS = ('tar', 'tar.gz', 'tar.bz2', 'tar.xz', 'zip')
+
+
+class DirectoryOutput:
+    """Writes extracted files below a root directory."""
+
+    def __init__(self, root: str, store: Optional[BlobStore] = None):
+        self.root = root
+        self.store = store
+
+    def _full_path(self, path: str) -> str:
+        return os.path.join(self.root, path)
+
+    def exists(self, path: str) -> bool:
+        """Return True if path was already written."""
+        return os.path.exists(self._full_path(path))
+
+    def _prepare(self, path: str) -> str:
+        full_path = self._full_path(path)
+        directory = os.path.dirname(full_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        return full_path
+
+    def write_bytes(self, path: str, data: bytes):
+        """Write a payload, through the blob store if one is used."""
+        full_path = self._prepare(path)
+        if self.store is not None:
+            self.store.write(full_path, data)
+        else:
+            with open(full_path, 'wb') as f:
+                f.write(data)
+
+    def write_text(self, path: str, text: str):
+        """Write a generated text file."""
+        with open(self._prepare(path), 'w') as f:
+            f.write(text)
+
+    def write_batch(self, files: Iterable[Tuple[str, Union[bytes, str, Callable[[], bytes]]]]):
+        """Write payloads (bytes, or a callable returning them) and text files (str), creating each directory once."""
+        files = list(files)
+        directories = {os.path.dirname(self._full_path(path)) for path, _ in files}
+        for directory in sorted(directories):
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        for path, data in files:
+            full_path = self._full_path(path)
+            if callable(data):
+                data = data()
+            if isinstance(data, str):
+                with open(full_path, 'w') as f:
+                    f.write(data)
+            elif self.store is not None:
+                self.store.write(full_path, data)
+            else:
+                with open(full_path, 'wb') as f:
+                    f.write(data)
+
+    def close(self):
+        """Finish writing."""
+
+
+class ArchiveOutput:
+    """Streams extracted files into a tar or zip archive, or to stdout."""
+
+    def __init__(self, target: Union[str, BinaryIO], archive_format: str = 'tar', prefix: str = '',
+                 mtime: Optional[float] = None):
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unsupported archive format: {archive_format}")
+        if target == '-':
+            target = sys.stdout.buffer
+        self.prefix = prefix.replace(os.sep, '/').strip('/')
+        self._written: Set[str] = set()
+        self._own_file = isinstance(target, str)
+        self._file = open(target, 'wb') if self._own_file else target
+        self._mtime = time.time() if mtime is None else mtime
+
+        if archive_format == 'zip':
+            import zipfile
+            self._tar = None
+            self._zip = zipfile.ZipFile(self._file, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            compression = archive_format.split('.', 1)[1] if '.' in archive_format else ''
+            # Stream mode never seeks, so stdout and pipes work as targets
+            import tarfile
+            self._tar = tarfile.open(fileobj=self._file, mode='w|' + compression)
+            self._zip = None
+
+    def _name(self, path: str) -> str:
+        name = path.replace(os.sep, '/').strip('/')
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def exists(self, path: str) -> bool:
+        """Return True if path was already written."""
+        return self._name(path) in self._written
+
+    def write_bytes(self, path: str, data: bytes):
+        """Add a file to the archive."""
+        name = self._name(path)
+        self._written.add(name)
+        if self._zip is not None:
+            import zipfile
+            # Zip stores local times without a zone; write UTC so the bytes do not depend on TZ.
+            # It cannot store times before 1980, e.g. a pinned SOURCE_DATE_EPOCH of 0
+            info = zipfile.ZipInfo(name, max(time.gmtime(self._mtime)[:6], (1980, 1, 1, 0, 0, 0)))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            self._zip.writestr(info, data)
+        else:
+            import tarfile
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = self._mtime
+            info.mode = 0o644
+            self._tar.addfile(info, io.BytesIO(data))
+
+    def write_text(self, path: str, text: str):
+        """Add a generated text file to the archive."""
+        self.write_bytes(path, text.encode('utf-8'))
+
+    def write_batch(self, files: Iterable[Tuple[str, Union[bytes, str, Callable[[], bytes]]]]):
+        """Add payloads (bytes, or a callable returning them) and text files (str) to the archive, in order."""
+        for path, data in files:
+            if callable(data):
+                data = data()
+            self.write_bytes(path, data.encode('utf-8') if isinstance(data, str) else data)
+
+    def close(self):
+        """Finish the archive and release the target."""
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
+        if self._own_file:
+            self._file.close()
+        else:
+            self._file.flush()
@@ -0,0 +1,129 @@
+"""
+In-place patching of a single section.
+
+patch_section replaces the payload of one section directly in a writable
+buffer (a bytearray or a writable mmap of the image) using the offsets
+recorded while parsing. Only the patched file is rewritten; the files after
+it in the same volume move into the volume's free space when the size
+changes, and the data checksums of the files enclosing nested volumes are
+updated on the way up. Nothing else in the image is read or written.
+
+Sections inside LZMA/GZIP sections cannot be patched in place; use
+UEFI.repack for those.
+"""
+
+from typing import Tuple
+
+from . import byte_operations
+from .repack import (EFI_FVB2_ERASE_POLARITY, FFS_ATTRIB_CHECKSUM, VOLUME_TOP_FILE_GUID,
+                     file_header, section_header, file_alignment)
+
+
+def _erase_byte(buffer, volume) -> int:
+    attributes = byte_operations.read_uint32(buffer, volume.offset + 0x2C)
+    return 0xFF if attributes & EFI_FVB2_ERASE_POLARITY else 0x00
+
+
+def _read_file_header(buffer, offset: int) -> Tuple[int, int, int, int]:
+    """Return (type, attributes, size, header size) of the file at offset."""
+    file_type = buffer[offset + 0x12]
+    attributes = buffer[offset + 0x13]
+    file_size = byte_operations.read_uint24(buffer, offset + 0x14)
+    header_size = 0x18
+    if attributes & 0x01:  # FFS_ATTRIB_LARGE_FILE
+        file_size = byte_operations.read_uint64(buffer, offset + 0x18)
+        header_size = 0x20
+    return file_type, attributes, file_size, header_size
+
+
+def _files(buffer, volume, offset: int):
+    """Yield (offset, attributes, size, header size) of the files of volume from offset on."""
+    end = volume.data_offset + volume.data_size
+    while offset + 0x18 <= end:
+        file_type, attributes, file_size, header_size = _read_file_header(buffer, offset)
+        if file_size == 0 or file_type in (0x00, 0xFF) or offset + file_size > end:
+            return
+        yield offset, attributes, file_size, header_size
+        offset = byte_operations.align(volume.data_offset, offset + file_size, 8)
+
+
+def _used_end(buffer, volume, offset: int, shift: int) -> int:
+    """Return the end of the last file from offset on, checking those files may move by shift."""
+    used_end = offset
+    for file_offset, attributes, file_size, header_size in _files(buffer, volume, offset):
+        if shift and byte_operations.read_guid(buffer, file_offset) == VOLUME_TOP_FILE_GUID:
+            raise ValueError("Cannot move the volume top file; use repack()")
+        alignment = file_alignment(attributes)
+        if alignment > 8 and shift % alignment:
+            raise ValueError(f"Cannot move a file aligned to 0x{alignment:X} bytes; use repack()")
+        used_end = file_offset + file_size
+    return used_end
+
+
+def _update_data_checksum(buffer, offset: int, header_size: int, file_size: int):
+    if buffer[offset + 0x13] & FFS_ATTRIB_CHECKSUM:
+        buffer[offset + 0x11] = byte_operations.calculate_checksum8(buffer, offset + header_size,
+                                                                    file_size - header_size)
+
+
+def _splice_file(buffer, volume, offset: int, old_size: int, new_file: bytes):
+    """Replace the file at offset, moving the following files of the volume by the size change."""
+    old_end = byte_operations.align(volume.data_offset, offset + old_size, 8)
+    new_end = byte_operations.align(volume.data_offset, offset + len(new_file), 8)
+    shift = new_end - old_end
+    erase_byte = _erase_byte(buffer, volume)
+
+    if shift:
+        used_end = _used_end(buffer, volume, old_end, shift)
+        if used_end + shift > volume.data_offset + volume.data_size:
+            raise ValueError("Not enough free space in the volume; use repack()")
+        if used_end > old_end:
+            buffer[old_end + shift:used_end + shift] = bytes(buffer[old_end:used_end])
+        if shift < 0:
+            buffer[used_end + shift:used_end] = bytes([erase_byte]) * -shift
+
+    buffer[offset:offset + len(new_file)] = new_file
+    buffer[offset + len(new_file):new_end] = bytes([erase_byte]) * (new_end - offset - len(new_file))
+
+
+def _enclosing_file(buffer, volume, position: int) -> Tuple[int, int, int]:
+    """Return (offset, header size, size) of the file of volume that contains position."""
+    for offset, _, file_size, header_size in _files(buffer, volume, volume.data_offset):
+        if offset <= position < offset + file_size:
+            return offset, header_size, file_size
+    raise ValueError(f"No file contains offset 0x{position:X}")
+
+
+def patch_section(buffer, efi, section, payload: bytes):
+    """Replace the payload of section (of file efi) in buffer, the image efi was parsed from.
+
+    Offsets recorded by the parse are not updated; parse the patched image
+    again before patching it further.
+    """
+    if section.container is None or section.container.region is not None:
+        raise ValueError("Section is inside a compressed section; use repack()")
+
+    body_start = efi.offset + efi.header_size
+    body_end = efi.offset + efi.size
+    if section.header_size == 0:
+        # The body of a RAW file is its payload
+        body = bytes(payload)
+    else:
+        section_end = section.offset + section.size
+        next_offset = byte_operations.align(body_start, section_end, 4)
+        body = bytes(buffer[body_start:section.offset])
+        body += section_header(buffer[section.offset + 3], len(payload)) + payload
+        if next_offset < body_end:
+            body += b'\x00' * (byte_operations.align(0, len(body), 4) - len(body))
+            body += bytes(buffer[next_offset:body_end])
+
+    new_file = file_header(bytes(buffer[efi.offset:efi.offset + 0x18]), len(body), body) + body
+    volume = efi.container
+    _splice_file(buffer, volume, efi.offset, efi.size, new_file)
+
+    # A nested volume keeps its size, so only the files holding it change
+    while volume.parent is not None:
+        parent = volume.parent
+        offset, header_size, file_size = _enclosing_file(buffer, parent, volume.offset)
+        _update_data_checksum(buffer, offset, header_size, file_size)
+        volume = parent
@@ -0,0 +1,258 @@
+"""
+PE32/PE32+ and TE header analysis of PE32 and TE section payloads.
+
+analyze decodes the machine type, entry point, image size, section table
+and debug directory of an image with the precompiled structs below. It
+reads headers only; the image itself is never relocated or loaded.
+EFISection.image_info memoizes the result per section.
+"""
+
+import struct
+from typing import List, Optional
+
+from .guids import GUID, intern_guid
+
+DOS_SIGNATURE = b'MZ'
+PE_SIGNATURE = b'PE\x00\x00'
+TE_SIGNATURE = b'VZ'
+
+PE32_MAGIC = 0x10B
+PE32_PLUS_MAGIC = 0x20B
+
+# e_lfanew of the DOS header
+DOS_LFANEW = struct.Struct('<I')
+DOS_LFANEW_OFFSET = 0x3C
+OPTIONAL_MAGIC = struct.Struct('<H')
+# Machine, NumberOfSections, TimeDateStamp, SizeOfOptionalHeader, Characteristics
+COFF_HEADER = struct.Struct('<HHI8xHH')
+# Magic, AddressOfEntryPoint, ImageBase, SectionAlignment, FileAlignment,
+# SizeOfImage, SizeOfHeaders, Subsystem, NumberOfRvaAndSizes
+OPTIONAL_HEADER32 = struct.Struct('<H14xI8xIII16xII4xH2x16x4xI')
+OPTIONAL_HEADER64 = struct.Struct('<H14xI4xQII16xII4xH2x32x4xI')
+# Signature, Machine, NumberOfSections, Subsystem, StrippedSize,
+# AddressOfEntryPoint, BaseOfCode, ImageBase, relocation and debug directories
+TE_HEADER = struct.Struct('<2sHBBHIIQIIII')
+# Name, VirtualSize, VirtualAddress, SizeOfRawData, PointerToRawData, Characteristics
+SECTION_HEADER = struct.Struct('<8sIIII12xI')
+DATA_DIRECTORY = struct.Struct('<II')
+# TimeDateStamp, Type, SizeOfData, AddressOfRawData, PointerToRawData
+DEBUG_DIRECTORY = struct.Struct('<4xI4xIIII')
+# CodeView signature, then GUID and age (RSDS) or offset, timestamp and age (NB10)
+CODEVIEW_RSDS = struct.Struct('<4s16sI')
+CODEVIEW_NB10 = struct.Struct('<4s4xII')
+
+DEBUG_DIRECTORY_INDEX = 6
+DEBUG_TYPE_CODEVIEW = 2
+
+MACHINE_TYPES = {
+    0x014C: 'IA32',
+    0x01C0: 'ARM',
+    0x01C2: 'ARM',
+    0x01C4: 'ARM',
+    0x0200: 'IPF',
+    0x0EBC: 'EBC',
+    0x5032: 'RISCV32',
+    0x5064: 'RISCV64',
+    0x6264: 'LOONGARCH64',
+    0x8664: 'X64',
+    0xAA64: 'AARCH64',
+}
+
+SUBSYSTEMS = {
+    10: 'EFI_APPLICATION',
+    11: 'EFI_BOOT_SERVICE_DRIVER',
+    12: 'EFI_RUNTIME_DRIVER',
+    13: 'EFI_ROM',
+}
+
+
+class ImageSection:
+    """One entry of the section table of an image."""
+    def __init__(self, name: str, virtual_address: int, virtual_size: int, raw_offset: int,
+                 raw_size: int, characteristics: int):
+        self.name = name
+        self.virtual_address = virtual_address
+        self.virtual_size = virtual_size
+        self.raw_offset = raw_offset
+        self.raw_size = raw_size
+        self.characteristics = characteristics
+
+
+class DebugEntry:
+    """One entry of the debug directory of an image.
+
+    For CodeView entries, pdb_path is the path of the PDB or debug file the
+    image was linked with, and pdb_guid and age identify that file (pdb_guid
+    is None for NB10 entries).
+    """
+    def __init__(self, debug_type: int, timestamp: int, size: int, rva: int, offset: int):
+        self.type = debug_type
+        self.timestamp = timestamp
+        self.size = size
+        self.rva = rva
+        self.offset = offset
+        self.pdb_path: Optional[str] = None
+        self.pdb_guid: Optional[GUID] = None
+        self.age: Optional[int] = None
+
+
+class ImageInfo:
+    """Header metadata of a PE32, PE32+ or TE image.
+
+    Offsets are relative to the section payload. TE images do not record
+    their image size, so image_size is the end of the last section there.
+    """
+    def __init__(self, image_format: str):
+        self.format = image_format
+        self.machine: int = 0
+        self.entry_point: int = 0
+        self.image_base: int = 0
+        self.image_size: int = 0
+        self.headers_size: int = 0
+        self.subsystem: int = 0
+        self.timestamp: Optional[int] = None
+        # Bytes of PE headers a TE image dropped
+        self.stripped_size: int = 0
+        self.sections: List[ImageSection] = []
+        self.debug: List[DebugEntry] = []
+
+    @property
+    def machine_name(self) -> str:
+        """Name of the machine type, or its hex value if unknown."""
+        return MACHINE_TYPES.get(self.machine, f"0x{self.machine:04X}")
+
+    @property
+    def subsystem_name(self) -> str:
+        """Name of the EFI subsystem, or its value if unknown."""
+        return SUBSYSTEMS.get(self.subsystem, str(self.subsystem))
+
+    @property
+    def pdb_path(self) -> Optional[str]:
+        """Path of the first CodeView debug entry, or None."""
+        for entry in self.debug:
+            if entry.pdb_path is not None:
+                return entry.pdb_path
+        return None
+
+    @property
+    def _delta(self) -> int:
+        # Payload offsets of a TE image are its PE file offsets minus the
+        # stripped headers, which the TE header replaces
+        return self.stripped_size - TE_HEADER.size if self.format == 'TE' else 0
+
+    def file_offset(self, rva: int) -> Optional[int]:
+        """Return the payload offset of a relative virtual address, or None if not backed by data."""
+        for section in self.sections:
+            if section.virtual_address <= rva < section.virtual_address + max(section.virtual_size,
+                                                                              section.raw_size):
+                if rva - section.virtual_address >= section.raw_size:
+                    return None
+                return rva - section.virtual_address + section.raw_offset - self._delta
+        if rva < self.headers_size:
+            return rva - self._delta
+        return None
+
+
+def _unpack(layout: struct.Struct, data, offset: int) -> tuple:
+    if offset < 0 or offset + layout.size > len(data):
+        raise ValueError(f"Truncated image header at 0x{offset:X}")
+    return layout.unpack_from(data, offset)
+
+
+def _read_sections(info: ImageInfo, data, offset: int, count: int):
+    for i in range(count):
+        name, virtual_size, virtual_address, raw_size, raw_offset, characteristics = _unpack(
+            SECTION_HEADER, data, offset + i * SECTION_HEADER.size)
+        info.sections.append(ImageSection(name.rstrip(b'\x00').decode('ascii', errors='replace'),
+                                          virtual_address, virtual_size, raw_offset, raw_size,
+                                          characteristics))
+
+
+def _read_codeview(entry: DebugEntry, data, offset: int):
+    end = min(offset + entry.size, len(data))
+    signature = bytes(data[offset:offset + 4])
+    if signature == b'RSDS' and offset + CODEVIEW_RSDS.size <= end:
+        _, guid, entry.age = CODEVIEW_RSDS.unpack_from(data, offset)
+        entry.pdb_guid = intern_guid(guid)
+        path_offset = offset + CODEVIEW_RSDS.size
+    elif signature == b'NB10' and offset + CODEVIEW_NB10.size <= end:
+        _, _, entry.age = CODEVIEW_NB10.unpack_from(data, offset)
+        path_offset = offset + CODEVIEW_NB10.size
+    else:
+        return
+    path = bytes(data[path_offset:end]).split(b'\x00', 1)[0]
+    entry.pdb_path = path.decode('utf-8', errors='replace')
+
+
+def _read_debug_directory(info: ImageInfo, data, rva: int, size: int):
+    if rva == 0 or size == 0:
+        return
+    offset = info.file_offset(rva)
+    if offset is None:
+        raise ValueError(f"Debug directory at RVA 0x{rva:X} is outside the image")
+    for i in range(size // DEBUG_DIRECTORY.size):
+        timestamp, debug_type, data_size, data_rva, pointer = _unpack(
+            DEBUG_DIRECTORY, data, offset + i * DEBUG_DIRECTORY.size)
+        data_offset = info.file_offset(data_rva) if data_rva else None
+        if data_offset is None:
+            data_offset = pointer - info._delta
+        entry = DebugEntry(debug_type, timestamp, data_size, data_rva, data_offset)
+        if debug_type == DEBUG_TYPE_CODEVIEW and 0 <= data_offset < len(data):
+            _read_codeview(entry, data, data_offset)
+        info.debug.append(entry)
+
+
+def _analyze_pe(data) -> ImageInfo:
+    pe_offset = DOS_LFANEW.unpack_from(data, DOS_LFANEW_OFFSET)[0] if len(data) >= 0x40 else 0
+    if bytes(data[pe_offset:pe_offset + 4]) != PE_SIGNATURE:
+        raise ValueError("Missing PE signature")
+    machine, section_count, timestamp, optional_size, _ = _unpack(COFF_HEADER, data, pe_offset + 4)
+    optional_offset = pe_offset + 4 + COFF_HEADER.size
+    magic = _unpack(OPTIONAL_MAGIC, data, optional_offset)[0]
+    if magic == PE32_MAGIC:
+        info, layout = ImageInfo('PE32'), OPTIONAL_HEADER32
+    elif magic == PE32_PLUS_MAGIC:
+        info, layout = ImageInfo('PE32+'), OPTIONAL_HEADER64
+    else:
+        raise ValueError(f"Unknown optional header magic 0x{magic:X}")
+    (_, info.entry_point, info.image_base, _, _, info.image_size, info.headers_size,
+     info.subsystem, directory_count) = _unpack(layout, data, optional_offset)
+    info.machine = machine
+    info.timestamp = timestamp
+
+    _read_sections(info, data, optional_offset + optional_size, section_count)
+    if directory_count > DEBUG_DIRECTORY_INDEX:
+        rva, size = _unpack(DATA_DIRECTORY, data,
+                            optional_offset + layout.size + DEBUG_DIRECTORY_INDEX * DATA_DIRECTORY.size)
+        _read_debug_directory(info, data, rva, size)
+    return info
+
+
+def _analyze_te(data) -> ImageInfo:
+    (_, machine, section_count, subsystem, stripped_size, entry_point, _, image_base,
+     _, _, debug_rva, debug_size) = _unpack(TE_HEADER, data, 0)
+    info = ImageInfo('TE')
+    info.machine = machine
+    info.subsystem = subsystem
+    info.entry_point = entry_point
+    info.image_base = image_base
+    info.stripped_size = stripped_size
+    info.headers_size = stripped_size + section_count * SECTION_HEADER.size
+
+    _read_sections(info, data, TE_HEADER.size, section_count)
+    info.image_size = max((s.virtual_address + s.virtual_size for s in info.sections), default=0)
+    _read_debug_directory(info, data, debug_rva, debug_size)
+    return info
+
+
+def analyze(data) -> ImageInfo:
+    """Decode the headers of a PE32/PE32+ or TE image held in a bytes-like object.
+
+    Raises ValueError if data does not start with a valid image header.
+    """
+    signature = bytes(data[:2])
+    if signature == DOS_SIGNATURE:
+        return _analyze_pe(data)
+    if signature == TE_SIGNATURE:
+        return _analyze_te(data)
+    raise ValueError("Not a PE32 or TE image")
@@ -0,0 +1,185 @@
+"""
+Header-only probing of UEFI images.
+
+Probing reports the build ID and the volume/file layout of an image without
+decompressing or materializing any section.
+"""
+
+import mmap
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from . import byte_operations
+from . import elf
+from .limits import DEFAULT_MAX_DEPTH
+
+BUILD_ID_MARKER = b'QC_IMAGE_VERSION_STRING='
+
+# Characters accepted after the marker, as in [a-zA-Z/\\0-9_\-\.]
+_BUILD_ID_CHARS = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ/\\0123456789_-.')
+_WORD_CHARS = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_')
+
+# Longest build ID considered; the marker is followed by a short version string
+_BUILD_ID_MAX_LENGTH = 256
+
+
+class ProbeResult:
+    """Summary of an image gathered from headers only."""
+    def __init__(self):
+        self.image_size: int = 0
+        self.build_id: str = ""
+        self.volumes: List[Tuple[int, int]] = []
+        self.file_count: int = 0
+        self.compressed_sections: int = 0
+
+    @property
+    def volume_count(self) -> int:
+        """Number of top-level firmware volumes found."""
+        return len(self.volumes)
+
+
+def find_build_id(data, ranges: Optional[Iterable[Tuple[int, int]]] = None) -> str:
+    """Return the first QC_IMAGE_VERSION_STRING value in data, or an empty string.
+
+    Matches what the build path regex would return for its first hit, but stops
+    scanning at the first marker instead of searching the whole buffer. When
+    ranges of (start, end) offsets are given, only those are searched, in order.
+    """
+    for range_start, range_end in ranges if ranges is not None else ((0, len(data)),):
+        start = data.find(BUILD_ID_MARKER, range_start, range_end)
+        while start != -1:
+            value_start = start + len(BUILD_ID_MARKER)
+            chunk = data[value_start:min(value_start + _BUILD_ID_MAX_LENGTH, range_end)]
+            end = 0
+            while end < len(chunk) and chunk[end] in _BUILD_ID_CHARS:
+                end += 1
+            # The regex ends on a word boundary, so trailing separators are dropped
+            while end > 0 and chunk[end - 1] not in _WORD_CHARS:
+                end -= 1
+            if end > 0:
+                return bytes(chunk[:end]).decode('ascii', errors='ignore')
+            start = data.find(BUILD_ID_MARKER, value_start, range_end)
+    return ""
+
+
+def build_id_ranges(ranges: List[Tuple[int, int]], volume_offsets: Iterable[int]) -> List[Tuple[int, int]]:
+    """Order ranges for find_build_id: those without a volume first.
+
+    The build ID of an XBL image is in its loader segments, so the firmware
+    volume segment is only searched when they have none.
+    """
+    volume_offsets = list(volume_offsets)
+    return sorted(ranges, key=lambda r: any(r[0] <= offset < r[1] for offset in volume_offsets))
+
+
+def _is_volume_header(data, offset: int, end: Optional[int] = None) -> bool:
+    """Check the signature and header checksum of a candidate volume header ending before end."""
+    if end is None:
+        end = len(data)
+    if offset < 0 or offset + 0x38 > end:
+        return False
+    if data[offset + 0x28:offset + 0x2C] != b'_FVH':
+        return False
+    header_size = byte_operations.read_uint16(data, offset + 0x30)
+    if header_size < 0x38 or offset + header_size > end:
+        return False
+    header = bytearray(data[offset:offset + header_size])
+    byte_operations.write_uint16(header, 0x32, 0)
+    checksum = byte_operations.calculate_checksum16(bytes(header), 0, header_size)
+    return checksum == byte_operations.read_uint16(data, offset + 0x32)
+
+
+def _section_volumes(result: ProbeResult, data, offset: int, end: int) -> List[int]:
+    """Count the sections of an FV image file and return the offsets of its uncompressed volumes."""
+    volumes = []
+    while offset + 4 <= end:
+        section_size = byte_operations.read_uint24(data, offset)
+        section_type = byte_operations.read_uint8(data, offset + 3)
+        if section_size == 0 or section_type in (0x00, 0xFF) or offset + section_size > end:
+            break
+        if section_type == 0x02:  # EFI_SECTION_GUID_DEFINED
+            result.compressed_sections += 1
+        elif section_type == 0x17 and _is_volume_header(data, offset + 4):  # EFI_SECTION_FIRMWARE_VOLUME_IMAGE
+            volumes.append(offset + 4)
+        offset = byte_operations.align(0, offset + section_size, 4)
+    return volumes
+
+
+def _walk_volume(result: ProbeResult, data, offset: int, max_depth: int = DEFAULT_MAX_DEPTH) -> int:
+    """Count the files of a volume and of the volumes nested in it; return the volume size.
+
+    Nested volumes are walked from an explicit stack, at most max_depth deep.
+    """
+    stack = [(offset, 0)]
+    while stack:
+        volume_offset, depth = stack.pop()
+        if depth > max_depth:
+            raise ValueError(f"Maximum nesting depth of {max_depth} exceeded")
+        volume_size = byte_operations.read_uint32(data, volume_offset + 0x20)
+        header_size = byte_operations.read_uint16(data, volume_offset + 0x30)
+        end = min(volume_offset + volume_size, len(data))
+        file_offset = volume_offset + header_size
+        while file_offset + 0x18 <= end:
+            file_type = byte_operations.read_uint8(data, file_offset + 0x12)
+            attributes = byte_operations.read_uint8(data, file_offset + 0x13)
+            file_size = byte_operations.read_uint24(data, file_offset + 0x14)
+            file_header_size = 0x18
+            if attributes & 0x01:  # FFS_ATTRIB_LARGE_FILE
+                file_size = byte_operations.read_uint64(data, file_offset + 0x18)
+                file_header_size = 0x20
+            if file_size == 0 or file_type in (0x00, 0xFF) or file_offset + file_size > end:
+                break
+            if file_type != 0xF0:  # EFI_FV_FILETYPE_FFS_PAD
+                result.file_count += 1
+            if file_type == 0x0B:  # EFI_FV_FILETYPE_FIRMWARE_VOLUME_IMAGE
+                nested = _section_volumes(result, data, file_offset + file_header_size, file_offset + file_size)
+                stack.extend((nested_offset, depth + 1) for nested_offset in nested)
+            file_offset = byte_operations.align(volume_offset + header_size, file_offset + file_size, 8)
+    return byte_operations.read_uint32(data, offset + 0x20)
+
+
+def find_volumes(data, ranges: Iterable[Tuple[int, int]]) -> Iterator[Tuple[int, int]]:
+    """Yield (offset, size) of each valid volume header within the (start, end) ranges.
+
+    Volumes are not searched for inside the volumes already found.
+    """
+    for start, end in ranges:
+        position = data.find(b'_FVH', start + 0x28, end)
+        while position != -1:
+            offset = position - 0x28
+            if _is_volume_header(data, offset, end):
+                volume_size = byte_operations.read_uint32(data, offset + 0x20)
+                yield offset, volume_size
+                position = data.find(b'_FVH', offset + max(volume_size, 0x2C), end)
+            else:
+                position = data.find(b'_FVH', position + 4, end)
+
+
+def probe_buffer(data, max_depth: int = DEFAULT_MAX_DEPTH) -> ProbeResult:
+    """Probe an image held in a bytes-like object or mmap.
+
+    Only the loadable segments of ELF (XBL) images are searched. Volumes
+    nested deeper than max_depth raise ValueError, as when parsing.
+    """
+    result = ProbeResult()
+    result.image_size = len(data)
+
+    ranges = elf.search_ranges(data)
+    for offset, _ in find_volumes(data, ranges):
+        result.volumes.append((offset, _walk_volume(result, data, offset, max_depth)))
+
+    result.build_id = find_build_id(data, build_id_ranges(ranges, (offset for offset, _ in result.volumes)))
+    return result
+
+
+def probe(path: str, max_depth: int = DEFAULT_MAX_DEPTH) -> ProbeResult:
+    """Probe an image file through a read-only memory map."""
+    with open(path, 'rb') as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return probe_buffer(b'', max_depth)
+        try:
+            return probe_buffer(data, max_depth)
+        finally:
+            data.close()
@@ -0,0 +1,83 @@
+"""
+Progress reporting, cancellation and timeouts for parses and extractions.
+
+A Monitor is consulted between files and sections while parsing, around
+each decompression, and between files while extracting. It passes a
+ProgressEvent to the progress callback and raises OperationCancelled once
+its CancellationToken is cancelled or its deadline has passed, so a
+long-running worker can stop a job without losing its process. A single
+decompression is not interrupted; cancellation takes effect when it ends.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+class OperationCancelled(Exception):
+    """A parse or extraction was stopped by its cancellation token."""
+
+
+class DeadlineExceeded(OperationCancelled):
+    """A parse or extraction ran past its timeout."""
+
+
+class CancellationToken:
+    """Flag, safe to set from any thread, that stops the operations it is passed to."""
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        """Request that the operations using this token stop."""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """True once cancel has been called."""
+        return self._event.is_set()
+
+
+class ProgressEvent:
+    """Progress of a parse or extraction.
+
+    phase is 'volume' (done/total are bytes of the volume at offset walked
+    so far), 'decompress' (done/total are compressed bytes of the section at
+    offset, reported before and after decoding it) or 'extract' (done/total
+    count output files; offset is None). entries is the number of files
+    parsed or written so far, elapsed the seconds since the operation began.
+    """
+    def __init__(self, phase: str, offset: Optional[int], done: int, total: int, entries: int, elapsed: float):
+        self.phase = phase
+        self.offset = offset
+        self.done = done
+        self.total = total
+        self.entries = entries
+        self.elapsed = elapsed
+
+
+ProgressCallback = Callable[[ProgressEvent], None]
+
+
+class Monitor:
+    """Progress callback, cancellation token and deadline of one operation."""
+    def __init__(self, callback: Optional[ProgressCallback] = None, token: Optional[CancellationToken] = None,
+                 timeout: Optional[float] = None):
+        self.callback = callback
+        self.token = token
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.deadline = self.started + timeout if timeout is not None else None
+
+    def check(self) -> None:
+        """Raise OperationCancelled if the token is cancelled or the deadline has passed."""
+        if self.token is not None and self.token.cancelled:
+            raise OperationCancelled("Operation cancelled")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise DeadlineExceeded(f"Operation exceeded its timeout of {self.timeout} seconds")
+
+    def report(self, phase: str, offset: Optional[int], done: int, total: int, entries: int) -> None:
+        """Pass a ProgressEvent to the callback, checking for cancellation first unless done == total."""
+        if done < total:
+            self.check()
+        if self.callback is not None:
+            self.callback(ProgressEvent(phase, offset, done, total, entries, time.monotonic() - self.started))
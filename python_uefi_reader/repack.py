@@ -0,0 +1,430 @@
+"""
+Firmware volume writer.
+
+Rebuilds the image a UEFI object was parsed from, with the payloads of
+modified sections (see EFISection.modified) written back. Only the files,
+encapsulation sections and volumes that enclose a modified section are
+rebuilt; everything else is copied from the original image byte for byte,
+so unchanged compressed sections are never recompressed.
+
+Changed GUID-defined sections are compressed on an executor (a thread pool
+by default; lzma and zlib release the GIL), so independent sections are
+compressed at the same time. Compressed outputs are kept in a
+CompressionCache keyed by a digest of their input, which can be shared
+between repack calls.
+"""
+
+import os
+import struct
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+from . import byte_operations
+from . import guids
+from . import gzip_helper
+from . import lzma_helper
+
+if TYPE_CHECKING:
+    from concurrent.futures import Executor, Future
+
+# EFI_FFS_VOLUME_TOP_FILE_GUID
+VOLUME_TOP_FILE_GUID = guids.VOLUME_TOP_FILE_GUID
+
+FFS_ATTRIB_LARGE_FILE = 0x01
+FFS_ATTRIB_CHECKSUM = 0x40
+FFS_FIXED_CHECKSUM = 0xAA
+EFI_FVB2_ERASE_POLARITY = 0x800
+
+# FFS_ATTRIB_DATA_ALIGNMENT (bits 3-5) to byte alignment
+FILE_DATA_ALIGNMENTS = [1, 16, 128, 512, 1024, 4 * 1024, 32 * 1024, 64 * 1024]
+
+MAX_SECTION_SIZE = 0xFFFFFF
+
+
+def section_header(section_type: int, payload_size: int) -> bytes:
+    """Return a common section header for a payload of payload_size bytes."""
+    size = payload_size + 4
+    if size > MAX_SECTION_SIZE:
+        raise ValueError(f"Section of 0x{size:X} bytes needs an extended header")
+    return struct.pack('<I', size)[:3] + bytes([section_type])
+
+
+def file_header(original: bytes, body_size: int, body: bytes) -> bytes:
+    """Return original's file header updated for a new body, with checksums recomputed."""
+    header = bytearray(original[:0x18])
+    attributes = header[0x13]
+    size = 0x18 + body_size
+    if size > 0xFFFFFF or attributes & FFS_ATTRIB_LARGE_FILE:
+        attributes |= FFS_ATTRIB_LARGE_FILE
+        header[0x13] = attributes
+        header[0x14:0x17] = b'\xff\xff\xff'
+        size += 8
+        header += struct.pack('<Q', size)
+    else:
+        header[0x14:0x17] = struct.pack('<I', size)[:3]
+
+    # Header checksum covers the header with State and the file checksum as zero
+    state = header[0x17]
+    header[0x10] = 0
+    header[0x11] = 0
+    header[0x17] = 0
+    header[0x10] = byte_operations.calculate_checksum8(bytes(header), 0, len(header))
+    header[0x17] = state
+
+    if attributes & FFS_ATTRIB_CHECKSUM:
+        header[0x11] = byte_operations.calculate_checksum8(body, 0, len(body))
+    else:
+        header[0x11] = FFS_FIXED_CHECKSUM
+    return bytes(header)
+
+
+def pad_file(size: int, erase_byte: int) -> bytes:
+    """Return an EFI_FV_FILETYPE_FFS_PAD file of exactly size bytes."""
+    header = bytearray(b'\xff' * 16 + b'\x00\x00' + bytes([0xF0, 0x00]) + b'\x00\x00\x00\xf8')
+    body = bytes([erase_byte]) * (size - 0x18)
+    return file_header(bytes(header), len(body), body) + body
+
+
+def file_alignment(attributes: int) -> int:
+    """Return the data alignment in bytes encoded in a file's attributes."""
+    return FILE_DATA_ALIGNMENTS[(attributes >> 3) & 0x07]
+
+
+class CompressionCache:
+    """Compressed section bodies keyed by a digest of their input and settings."""
+
+    def __init__(self, algorithm: str = 'sha256'):
+        self.algorithm = algorithm
+        self._entries: Dict[tuple, bytes] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, codec: str, data: bytes, preset: int, properties: Optional[bytes]) -> tuple:
+        """Return the cache key for compressing data with the given settings."""
+        import hashlib
+        return (codec, hashlib.new(self.algorithm, data).digest(), preset, properties)
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        """Return the cached compressed body for key, or None."""
+        return self._entries.get(key)
+
+    def put(self, key: tuple, compressed: bytes):
+        """Store a compressed body."""
+        self._entries[key] = compressed
+
+
+class Repacker:
+    """Rebuilds the volumes of a parsed image that enclose modified sections.
+
+    preset is the LZMA preset; with match_properties, LZMA sections are
+    recompressed with the lc/lp/pb and dictionary size of their original
+    properties header.
+    """
+
+    def __init__(self, uefi, executor: Optional['Executor'] = None, preset: int = 9,
+                 match_properties: bool = True, cache: Optional[CompressionCache] = None):
+        self.uefi = uefi
+        self.executor = executor
+        self.preset = preset
+        self.match_properties = match_properties
+        self.cache = cache if cache is not None else CompressionCache()
+        self._pending: Dict[tuple, 'Future'] = {}
+        self.sections: Dict[Tuple[int, int], object] = {}
+        self.dirty: Set[int] = set()
+        self.dirty_files: Set[Tuple[int, int]] = set()
+        self.root = None
+
+        for efi in uefi.efis:
+            if self.root is None and efi.path:
+                self.root = efi.path[0]
+            for section in efi.section_elements:
+                self.sections[(id(section.container), section.offset)] = section
+                if section.modified:
+                    self.dirty_files.add((id(efi.container), efi.offset))
+                    for container in section.path:
+                        self.dirty.add(id(container))
+                    for container in efi.path:
+                        self.dirty.add(id(container))
+
+        # Map (parent, offset) to the containers found while parsing, and each
+        # parent to the offsets of its dirty children
+        self.containers: Dict[Tuple[int, int], object] = {}
+        self.dirty_children: Dict[int, List[int]] = {}
+        for efi in uefi.efis:
+            for section in efi.section_elements:
+                for container in section.path:
+                    key = (id(container.parent), container.offset)
+                    if key in self.containers:
+                        continue
+                    self.containers[key] = container
+                    if self._is_dirty(container):
+                        self.dirty_children.setdefault(id(container.parent), []).append(container.offset)
+
+    def _is_dirty(self, container) -> bool:
+        return container is not None and id(container) in self.dirty
+
+    def build(self) -> bytes:
+        """Return the image with modified sections written back."""
+        image = self.uefi.image
+        if self.root is None or not self._is_dirty(self.root):
+            return bytes(image)
+
+        own_executor = self.executor is None
+        if own_executor:
+            from concurrent.futures import ThreadPoolExecutor
+            self.executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        try:
+            volume = self.rebuild_volume(image, self.root, grow=False)
+        finally:
+            if own_executor:
+                self.executor.shutdown()
+                self.executor = None
+            self._pending.clear()
+        return bytes(image[:self.root.offset]) + volume + bytes(image[self.root.offset + len(volume):])
+
+    def rebuild_volume(self, data, volume, grow: bool = True) -> bytes:
+        """Rebuild a volume located in data (its region)."""
+        header = bytearray(data[volume.offset:volume.data_offset])
+        attributes = byte_operations.read_uint32(header, 0x2C)
+        erase_byte = 0xFF if attributes & EFI_FVB2_ERASE_POLARITY else 0x00
+        end = volume.data_offset + volume.data_size
+
+        # The extended header (EDK2 GenFv) lives in a pad file that must stay put
+        ext_header_offset = byte_operations.read_uint16(header, 0x34)
+        ext_header = volume.offset + ext_header_offset if ext_header_offset else None
+
+        # Queue the compression of every changed file first, so that sections
+        # of different files are compressed at the same time. Pad files that
+        # hold data are kept at their original offset; erase-filled ones are
+        # alignment padding and regenerated as needed.
+        files = []
+        offset = volume.data_offset
+        while offset + 0x18 <= end:
+            file_type = data[offset + 0x12]
+            file_attributes = data[offset + 0x13]
+            file_size = byte_operations.read_uint24(data, offset + 0x14)
+            file_header_size = 0x18
+            if file_attributes & FFS_ATTRIB_LARGE_FILE:
+                file_size = byte_operations.read_uint64(data, offset + 0x18)
+                file_header_size = 0x20
+            if file_size == 0 or file_type in (0x00, 0xFF) or offset + file_size > end:
+                break
+
+            if file_type == 0xF0:
+                holds_ext_header = ext_header is not None and offset <= ext_header < offset + file_size
+                pad_body = bytes(data[offset + file_header_size:offset + file_size])
+                if holds_ext_header or pad_body.strip(bytes([erase_byte])):
+                    files.append((offset, file_attributes, None, [bytes(data[offset:offset + file_size])], True))
+            elif (id(volume), offset) in self.dirty_files or self._has_dirty_child(volume, offset, file_size):
+                parts = self.rebuild_file(data, volume, offset, file_header_size, file_size)
+                files.append((offset, file_attributes, bytes(data[offset:offset + 0x18]), parts, False))
+            else:
+                files.append((offset, file_attributes, None, [bytes(data[offset:offset + file_size])], False))
+
+            offset = byte_operations.align(volume.data_offset, offset + file_size, 8)
+
+        body = bytearray()
+        top_file = None
+        for offset, file_attributes, original, parts, fixed in files:
+            new_file = self._resolve_file(original, parts) if original is not None else parts[0]
+            if byte_operations.read_guid(data, offset) == VOLUME_TOP_FILE_GUID:
+                top_file = new_file
+            elif fixed:
+                self._place_file(body, offset - volume.data_offset, new_file, erase_byte)
+            else:
+                self._append_file(body, len(header), new_file, file_attributes, erase_byte)
+
+        available = volume.size - len(header)
+        if top_file is not None:
+            # The volume top file ends exactly at the end of the volume
+            gap = available - len(top_file) - len(body)
+            if gap < 0:
+                raise ValueError("Rebuilt volume does not fit its original size")
+            if gap >= 0x18:
+                body += pad_file(gap, erase_byte)
+            else:
+                body += bytes([erase_byte]) * gap
+            body += top_file
+
+        volume_size = len(header) + len(body)
+        if volume_size > volume.size:
+            if not grow:
+                raise ValueError("Rebuilt volume does not fit its original size")
+            volume_size = self._grow_block_map(header, volume_size)
+        else:
+            volume_size = volume.size
+        body += bytes([erase_byte]) * (volume_size - len(header) - len(body))
+
+        struct.pack_into('<Q', header, 0x20, volume_size)
+        byte_operations.write_uint16(header, 0x32, 0)
+        byte_operations.write_uint16(header, 0x32, byte_operations.calculate_checksum16(bytes(header), 0, len(header)))
+        return bytes(header) + bytes(body)
+
+    def _grow_block_map(self, header: bytearray, volume_size: int) -> int:
+        """Grow a single-entry block map to cover volume_size and return the new size."""
+        num_blocks, block_length = struct.unpack_from('<II', header, 0x38)
+        if block_length == 0:
+            # No block map to maintain
+            return byte_operations.align(0, volume_size, 8)
+        if struct.unpack_from('<II', header, 0x40) != (0, 0):
+            raise ValueError("Cannot grow a volume with a multi-entry block map")
+        num_blocks = (volume_size + block_length - 1) // block_length
+        struct.pack_into('<I', header, 0x38, num_blocks)
+        return num_blocks * block_length
+
+    def _append_file(self, body: bytearray, header_size: int, new_file: bytes, attributes: int, erase_byte: int):
+        """Append a file at 8-byte alignment, inserting a pad file so its data meets its alignment."""
+        body += bytes([erase_byte]) * (byte_operations.align(0, len(body), 8) - len(body))
+        alignment = file_alignment(attributes)
+        if alignment > 8:
+            # File data alignment is relative to the start of the volume
+            file_header_size = 0x20 if new_file[0x13] & FFS_ATTRIB_LARGE_FILE else 0x18
+            data_start = header_size + len(body) + file_header_size
+            padding = (alignment - data_start % alignment) % alignment
+            if padding:
+                while padding < 0x18:
+                    padding += alignment
+                body += pad_file(padding, erase_byte)
+        body += new_file
+
+    def _place_file(self, body: bytearray, position: int, new_file: bytes, erase_byte: int):
+        """Append a file at position in the volume body, padding the space before it."""
+        body += bytes([erase_byte]) * (byte_operations.align(0, len(body), 8) - len(body))
+        gap = position - len(body)
+        if gap < 0 or 0 < gap < 0x18:
+            raise ValueError(f"Rebuilt files do not fit before the pad file at 0x{position:X}")
+        if gap:
+            body += pad_file(gap, erase_byte)
+        body += new_file
+
+    def _has_dirty_child(self, volume, offset: int, file_size: int) -> bool:
+        """True if a nested volume or encapsulation section inside the file is dirty."""
+        return any(offset <= child < offset + file_size for child in self.dirty_children.get(id(volume), ()))
+
+    def rebuild_file(self, data, volume, offset: int, file_header_size: int, file_size: int) -> list:
+        """Start rebuilding one file whose sections (or nested volumes) changed.
+
+        Returns the parts of the new file body; see _resolve_file.
+        """
+        body_start = offset + file_header_size
+        file_type = data[offset + 0x12]
+        if file_type == 0x01:  # EFI_FV_FILETYPE_RAW
+            section = self.sections.get((id(volume), body_start))
+            return [section.decompressed_image if section is not None else bytes(data[body_start:offset + file_size])]
+        return self.rebuild_sections(data, volume, body_start, offset + file_size)
+
+    def _resolve_file(self, original: bytes, parts: list) -> bytes:
+        """Wait for the parts of a file body and return the complete file."""
+        body = _join_sections(parts)
+        return file_header(original, len(body), body) + body
+
+    def rebuild_sections(self, data, container, start: int, end: int) -> list:
+        """Rebuild the section stream data[start:end] of a container's region.
+
+        Returns one part per section: its bytes, or a Future of them while
+        the section is being compressed.
+        """
+        parts = []
+        offset = start
+        while offset + 4 <= end:
+            section_size = byte_operations.read_uint24(data, offset)
+            section_type = data[offset + 3]
+            if section_size == 0 or section_type in (0x00, 0xFF) or offset + section_size > end:
+                break
+
+            if section_type == 0x02:  # EFI_SECTION_GUID_DEFINED
+                parts.append(self.rebuild_guid_defined_section(data, container, offset, section_size))
+            elif section_type == 0x17:  # EFI_SECTION_FIRMWARE_VOLUME_IMAGE
+                section = self.sections.get((id(container), offset))
+                nested = self.containers.get((id(container), offset + 4))
+                if section is not None and section.modified:
+                    payload = section.decompressed_image
+                    parts.append(section_header(section_type, len(payload)) + payload)
+                elif self._is_dirty(nested):
+                    volume = self.rebuild_volume(data, nested)
+                    parts.append(section_header(section_type, len(volume)) + volume)
+                else:
+                    parts.append(bytes(data[offset:offset + section_size]))
+            else:
+                section = self.sections.get((id(container), offset))
+                if section is not None and section.modified:
+                    payload = section.decompressed_image
+                    parts.append(section_header(section_type, len(payload)) + payload)
+                else:
+                    parts.append(bytes(data[offset:offset + section_size]))
+
+            offset = byte_operations.align(start, offset + section_size, 4)
+        return parts
+
+    def rebuild_guid_defined_section(self, data, container, offset: int, section_size: int):
+        """Rebuild a GUID-defined section, recompressing only if its contents changed.
+
+        The compression itself is queued on the executor; a Future is returned
+        unless the section is unchanged or its compressed form is cached.
+        """
+        encapsulation = self.containers.get((id(container), offset))
+        if not self._is_dirty(encapsulation):
+            return bytes(data[offset:offset + section_size])
+
+        header_size = byte_operations.read_uint16(data, offset + 0x14)
+        compressed_offset = offset + header_size
+        compressed_size = section_size - header_size
+        properties = None
+        if encapsulation.type == 'LZMA':
+            decompressed = lzma_helper.decompress(data, compressed_offset, compressed_size)
+            if self.match_properties:
+                properties = bytes(data[compressed_offset:compressed_offset + 5])
+        else:
+            decompressed = gzip_helper.decompress(data, compressed_offset, compressed_size)
+
+        # Inner sections must be complete before the enclosing one is compressed
+        inner = _join_sections(self.rebuild_sections(decompressed, encapsulation, 0, len(decompressed)))
+        header = bytes(data[offset:compressed_offset])
+        key = self.cache.key(encapsulation.type, inner, self.preset, properties)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return _guid_defined_section(header, cached)
+        if key in self._pending:
+            return self._pending[key]
+
+        future = self.executor.submit(_compress_section, header, encapsulation.type, inner, self.preset, properties)
+        future.add_done_callback(lambda done: self._store(key, len(header), done))
+        self._pending[key] = future
+        return future
+
+    def _store(self, key: tuple, header_size: int, future: 'Future'):
+        """Cache the body of a finished compression."""
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result()[header_size:])
+
+
+def _join_sections(parts: list) -> bytes:
+    """Concatenate section parts at 4-byte alignment, waiting for pending ones."""
+    output = bytearray()
+    for part in parts:
+        output += b'\x00' * (byte_operations.align(0, len(output), 4) - len(output))
+        output += part if isinstance(part, bytes) else part.result()
+    return bytes(output)
+
+
+def _guid_defined_section(header: bytes, compressed: bytes) -> bytes:
+    """Return a GUID-defined section from its original header and a new body."""
+    header = bytearray(header)
+    header[0:3] = section_header(0x02, len(header) - 4 + len(compressed))[:3]
+    return bytes(header) + compressed
+
+
+def _compress_section(header: bytes, codec: str, inner: bytes, preset: int,
+                      properties: Optional[bytes]) -> bytes:
+    """Compress a section stream into a GUID-defined section (runs in a worker)."""
+    if codec == 'LZMA':
+        compressed = lzma_helper.compress(inner, 0, len(inner), preset, properties)
+    else:
+        compressed = gzip_helper.compress(inner, 0, len(inner))
+    return _guid_defined_section(header, compressed)
+
+
+def repack(uefi, executor: Optional['Executor'] = None, preset: int = 9, match_properties: bool = True,
+           cache: Optional[CompressionCache] = None) -> bytes:
+    """Return the image of uefi with modified sections written back."""
+    return Repacker(uefi, executor, preset, match_properties, cache).build()
@@ -0,0 +1,232 @@
+"""
+Shared-memory handoff of parse results between processes.
+
+Returning a UEFI object from a worker process pickles every section payload
+and copies it through a pipe. share writes the image and the payloads into
+one multiprocessing.shared_memory segment instead, and pickles the parsed
+tree with each section holding only the offset and length of its payload.
+SharedResult.open attaches the segment in the receiving process; section
+payloads are then read from it on access, like payloads spilled under a
+memory budget (see spill), and uefi.image is a read-only memoryview of it
+rather than a copy.
+
+The segment belongs to the process that opens the result and is removed by
+uefi.close() or uefi.shared.close(), which also releases uefi.image. Shared
+memory requires Python 3.8 or later; this module is only imported on use,
+so earlier versions get a ValueError from share and SharedResult.open. On
+Windows a segment does not outlive its last handle, so it must be opened
+while the worker is still alive.
+"""
+
+import io
+import pickle
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .uefi import UEFI
+
+# Persistent IDs of the objects not pickled with the tree
+_IMAGE = 'image'
+_STORE = 'store'
+_MONITOR = 'monitor'
+
+# Stands in for the SharedPayloads of the receiving process in pickled sections
+_STORE_MARKER = object()
+
+
+def _shared_memory():
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise ValueError("Shared memory results require Python 3.8 or later") from None
+    return shared_memory
+
+
+class SharedPayloads:
+    """Section payloads and image bytes in an attached shared memory segment."""
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self._memory = _shared_memory().SharedMemory(name)
+        self._views: List[memoryview] = []
+
+    def load(self, spilled: Tuple[int, int]) -> bytes:
+        """Copy a payload out of the segment."""
+        if self._memory is None:
+            raise ValueError("Shared payloads are closed")
+        offset, size = spilled
+        return bytes(self._memory.buf[offset:offset + size])
+
+    def view(self, offset: int, size: int) -> memoryview:
+        """Return a read-only view of part of the segment, valid until close."""
+        if self._memory is None:
+            raise ValueError("Shared payloads are closed")
+        view = self._memory.buf[offset:offset + size].toreadonly()
+        self._views.append(view)
+        return view
+
+    def admit(self, section) -> None:
+        """Keep a replaced payload in memory; it no longer refers to the segment."""
+        section._store = None
+        section._spilled = None
+
+    def close(self) -> None:
+        """Detach and remove the segment; shared payloads and views can no longer be read.
+
+        Raises ValueError, leaving the segment attached, while slices taken
+        from a view (such as uefi.image[a:b]) are still alive.
+        """
+        if self._memory is not None:
+            for view in self._views:
+                view.release()
+            self._views = []
+            try:
+                self._memory.close()
+            except BufferError:
+                raise ValueError("Shared memory is still referenced by slices of uefi.image") from None
+            self._memory.unlink()
+            self._memory = None
+
+
+class _TreePickler(pickle.Pickler):
+    """Pickles a parsed image with section payloads replaced by segment references."""
+
+    def __init__(self, file, uefi: 'UEFI', placements: Dict[int, Tuple[int, int]]):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._uefi = uefi
+        self._placements = placements
+
+    def persistent_id(self, obj):
+        if obj is self._uefi.image:
+            return _IMAGE
+        if obj is _STORE_MARKER:
+            return _STORE
+        if obj is self._uefi._monitor:
+            return _MONITOR
+        return None
+
+    def reducer_override(self, obj):
+        from .uefi import EFISection, UEFI
+        if isinstance(obj, EFISection):
+            state = obj.__dict__.copy()
+            state['_decompressed_image'] = None
+            state['_spilled'] = self._placements[id(obj)]
+            state['_store'] = _STORE_MARKER
+            return _new, (EFISection, state)
+        if obj is self._uefi:
+            state = obj.__dict__.copy()
+            # Built again on demand; its compiled expressions cannot be pickled
+            state['_dependency_graph'] = None
+            state['payloads'] = None
+            return _new, (UEFI, state)
+        return NotImplemented
+
+
+class _TreeUnpickler(pickle.Unpickler):
+    def __init__(self, file, payloads: SharedPayloads, image_size: int):
+        super().__init__(file)
+        self._payloads = payloads
+        self._image_size = image_size
+
+    def persistent_load(self, pid):
+        if pid == _IMAGE:
+            return self._payloads.view(0, self._image_size)
+        if pid == _STORE:
+            return self._payloads
+        from .progress import Monitor
+        return Monitor()
+
+
+def _new(cls, state: dict):
+    obj = cls.__new__(cls)
+    obj.__dict__.update(state)
+    return obj
+
+
+class SharedResult:
+    """A parsed image handed over through shared memory; pickle it to the receiving process."""
+
+    def __init__(self, name: str, size: int, image_size: int, tree: bytes):
+        self.name = name
+        self.size = size
+        self.image_size = image_size
+        self.tree = tree
+
+    def open(self) -> 'UEFI':
+        """Attach the segment and return the parsed image, with uefi.shared owning the segment."""
+        payloads = SharedPayloads(self.name, self.size)
+        try:
+            uefi = _TreeUnpickler(io.BytesIO(self.tree), payloads, self.image_size).load()
+        except Exception:
+            payloads.close()
+            raise
+        uefi.shared = payloads
+        return uefi
+
+
+def share(uefi: 'UEFI') -> SharedResult:
+    """Copy the image and section payloads of uefi into a new shared memory segment.
+
+    uefi itself is left unchanged. The segment is not removed when this
+    process exits; the process that opens the result owns it.
+    """
+    shared_memory = _shared_memory()
+    # Lay out the payloads first, so spilled payloads are read one at a time while copying
+    placements: Dict[int, Tuple[int, int]] = {}
+    sections = []
+    end = len(uefi.image)
+    for efi in uefi.efis:
+        for section in efi.section_elements:
+            if id(section) not in placements:
+                size = section._spilled[1] if section._spilled is not None else len(section._decompressed_image or b'')
+                placements[id(section)] = (end, size)
+                sections.append(section)
+                end += size
+
+    memory = shared_memory.SharedMemory(create=True, size=max(end, 1))
+    try:
+        memory.buf[:len(uefi.image)] = uefi.image
+        for section in sections:
+            offset, size = placements[id(section)]
+            if size:
+                memory.buf[offset:offset + size] = section.decompressed_image
+        tree = io.BytesIO()
+        _TreePickler(tree, uefi, placements).dump(uefi)
+    except BaseException:
+        memory.close()
+        memory.unlink()
+        raise
+    _untrack(memory)
+    memory.close()
+    return SharedResult(memory.name, end, len(uefi.image), tree.getvalue())
+
+
+def _untrack(memory) -> None:
+    """Hand ownership of a segment to the receiving process.
+
+    Without this, the resource tracker of this process would remove the
+    segment when this process exits.
+    """
+    try:
+        from multiprocessing import resource_tracker
+    except ImportError:
+        return
+    try:
+        resource_tracker.unregister(memory._name, 'shared_memory')
+    except Exception:
+        pass
+
+
+def parse_file(path: str, **options) -> SharedResult:
+    """Parse the image at path and share the result; a worker function for process pools.
+
+    options are passed to UEFI; verbose defaults to False. The parsed image
+    is closed once shared, so a spill file does not outlive the task.
+    """
+    from .uefi import UEFI
+    options.setdefault('verbose', False)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with UEFI(data, **options) as uefi:
+        return share(uefi)
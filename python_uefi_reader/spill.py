@@ -0,0 +1,84 @@
+"""
+Memory budget for decompressed section payloads.
+
+A PayloadStore keeps section payloads in memory up to a byte budget. Once
+the budget is exceeded, the payloads admitted first are written to a single
+scratch temp file and dropped from memory. EFISection.decompressed_image
+reads a spilled payload back from the file whenever it is accessed, so only
+the payloads callers are holding stay in memory. close (or UEFI.close)
+deletes the file; otherwise it goes when the store is garbage collected.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class PayloadStore:
+    """Section payloads held in memory up to budget bytes, the rest in a scratch file."""
+
+    def __init__(self, budget: int, directory: Optional[str] = None):
+        if budget < 0:
+            raise ValueError("Memory budget must not be negative")
+        self.budget = budget
+        self.directory = directory
+        self.resident_bytes = 0
+        self.spilled_bytes = 0
+        self._resident: 'OrderedDict[int, Tuple[object, int]]' = OrderedDict()
+        self._file = None
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def admit(self, section) -> None:
+        """Account for the in-memory payload of section, spilling older payloads over budget."""
+        payload = section._decompressed_image
+        with self._lock:
+            previous = self._resident.pop(id(section), None)
+            if previous is not None:
+                self.resident_bytes -= previous[1]
+            section._store = self
+            section._spilled = None
+            if payload is None:
+                return
+            self._resident[id(section)] = (section, len(payload))
+            self.resident_bytes += len(payload)
+            while self.resident_bytes > self.budget and self._resident:
+                _, (oldest, size) = self._resident.popitem(last=False)
+                oldest._spilled = self._write(oldest._decompressed_image)
+                oldest._decompressed_image = None
+                self.resident_bytes -= size
+                self.spilled_bytes += size
+
+    def _write(self, payload) -> Tuple[int, int]:
+        if self._file is None:
+            import tempfile
+            self._file = tempfile.TemporaryFile(prefix='uefireader-', dir=self.directory)
+        offset = self._end
+        self._file.seek(offset)
+        self._file.write(payload)
+        self._file.flush()
+        self._end += len(payload)
+        return offset, len(payload)
+
+    def load(self, spilled: Tuple[int, int]) -> bytes:
+        """Read a spilled payload back from the scratch file."""
+        offset, size = spilled
+        if self._file is None:
+            raise ValueError("Payload store is closed")
+        if hasattr(os, 'pread'):
+            data = os.pread(self._file.fileno(), size, offset)
+        else:
+            with self._lock:
+                self._file.seek(offset)
+                data = self._file.read(size)
+        if len(data) != size:
+            raise ValueError("Scratch file is truncated")
+        return data
+
+    def close(self) -> None:
+        """Delete the scratch file; spilled payloads can no longer be read."""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
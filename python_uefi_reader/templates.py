@@ -0,0 +1,145 @@
+"""
+Text output of extract_uefi.
+
+Extraction first builds a module table (one ModuleEntry per extracted file);
+the .inf files, the DXE/APRIORI include lists and the JSON/CSV manifests are
+all rendered from that table with the templates below. The generation
+timestamp is formatted once per run and passed in, so pinning it gives
+byte-identical output.
+"""
+
+import io
+import os
+import uuid
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+from .guids import format_guid
+
+if TYPE_CHECKING:
+    from datetime import datetime
+
+MANIFEST_FORMATS = ('json', 'csv')
+
+RULE = "# ****************************************************************************\n"
+
+INF_HEADER = (
+    RULE +
+    "# AUTOGENERATED BY UEFIReader\n"
+    "# AUTOGENED AS {module_name}.inf\n"
+    "# DO NOT MODIFY\n"
+    "# GENERATED ON: {timestamp}Z\n"
+    "\n"
+    "[Defines]\n"
+    "  INF_VERSION    = 0x0001001B\n"
+    "  BASE_NAME      = {base_name}\n"
+    "  FILE_GUID      = {guid}\n"
+    "  MODULE_TYPE    = {module_type}\n"
+    "  VERSION_STRING = 1.0\n"
+)
+INF_ENTRY_POINT = "  ENTRY_POINT    = EfiEntry\n"
+INF_BINARIES = "\n[Binaries.AARCH64]"
+INF_BINARY = "\n   {section_type}|{file_name}|*"
+INF_DEPEX = "[Depex]\n  TRUE\n"
+INF_FOOTER = "# AUTOGEN ENDS\n" + RULE
+
+MANIFEST_FIELDS = ('guid', 'kind', 'type', 'name', 'module_name', 'module_type', 'inf', 'files', 'apriori')
+
+
+def format_timestamp(timestamp: 'datetime') -> str:
+    """Format the generation timestamp written into .inf headers."""
+    return timestamp.strftime('%Y-%m-%d %H:%M:%S')
+
+
+class ModuleEntry:
+    """One extracted file: an INF module, a FREEFORM file or a raw file."""
+    def __init__(self, guid: uuid.UUID, kind: str, file_type: str):
+        self.guid = guid
+        self.kind = kind
+        self.type = file_type
+        self.name: str = ""
+        self.module_name: str = ""
+        self.module_type: str = ""
+        self.inf: Optional[str] = None
+        self.has_depex: bool = False
+        self.apriori: bool = False
+        # (section type, file name, path relative to the output root) of each payload
+        self.files: List[Tuple[str, str, str]] = []
+        # (section type, value) of each SECTION line of a FREEFORM file
+        self.load_sections: List[Tuple[str, str]] = []
+
+
+def render_inf(entry: ModuleEntry, timestamp: str) -> str:
+    """Render the .inf file of an INF module."""
+    parts = [INF_HEADER.format(module_name=entry.module_name, timestamp=timestamp, base_name=entry.name,
+                               guid=format_guid(entry.guid), module_type=entry.module_type)]
+    if entry.has_depex:
+        parts.append(INF_ENTRY_POINT)
+    parts.append(INF_BINARIES)
+    parts.extend(INF_BINARY.format(section_type=section_type, file_name=file_name)
+                 for section_type, file_name, _ in entry.files)
+    parts.append("\n\n")
+    if entry.has_depex:
+        parts.append(INF_DEPEX)
+    parts.append(INF_FOOTER)
+    return ''.join(parts)
+
+
+def render_dsc_include(entries: Iterable[ModuleEntry]) -> str:
+    """Render DXE.dsc.inc, the list of INF modules."""
+    return '\n'.join(entry.inf for entry in entries if entry.kind == 'INF')
+
+
+def render_load_list(entries: Iterable[ModuleEntry]) -> str:
+    """Render DXE.inc, the FDF load list of INF modules and FREEFORM files."""
+    lines = []
+    for entry in entries:
+        if entry.kind == 'INF':
+            lines.append(f"INF {entry.inf}")
+        elif entry.kind == 'FREEFORM':
+            lines.append("")
+            lines.append(f"FILE FREEFORM = {format_guid(entry.guid)} {{")
+            lines.extend(f"    SECTION {section_type} = {value}" for section_type, value in entry.load_sections)
+            lines.append("}")
+            lines.append("")
+    return '\n'.join(lines)
+
+
+def render_apriori(entries: Iterable[ModuleEntry]) -> str:
+    """Render APRIORI.inc: the INF modules listed in the APRIORI file, in image file order, not load order."""
+    lines = ["APRIORI DXE {"]
+    lines.extend(f"    INF {entry.inf}" for entry in entries if entry.kind == 'INF' and entry.apriori)
+    lines.append("}")
+    return '\n'.join(lines)
+
+
+def _manifest_row(entry: ModuleEntry) -> dict:
+    return {
+        'guid': format_guid(entry.guid),
+        'kind': entry.kind,
+        'type': entry.type,
+        'name': entry.name,
+        'module_name': entry.module_name,
+        'module_type': entry.module_type,
+        'inf': entry.inf,
+        'files': [path.replace(os.sep, '/') for _, _, path in entry.files],
+        'apriori': entry.apriori,
+    }
+
+
+def render_manifest(entries: Iterable[ModuleEntry], manifest_format: str) -> str:
+    """Render the module table as a JSON or CSV manifest."""
+    rows = [_manifest_row(entry) for entry in entries]
+    if manifest_format == 'json':
+        import json
+        return json.dumps(rows, indent=2) + '\n'
+    if manifest_format == 'csv':
+        import csv
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=MANIFEST_FIELDS, lineterminator='\n')
+        writer.writeheader()
+        for row in rows:
+            row['files'] = ';'.join(row['files'])
+            row['inf'] = row['inf'] or ''
+            writer.writerow(row)
+        return text.getvalue()
+    raise ValueError(f"Unsupported manifest format: {manifest_format}")
@@ -21,14 +21,136 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import os
-import re
 import sys
 import uuid
-from datetime import datetime
-from typing import List, Tuple, Optional
+from typing import TYPE_CHECKING, Callable, Iterator, List, Sequence, TextIO, Tuple, Optional, Union
 from . import byte_operations
+from . import guids
 from . import gzip_helper
 from . import lzma_helper
+from .index import UEFIIndex
+from .limits import DEFAULT_MAX_DEPTH, DEFAULT_MAX_IMAGE_SIZE, DEFAULT_MAX_SECTION_SIZE, DecompressionLimitError
+from .progress import CancellationToken, Monitor, ProgressCallback
+
+# Everything else is imported where it is used, to keep the command line and
+# the daemon client fast to start (see tests/test_startup.py)
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+    from datetime import datetime
+    from .blob_store import BlobStore
+    from .depex import DependencyGraph
+    from .diff import ImageDiff
+    from .elf import ElfSegment
+    from .index_file import IndexFile
+    from .output import ArchiveOutput, DirectoryOutput
+    from .pe import ImageInfo
+    from .probe import ProbeResult
+    from .repack import CompressionCache
+    from .shared import SharedPayloads, SharedResult
+    from .spill import PayloadStore
+    from .templates import ModuleEntry
+
+# Raw GUID bytes compared in the parse loops
+APRIORI_GUID_BYTES = guids.DXE_APRIORI_GUID.raw
+LZMA_GUID_BYTES = (guids.LZMA_CUSTOM_DECOMPRESS_GUID.raw, guids.LZMA_ALTERNATE_DECOMPRESS_GUID.raw)
+GZIP_GUID_BYTES = guids.GZIP_DECOMPRESS_GUID.raw
+
+# Section types whose payload is a PE32/PE32+ or TE image
+IMAGE_SECTION_TYPES = ('PE32', 'TE')
+
+# Build paths embedded in PE32 images; compiled on first use
+_build_path_pattern = None
+
+# INF MODULE_TYPE of file types whose name differs from the file type
+MODULE_TYPES = {
+    'APPLICATION': 'UEFI_APPLICATION',
+    'DRIVER': 'DXE_DRIVER',
+    'SECURITY_CORE': 'SEC',
+}
+
+# Extension of extracted payloads by section type; others use the lowercase type
+SECTION_EXTENSIONS = {
+    'PE32': 'efi',
+    'DXE_DEPEX': 'depex',
+}
+
+
+def _monitored(monitor: Monitor, index: int, count: int, data) -> Callable:
+    """Wrap an output file's data so that writing it reports extract progress first."""
+    def read():
+        monitor.report('extract', None, index, count, index)
+        return data() if callable(data) else data
+    return read
+
+
+def _running_loop():
+    """Return the event loop of the calling coroutine."""
+    import asyncio
+    # get_running_loop is new in Python 3.7; inside a coroutine get_event_loop returns the same loop
+    get_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+    return get_loop()
+
+
+def _advance(iterator: Iterator, count: int) -> bool:
+    """Consume up to count items; return False once the iterator is exhausted."""
+    for _ in range(count):
+        if next(iterator, None) is None:
+            return False
+    return True
+
+
+class EFIContainer:
+    """Represents a firmware volume or encapsulation section holding EFI files."""
+    def __init__(self):
+        self.type: Optional[str] = None
+        self.guid: Optional[uuid.UUID] = None
+        self.offset: int = 0
+        self.size: int = 0
+        self.data_offset: int = 0
+        self.data_size: int = 0
+        self.parent: Optional['EFIContainer'] = None
+        self.digest: Optional[str] = None
+        self.decompressed_digest: Optional[str] = None
+
+    @property
+    def is_encapsulation(self) -> bool:
+        """True if the container holds decompressed data rather than a view of its parent."""
+        return self.type != 'FV'
+
+    @property
+    def region(self) -> Optional['EFIContainer']:
+        """Nearest encapsulation container whose decompressed data offsets are relative to."""
+        container = self
+        while container is not None and not container.is_encapsulation:
+            container = container.parent
+        return container
+
+    @property
+    def path(self) -> Tuple['EFIContainer', ...]:
+        """Containers from the outermost volume down to this one."""
+        path = []
+        container = self
+        while container is not None:
+            path.append(container)
+            container = container.parent
+        return tuple(reversed(path))
+
+
+class WorkItem:
+    """A pending buffer view for the volume walker.
+    
+    offset is where walking resumes within data, base is the alignment base
+    used for the buffer, origin is the offset of data[0] within its region,
+    and depth is the nesting level, 0 for the outermost volume.
+    """
+    def __init__(self, data: memoryview, offset: int, base: int, origin: int,
+                 container: Optional[EFIContainer], depth: int):
+        self.data = data
+        self.offset = offset
+        self.base = base
+        self.origin = origin
+        self.container = container
+        self.depth = depth
 
 
 class EFISection:
@@ -36,7 +158,63 @@ class EFISection:
     def __init__(self):
         self.name: Optional[str] = None
         self.type: Optional[str] = None
-        self.decompressed_image: Optional[bytes] = None
+        self._decompressed_image: Optional[bytes] = None
+        self.modified: bool = False
+        self.offset: int = 0
+        self.size: int = 0
+        self.header_size: int = 0
+        self.container: Optional[EFIContainer] = None
+        self.depth: int = 0
+        self.digest: Optional[str] = None
+        self.compressed_digest: Optional[str] = None
+        self._image_info: Optional['ImageInfo'] = None
+        self._image_info_read: bool = False
+        # Set once the payload is accounted in a PayloadStore or SharedPayloads; _spilled is its place there
+        self._store: Optional[Union['PayloadStore', 'SharedPayloads']] = None
+        self._spilled: Optional[Tuple[int, int]] = None
+
+    @property
+    def decompressed_image(self) -> Optional[bytes]:
+        """Section payload; assigning a new payload marks the section as modified.
+
+        A payload spilled under a memory budget, or held in shared memory,
+        is read back on each access.
+        """
+        if self._spilled is not None:
+            return self._store.load(self._spilled)
+        return self._decompressed_image
+
+    @decompressed_image.setter
+    def decompressed_image(self, value: Optional[bytes]):
+        self._decompressed_image = value
+        self._spilled = None
+        self._image_info_read = False
+        self.modified = True
+        if self._store is not None:
+            self._store.admit(self)
+
+    @property
+    def image_info(self) -> Optional['ImageInfo']:
+        """PE/TE header metadata of a PE32 or TE section, decoded on first access (see pe).
+
+        None for other sections and for payloads without valid image headers.
+        """
+        if not self._image_info_read:
+            self._image_info_read = True
+            self._image_info = None
+            payload = self.decompressed_image if self.type in IMAGE_SECTION_TYPES else None
+            if payload is not None:
+                from . import pe
+                try:
+                    self._image_info = pe.analyze(payload)
+                except ValueError:
+                    pass
+        return self._image_info
+
+    @property
+    def path(self) -> Tuple[EFIContainer, ...]:
+        """Containers enclosing this section, outermost first."""
+        return self.container.path if self.container is not None else ()
 
 
 class EFI:
@@ -45,57 +223,350 @@ class EFI:
         self.guid: Optional[uuid.UUID] = None
         self.type: Optional[str] = None
         self.section_elements: List[EFISection] = []
+        self.offset: int = 0
+        self.size: int = 0
+        self.header_size: int = 0
+        self.container: Optional[EFIContainer] = None
+        self.digest: Optional[str] = None
+
+    @property
+    def path(self) -> Tuple[EFIContainer, ...]:
+        """Containers enclosing this file, outermost first."""
+        return self.container.path if self.container is not None else ()
 
 
 class UEFI:
     """Main UEFI parser class."""
     
-    def __init__(self, uefi_binary: bytes, verbose: bool = True):
+    def __init__(self, uefi_binary: bytes, verbose: bool = True, max_depth: int = DEFAULT_MAX_DEPTH,
+                 hash_algorithm: Optional[str] = None, memory_budget: Optional[int] = None,
+                 max_section_size: Optional[int] = DEFAULT_MAX_SECTION_SIZE,
+                 max_image_size: Optional[int] = DEFAULT_MAX_IMAGE_SIZE, tolerant: bool = False,
+                 progress: Optional[ProgressCallback] = None, cancel: Optional[CancellationToken] = None,
+                 timeout: Optional[float] = None):
+        """Parse uefi_binary.
+        
+        When hash_algorithm (a hashlib name such as 'sha256' or 'blake2b') is
+        given, every file, section and encapsulation gets a hex digest,
+        computed while its bytes are materialized.
+        
+        When memory_budget is given, section payloads beyond that many bytes
+        are spilled to a scratch temp file and read back on access (see spill);
+        close, or use the object as a context manager, to delete the file.
+        
+        max_section_size and max_image_size cap the bytes decompressed from
+        one GUID-defined section and from the whole image (None for no
+        limit); exceeding either raises DecompressionLimitError before the
+        excess is produced. With tolerant, GUID-defined sections that are too
+        large, too deep or fail to decode are skipped and recorded in errors
+        instead.
+        
+        progress is called with a ProgressEvent per file and around each
+        decompression. Between files and sections the parse raises
+        OperationCancelled once cancel is cancelled, or DeadlineExceeded
+        after timeout seconds (see progress).
+        """
+        for _ in self._parse(uefi_binary, verbose, max_depth, hash_algorithm, memory_budget,
+                             max_section_size, max_image_size, tolerant, Monitor(progress, cancel, timeout)):
+            pass
+    
+    def _parse(self, uefi_binary: bytes, verbose: bool, max_depth: int,
+               hash_algorithm: Optional[str] = None, memory_budget: Optional[int] = None,
+               max_section_size: Optional[int] = DEFAULT_MAX_SECTION_SIZE,
+               max_image_size: Optional[int] = DEFAULT_MAX_IMAGE_SIZE, tolerant: bool = False,
+               monitor: Optional[Monitor] = None) -> Iterator[EFI]:
+        """Parse uefi_binary into this object, yielding each file as it is added."""
         self.efis: List[EFI] = []
         self.load_priority: set = set()
+        self.apriori_order: List[uuid.UUID] = []
+        self._dependency_graph: Optional['DependencyGraph'] = None
         self.build_id: str = ""
         self.verbose = verbose
+        self.max_depth = max_depth
+        self.hash_algorithm = hash_algorithm
+        self.image_size = len(uefi_binary)
+        self.index = UEFIIndex()
+        self.image = uefi_binary
+        self.payloads: Optional['PayloadStore'] = None
+        if memory_budget is not None:
+            from .spill import PayloadStore
+            self.payloads = PayloadStore(memory_budget)
+        # Segment holding the payloads of a result received through shared memory (see shared)
+        self.shared: Optional['SharedPayloads'] = None
+        self.max_section_size = max_section_size
+        self.max_image_size = max_image_size
+        self.decompressed_bytes = 0
+        self.tolerant = tolerant
+        # (offset, error) of each GUID-defined section skipped in tolerant mode
+        self.errors: List[Tuple[int, ValueError]] = []
+        self._monitor = monitor if monitor is not None else Monitor()
         
-        # Find UEFI volume header
-        offset = byte_operations.find_ascii(uefi_binary, "_FVH")
-        if offset is None:
-            raise ValueError("Invalid UEFI image format")
+        # Program headers of XBL (ELF) images; empty for raw volumes
+        self.segments: List['ElfSegment'] = []
+        ranges = [(0, len(uefi_binary))]
+        from . import elf
+        from . import probe as probe_module
         
-        volume_header_offset = offset - 0x28
+        # Find UEFI volume header
+        if elf.is_elf(uefi_binary):
+            try:
+                self.segments = elf.read_segments(uefi_binary)
+                ranges = elf.loadable_ranges(self.segments)
+            except ValueError as e:
+                self._log(f"Warning: {e}, searching the whole image")
+            # Only the loadable segments are searched, and unverified headers are skipped
+            volume = next(probe_module.find_volumes(uefi_binary, ranges), None)
+            if volume is None:
+                raise ValueError("No firmware volume in the ELF image")
+            volume_header_offset = volume[0]
+        else:
+            offset = byte_operations.find_ascii(uefi_binary, "_FVH")
+            if offset is None:
+                raise ValueError("Invalid UEFI image format")
+            
+            volume_header_offset = offset - 0x28
         
         # Parse the volume
-        self.efis.extend(self._handle_volume_image(uefi_binary, volume_header_offset))
+        for efi in self._walk_volume(uefi_binary, volume_header_offset):
+            self.efis.append(efi)
+            self.index.add(efi)
+            yield efi
         
         # Try to get build ID
-        build_ids = self._try_get_build_path(uefi_binary)
-        if len(build_ids) > 0:
-            self.build_id = build_ids[0]
+        self.build_id = probe_module.find_build_id(
+            uefi_binary, probe_module.build_id_ranges(ranges, (volume_header_offset,)))
+    
+    @classmethod
+    def write_inventory(cls, uefi_binary: bytes, stream: TextIO, max_depth: int = DEFAULT_MAX_DEPTH,
+                        hash_algorithm: Optional[str] = None,
+                        max_section_size: Optional[int] = DEFAULT_MAX_SECTION_SIZE,
+                        max_image_size: Optional[int] = DEFAULT_MAX_IMAGE_SIZE, tolerant: bool = False,
+                        progress: Optional[ProgressCallback] = None, cancel: Optional[CancellationToken] = None,
+                        timeout: Optional[float] = None) -> 'UEFI':
+        """Parse uefi_binary, writing an NDJSON inventory to stream as each file is parsed (see inventory)."""
+        from . import inventory
+        uefi = cls.__new__(cls)
+        for efi in uefi._parse(uefi_binary, False, max_depth, hash_algorithm, None,
+                               max_section_size, max_image_size, tolerant, Monitor(progress, cancel, timeout)):
+            uefi._write_file_records(stream, efi)
+        inventory.write_record(stream, inventory.image_record(uefi))
+        stream.flush()
+        return uefi
+    
+    def write_inventory_to(self, stream: TextIO):
+        """Write the NDJSON inventory of this already parsed image to stream."""
+        from . import inventory
+        for efi in self.efis:
+            self._write_file_records(stream, efi)
+        inventory.write_record(stream, inventory.image_record(self))
+        stream.flush()
+    
+    def _write_file_records(self, stream: TextIO, efi: EFI):
+        from . import inventory
+        uis = [s for s in efi.section_elements if self._is_section_with_ui(s)]
+        try:
+            module = self._module_path(efi)
+        except ValueError:
+            module = None
+        inventory.write_record(stream, inventory.file_record(efi, uis[0].name if uis else None, module))
+        for ordinal, section in enumerate(efi.section_elements):
+            inventory.write_record(stream, inventory.section_record(efi, ordinal, section))
+    
+    @classmethod
+    async def parse_async(cls, uefi_binary: bytes, verbose: bool = True, max_depth: int = DEFAULT_MAX_DEPTH,
+                          hash_algorithm: Optional[str] = None, executor: Optional['Executor'] = None,
+                          files_per_step: int = 16, memory_budget: Optional[int] = None,
+                          max_section_size: Optional[int] = DEFAULT_MAX_SECTION_SIZE,
+                          max_image_size: Optional[int] = DEFAULT_MAX_IMAGE_SIZE, tolerant: bool = False,
+                          progress: Optional[ProgressCallback] = None, cancel: Optional[CancellationToken] = None,
+                          timeout: Optional[float] = None) -> 'UEFI':
+        """Parse without blocking the event loop.
+        
+        Decompression and checksum work runs in executor (the loop's default
+        executor if None) in steps of files_per_step files. The event loop
+        regains control between steps, and cancelling the awaiting task stops
+        the parse at the next step.
+        """
+        loop = _running_loop()
+        uefi = cls.__new__(cls)
+        steps = uefi._parse(uefi_binary, verbose, max_depth, hash_algorithm, memory_budget,
+                            max_section_size, max_image_size, tolerant, Monitor(progress, cancel, timeout))
+        while await loop.run_in_executor(executor, _advance, steps, files_per_step):
+            pass
+        return uefi
+    
+    async def extract_async(self, output: Union[str, 'DirectoryOutput', 'ArchiveOutput'],
+                            store: Optional['BlobStore'] = None, executor: Optional['Executor'] = None,
+                            timestamp: Optional['datetime'] = None, manifests: Sequence[str] = (),
+                            progress: Optional[ProgressCallback] = None, cancel: Optional[CancellationToken] = None,
+                            timeout: Optional[float] = None):
+        """Extract like extract_uefi, with all file writes awaited in executor.
+        
+        progress is called from the executor thread. Cancelling the awaiting
+        task cancels cancel (or a token of its own) so that the extraction
+        stops before the next output file.
+        """
+        import asyncio
+        from functools import partial
+        loop = _running_loop()
+        token = cancel if cancel is not None else CancellationToken()
+        extract = partial(self.extract_uefi, output, store, timestamp, manifests, progress, token, timeout)
+        try:
+            await loop.run_in_executor(executor, extract)
+        except asyncio.CancelledError:
+            token.cancel()
+            raise
+    
+    @staticmethod
+    def probe(path: str, max_depth: int = DEFAULT_MAX_DEPTH) -> 'ProbeResult':
+        """Report build ID, volumes and file count of an image from headers only.
+        
+        Nothing is decompressed; files inside compressed sections are not counted.
+        Volumes nested deeper than max_depth raise ValueError, as when parsing.
+        """
+        from . import probe as probe_module
+        return probe_module.probe(path, max_depth)
     
     def _log(self, message: str):
         """Log debug message if verbose mode is enabled."""
         if self.verbose:
             print(message, file=sys.stderr)
     
-    def extract_uefi(self, output: str):
-        """Extract UEFI to output directory."""
-        self._extract_dxes(output)
-        self._extract_apriori(output)
+    def extract_uefi(self, output: Union[str, 'DirectoryOutput', 'ArchiveOutput'],
+                     store: Optional['BlobStore'] = None, timestamp: Optional['datetime'] = None,
+                     manifests: Sequence[str] = (), progress: Optional[ProgressCallback] = None,
+                     cancel: Optional[CancellationToken] = None, timeout: Optional[float] = None):
+        """Extract UEFI to an output directory or output backend.
+        
+        When a BlobStore is given, payloads are stored by content hash and
+        linked into the output tree; .inf and .inc files are written as usual.
+        timestamp (UTC, default now) is written into every .inf header; pin
+        it for reproducible output. manifests lists extra formats of the
+        module table to write ('json', 'csv') as manifest.<format>.
+        
+        progress, cancel and timeout work as for parsing, checked before each
+        output file; the output is closed either way.
+        """
+        from . import templates
+        if isinstance(output, str):
+            from .output import DirectoryOutput
+            output = DirectoryOutput(output, store)
+        if timestamp is None:
+            from datetime import datetime, timezone
+            timestamp = datetime.now(timezone.utc)
+        generated = templates.format_timestamp(timestamp)
+        
+        entries, payloads = self._module_table(output)
+        # RAW payloads of files sharing a name or GUID go to one path; a directory keeps the last one written,
+        # so write only that one and an archive gets no duplicate members
+        last = {path: index for index, (path, _) in enumerate(payloads)}
+        payloads = [item for index, item in enumerate(payloads) if last[item[0]] == index]
+        # Payloads are read as they are written, so spilled payloads are not all loaded at once
+        files: List[Tuple[str, Union[bytes, str, Callable[[], bytes]]]] = [
+            (path, lambda section=section: section.decompressed_image) for path, section in payloads]
+        files.extend((entry.inf.replace('/', os.sep), templates.render_inf(entry, generated))
+                     for entry in entries if entry.kind == 'INF')
+        files.append(('DXE.dsc.inc', templates.render_dsc_include(entries)))
+        files.append(('DXE.inc', templates.render_load_list(entries)))
+        files.append(('APRIORI.inc', templates.render_apriori(entries)))
+        for manifest_format in manifests:
+            files.append((f"manifest.{manifest_format}", templates.render_manifest(entries, manifest_format)))
+        
+        monitor = Monitor(progress, cancel, timeout)
+        try:
+            output.write_batch([(path, _monitored(monitor, index, len(files), data))
+                                for index, (path, data) in enumerate(files)])
+            monitor.report('extract', None, len(files), len(files), len(files))
+        finally:
+            output.close()
+    
+    @property
+    def dependency_graph(self) -> 'DependencyGraph':
+        """Dependency graph of the DXE drivers and the APRIORI order, built on first use (see depex)."""
+        if self._dependency_graph is None:
+            from . import depex
+            self._dependency_graph = depex.DependencyGraph(self.efis, self.apriori_order)
+        return self._dependency_graph
+
+    @property
+    def resident_bytes(self) -> int:
+        """Approximate bytes held in memory: the image and the section payloads not spilled or shared."""
+        if self.payloads is not None:
+            return len(self.image) + self.payloads.resident_bytes
+        return len(self.image) + sum(len(section._decompressed_image) for efi in self.efis
+                                     for section in efi.section_elements
+                                     if section._spilled is None and section._decompressed_image is not None)
+
+    def close(self):
+        """Delete the scratch file of spilled payloads and remove the shared memory segment, if any.
+        
+        Payloads held in memory stay readable; spilled and shared ones no
+        longer are. Closing twice does nothing.
+        """
+        if self.payloads is not None:
+            self.payloads.close()
+        if self.shared is not None:
+            self.shared.close()
+    
+    def __enter__(self) -> 'UEFI':
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+    
+    def diff(self, other: Union['UEFI', 'IndexFile']) -> 'ImageDiff':
+        """Compare this image (as the old one) with other by GUID (see diff)."""
+        from .diff import diff_images
+        return diff_images(self, other)
+    
+    def share(self) -> 'SharedResult':
+        """Copy the image and payloads into shared memory for handoff to another process (see shared)."""
+        from . import shared as shared_module
+        return shared_module.share(self)
+    
+    def save_index(self, path: str):
+        """Write the parsed structure to a compact index file (see index_file)."""
+        from . import index_file
+        index_file.write_index(self, path)
+    
+    def patch(self, buffer, guid: Union[str, uuid.UUID], payload: bytes, section_type: str = 'PE32'):
+        """Replace the first section_type section of file guid in buffer, in place (see patch).
+        
+        buffer is a bytearray or writable mmap holding the image this object
+        was parsed from. Only the file and the files enclosing its volume are
+        rewritten.
+        """
+        from . import patch as patch_module
+        for efi in self.index.files(guid):
+            for section in efi.section_elements:
+                if section.type == section_type:
+                    patch_module.patch_section(buffer, efi, section, payload)
+                    return
+        raise ValueError(f"No {section_type} section in file {guid}")
+    
+    def repack(self, executor: Optional['Executor'] = None, preset: int = 9, match_properties: bool = True,
+               cache: Optional['CompressionCache'] = None) -> bytes:
+        """Return the image with modified section payloads written back (see repack).
+        
+        Changed compressed sections are recompressed in executor (a thread pool
+        if None) with LZMA preset, matching their original properties header
+        if match_properties. Pass the same cache to later calls to skip
+        recompressing sections whose contents did not change.
+        """
+        from . import repack as repack_module
+        return repack_module.repack(self, executor, preset, match_properties, cache)
     
     def _try_get_file_path(self, data: bytes) -> List[str]:
         """Extract file paths from data."""
-        pattern = re.compile(rb'[a-zA-Z/\\0-9_\-\.]*\.dll\b')
-        results = pattern.findall(data)
+        global _build_path_pattern
+        if _build_path_pattern is None:
+            import re
+            _build_path_pattern = re.compile(rb'[a-zA-Z/\\0-9_\-\.]*\.dll\b')
+        results = _build_path_pattern.findall(data)
         decoded = [r.decode('ascii', errors='ignore') for r in results]
         normalized = [self._normalize_build_path(s) for s in decoded]
         return [s for s in normalized if s.count('/') > 1]
     
-    def _try_get_build_path(self, data: bytes) -> List[str]:
-        """Extract build path from data."""
-        pattern = re.compile(rb'QC_IMAGE_VERSION_STRING=[a-zA-Z/\\0-9_\-\.]*\b')
-        results = pattern.findall(data)
-        decoded = [r.decode('ascii', errors='ignore') for r in results]
-        return [s.replace('QC_IMAGE_VERSION_STRING=', '') for s in decoded]
-    
     def _normalize_build_path(self, path: str) -> str:
         """Normalize build path."""
         if 'ARM' in path:
@@ -115,215 +586,127 @@ class UEFI:
         """Check if section is a UI section."""
         return section.type == 'UI'
     
-    def _extract_dxes(self, output: str):
-        """Extract DXE drivers."""
-        dxe_load_list = []
-        dxe_include_list = []
+    def _module_location(self, element: EFI, sections_with_paths: List[EFISection],
+                         uis: List[EFISection]) -> Tuple[str, str, str]:
+        """Return the output path, module name and base name of an INF module."""
+        file_paths_for_element = []
+        for section in sections_with_paths:
+            file_paths_for_element.extend(self._try_get_file_path(section.decompressed_image))
+        
+        output_path = ""
+        module_name = ""
+        base_name = ""
+        
+        if file_paths_for_element:
+            parts = file_paths_for_element[0].split('/')
+            if len(parts) >= 3:
+                output_path = '/'.join(parts[:-3]).replace('/', os.sep)
+                module_name = parts[-3]
+            
+            if len(uis) > 1:
+                raise ValueError("Multiple UI sections found")
+            base_name = uis[0].name if len(uis) == 1 else module_name
+        else:
+            if len(uis) > 1:
+                raise ValueError("Multiple UI sections found")
+            elif len(uis) == 1:
+                base_name = uis[0].name
+                module_name = base_name.replace(' ', '_')
+                output_path = base_name.replace(' ', '_')
+        
+        return output_path, module_name, base_name
+    
+    def _module_path(self, element: EFI) -> Optional[str]:
+        """Return the .inf path an INF module is extracted to, or None for other files."""
+        sections_with_paths = [s for s in element.section_elements if self._is_section_with_path(s)]
+        if not sections_with_paths:
+            return None
+        uis = [s for s in element.section_elements if self._is_section_with_ui(s)]
+        output_path, module_name, _ = self._module_location(element, sections_with_paths, uis)
+        return os.path.join(output_path, f"{module_name}.inf").replace('\\', '/')
+    
+    def _module_table(self, output: Union['DirectoryOutput', 'ArchiveOutput']) -> Tuple[List['ModuleEntry'], List[Tuple[str, EFISection]]]:
+        """Plan the extraction: the module table and the (path, section) of each payload file, in order."""
+        from .templates import ModuleEntry
+        entries = []
+        payloads = []
+        planned = set()
         
         for element in self.efis:
             sections_with_paths = [s for s in element.section_elements if self._is_section_with_path(s)]
+            uis = [s for s in element.section_elements if self._is_section_with_ui(s)]
             
             if sections_with_paths:
-                file_paths_for_element = []
-                for section in sections_with_paths:
-                    file_paths_for_element.extend(self._try_get_file_path(section.decompressed_image))
-                
-                output_path = ""
-                module_name = ""
-                base_name = ""
-                
-                uis = [s for s in element.section_elements if self._is_section_with_ui(s)]
-                
-                if file_paths_for_element:
-                    parts = file_paths_for_element[0].split('/')
-                    if len(parts) >= 3:
-                        output_path = '/'.join(parts[:-3]).replace('/', os.sep)
-                        module_name = parts[-3]
-                    
-                    if len(uis) > 1:
-                        raise ValueError("Multiple UI sections found")
-                    base_name = uis[0].name if len(uis) == 1 else module_name
-                else:
-                    if len(uis) > 1:
-                        raise ValueError("Multiple UI sections found")
-                    elif len(uis) == 1:
-                        base_name = uis[0].name
-                        module_name = base_name.replace(' ', '_')
-                        output_path = base_name.replace(' ', '_')
-                
-                combined_path = os.path.join(output, output_path)
-                if not os.path.exists(combined_path):
-                    os.makedirs(combined_path)
-                
-                module_type = element.type.upper()
-                if element.type == 'APPLICATION':
-                    module_type = 'UEFI_APPLICATION'
-                elif element.type == 'DRIVER':
-                    module_type = 'DXE_DRIVER'
-                elif element.type == 'SECURITY_CORE':
-                    module_type = 'SEC'
-                
-                has_depex = any(s.type == 'DXE_DEPEX' for s in element.section_elements)
-                
-                # Generate INF file
-                inf_output = (
-                    "# ****************************************************************************\n"
-                    "# AUTOGENERATED BY UEFIReader\n"
-                    f"# AUTOGENED AS {module_name}.inf\n"
-                    "# DO NOT MODIFY\n"
-                    f"# GENERATED ON: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}Z\n"
-                    "\n"
-                    "[Defines]\n"
-                    "  INF_VERSION    = 0x0001001B\n"
-                    f"  BASE_NAME      = {base_name}\n"
-                    f"  FILE_GUID      = {str(element.guid).upper()}\n"
-                    f"  MODULE_TYPE    = {module_type}\n"
-                    "  VERSION_STRING = 1.0\n"
-                )
-                
-                if has_depex:
-                    inf_output += "  ENTRY_POINT    = EfiEntry\n"
+                output_path, module_name, base_name = self._module_location(element, sections_with_paths, uis)
                 
-                inf_output += "\n[Binaries.AARCH64]"
+                entry = ModuleEntry(element.guid, 'INF', element.type)
+                entry.name = base_name
+                entry.module_name = module_name
+                entry.module_type = MODULE_TYPES.get(element.type, element.type.upper())
+                entry.has_depex = any(s.type == 'DXE_DEPEX' for s in element.section_elements)
+                entry.apriori = element.guid in self.load_priority
+                entry.inf = os.path.join(output_path, f"{module_name}.inf").replace('\\', '/')
                 
                 for item in element.section_elements:
                     if item.type == 'UI':
                         continue
                     
-                    section_type = item.type
-                    extension = section_type.lower()
-                    
-                    if section_type == 'PE32':
-                        extension = 'efi'
-                    elif section_type == 'DXE_DEPEX':
-                        extension = 'depex'
-                    
+                    extension = SECTION_EXTENSIONS.get(item.type, item.type.lower())
                     output_file_name = f"{module_name}.{extension}"
-                    file_path = os.path.join(combined_path, output_file_name)
+                    file_path = os.path.join(output_path, output_file_name)
                     
                     # Handle file conflicts by adding numeric suffix
-                    if os.path.exists(file_path):
-                        counter = 1
-                        while os.path.exists(file_path):
-                            output_file_name = f"{module_name}_{counter}.{extension}"
-                            file_path = os.path.join(combined_path, output_file_name)
-                            counter += 1
-                    
-                    inf_output += f"\n   {section_type}|{output_file_name}|*"
+                    counter = 1
+                    while file_path in planned or output.exists(file_path):
+                        output_file_name = f"{module_name}_{counter}.{extension}"
+                        file_path = os.path.join(output_path, output_file_name)
+                        counter += 1
                     
-                    with open(file_path, 'wb') as f:
-                        f.write(item.decompressed_image)
-                
-                inf_output += "\n\n"
-                if has_depex:
-                    inf_output += "[Depex]\n  TRUE\n"
-                
-                inf_output += (
-                    "# AUTOGEN ENDS\n"
-                    "# ****************************************************************************\n"
-                )
-                
-                inf_path = os.path.join(combined_path, f"{module_name}.inf")
-                with open(inf_path, 'w') as f:
-                    f.write(inf_output)
+                    planned.add(file_path)
+                    entry.files.append((item.type, output_file_name, file_path))
+                    payloads.append((file_path, item))
                 
-                rel_path = os.path.join(output_path, f"{module_name}.inf").replace('\\', '/')
-                dxe_load_list.append(f"INF {rel_path}")
-                dxe_include_list.append(rel_path)
+                entries.append(entry)
             
-            elif any(self._is_section_with_ui(s) for s in element.section_elements):
-                uis = [s for s in element.section_elements if self._is_section_with_ui(s)]
-                
+            elif uis:
                 if len(uis) > 1:
                     raise ValueError("Multiple UI sections found")
                 
                 file_name = uis[0].name
-                dxe_load_list.append("")
-                dxe_load_list.append(f"FILE FREEFORM = {str(element.guid).upper()} {{")
+                entry = ModuleEntry(element.guid, 'FREEFORM', element.type)
+                entry.name = file_name
                 
                 for section in element.section_elements:
-                    el = section.name if section.name else file_name
-                    
                     if section.type == 'RAW':
-                        combined_path = os.path.join(output, 'RawFiles')
                         real_file_name = file_name.replace(' ', '_').replace('\\', os.sep).replace('/', os.sep)
-                        file_dst = os.path.join(combined_path, real_file_name)
-                        
-                        dir_path = os.path.dirname(file_dst)
-                        if not os.path.exists(dir_path):
-                            os.makedirs(dir_path)
-                        
-                        with open(file_dst, 'wb') as f:
-                            f.write(section.decompressed_image)
-                        
-                        dxe_load_list.append(f"    SECTION {section.type} = RawFiles/{file_name.replace(' ', '_').replace(os.sep, '/')}")
+                        file_dst = os.path.join('RawFiles', real_file_name)
+                        entry.files.append((section.type, real_file_name, file_dst))
+                        entry.load_sections.append((section.type, f"RawFiles/{file_name.replace(' ', '_').replace(os.sep, '/')}"))
+                        payloads.append((file_dst, section))
                     elif section.type == 'UI':
-                        dxe_load_list.append(f'    SECTION {section.type} = "{el}"')
+                        el = section.name if section.name else file_name
+                        entry.load_sections.append((section.type, f'"{el}"'))
                 
-                dxe_load_list.append("}")
-                dxe_load_list.append("")
+                entries.append(entry)
             else:
                 file_name = str(element.guid)
+                entry = ModuleEntry(element.guid, 'RAW', element.type)
                 
                 for section in element.section_elements:
                     if section.type == 'RAW':
-                        combined_path = os.path.join(output, 'RawFiles')
                         real_file_name = file_name.replace(' ', '_').replace('\\', os.sep).replace('/', os.sep)
-                        file_dst = os.path.join(combined_path, real_file_name)
-                        
-                        dir_path = os.path.dirname(file_dst)
-                        if not os.path.exists(dir_path):
-                            os.makedirs(dir_path)
-                        
-                        with open(file_dst, 'wb') as f:
-                            f.write(section.decompressed_image)
-        
-        # Write output files
-        with open(os.path.join(output, 'DXE.dsc.inc'), 'w') as f:
-            f.write('\n'.join(dxe_include_list))
-        
-        with open(os.path.join(output, 'DXE.inc'), 'w') as f:
-            f.write('\n'.join(dxe_load_list))
-    
-    def _extract_apriori(self, output: str):
-        """Extract APRIORI load list."""
-        apriori_load_list = ["APRIORI DXE {"]
-        
-        for element in self.efis:
-            sections_with_paths = [s for s in element.section_elements if self._is_section_with_path(s)]
-            
-            if sections_with_paths:
-                file_paths_for_element = []
-                for section in sections_with_paths:
-                    file_paths_for_element.extend(self._try_get_file_path(section.decompressed_image))
-                
-                output_path = ""
-                module_name = ""
-                
-                uis = [s for s in element.section_elements if self._is_section_with_ui(s)]
-                
-                if file_paths_for_element:
-                    parts = file_paths_for_element[0].split('/')
-                    if len(parts) >= 3:
-                        output_path = '/'.join(parts[:-3]).replace('/', os.sep)
-                        module_name = parts[-3]
-                else:
-                    if len(uis) == 1:
-                        base_name = uis[0].name
-                        module_name = base_name.replace(' ', '_')
-                        output_path = base_name.replace(' ', '_')
+                        file_dst = os.path.join('RawFiles', real_file_name)
+                        entry.files.append((section.type, real_file_name, file_dst))
+                        payloads.append((file_dst, section))
                 
-                if element.guid in self.load_priority:
-                    rel_path = os.path.join(output_path, f"{module_name}.inf").replace('\\', '/')
-                    apriori_load_list.append(f"    INF {rel_path}")
-        
-        apriori_load_list.append("}")
+                if entry.files:
+                    entries.append(entry)
         
-        with open(os.path.join(output, 'APRIORI.inc'), 'w') as f:
-            f.write('\n'.join(apriori_load_list))
+        return entries, payloads
     
-    def _handle_volume_image(self, data: bytes, offset: int) -> List[EFI]:
-        """Parse UEFI volume image."""
+    def _handle_volume_image(self, data: memoryview, offset: int, origin: int = 0,
+                             parent: Optional[EFIContainer] = None, depth: int = 0) -> WorkItem:
+        """Validate a UEFI volume image and return the work item for its files."""
         volume_header_magic = byte_operations.read_ascii_string(data, offset + 0x28, 4)
         if volume_header_magic != '_FVH':
             raise ValueError("Invalid volume header")
@@ -341,112 +724,161 @@ class UEFI:
             if self.verbose:
                 print(f"Warning: Input buffer is too small by {(file_header_offset + len(buffer)) - len(data):08X} bytes.", file=sys.stderr)
         
-        return self._handle_file_loop(buffer, 0, file_header_offset)
+        volume = EFIContainer()
+        volume.type = 'FV'
+        volume.offset = origin + offset
+        volume.size = volume_size
+        volume.data_offset = origin + file_header_offset
+        volume.data_size = len(buffer)
+        volume.parent = parent
+        
+        return WorkItem(buffer, 0, file_header_offset, origin + file_header_offset, volume, depth)
     
-    def _handle_file_loop(self, data: bytes, offset: int, base: int) -> List[EFI]:
-        """Parse files in UEFI volume."""
-        file_elements = []
+    def _walk_volume(self, data: bytes, offset: int) -> Iterator[EFI]:
+        """Yield the files of a volume and all volumes nested in it.
+        
+        Nested volumes are walked from an explicit stack instead of by recursion.
+        Files are yielded depth-first in image order: the files of a nested
+        volume come right where its FV image file sits in the enclosing volume.
+        """
+        stack = [self._handle_volume_image(memoryview(data), offset)]
+        while stack:
+            item = stack.pop()
+            yield from self._handle_file_loop(item, stack)
+    
+    def _push_work(self, stack: List[WorkItem], item: WorkItem):
+        """Queue a nested buffer, enforcing the nesting depth limit."""
+        if item.depth > self.max_depth:
+            raise ValueError(f"Maximum nesting depth of {self.max_depth} exceeded")
+        stack.append(item)
+    
+    def _hash(self, data) -> Optional[str]:
+        """Return the hex digest of data, or None when hashing is disabled."""
+        if self.hash_algorithm is None:
+            return None
+        import hashlib
+        return hashlib.new(self.hash_algorithm, data).hexdigest()
+    
+    def _new_efi(self, file_type: str, file_guid: uuid.UUID, elements: List[EFISection],
+                 item: WorkItem, offset: int, file_size: int, file_header_size: int) -> EFI:
+        """Create an EFI file entry for the file at offset in the work item's buffer."""
+        efi = EFI()
+        efi.type = file_type
+        efi.guid = file_guid
+        efi.section_elements = elements
+        efi.offset = item.origin + offset
+        efi.size = file_size
+        efi.header_size = file_header_size
+        efi.container = item.container
+        efi.digest = self._hash(item.data[offset:offset + file_size])
+        return efi
+    
+    def _handle_file_loop(self, item: WorkItem, stack: List[WorkItem]) -> Iterator[EFI]:
+        """Parse files in UEFI volume.
+        
+        Stops at an FV image file after queueing the rest of this volume and
+        the nested volumes, so that the nested files are walked next.
+        """
+        data, offset, base, origin, container = item.data, item.offset, item.base, item.origin, item.container
         
-        if not self._verify_file_checksum(data, offset):
+        if offset == 0 and not self._verify_file_checksum(data, offset):
             raise ValueError("File checksum verification failed")
         
         while offset < len(data):
+            self._monitor.report('volume', container.offset, offset, len(data), len(self.efis))
             if offset + 0x18 > len(data):
-                return file_elements
+                break
             
             file_type, file_size, file_header_size, file_guid = self._read_file_metadata(data, offset)
             
             if offset + file_size > len(data) or file_size == 0:
-                return file_elements
+                break
+            
+            data_origin = origin + offset + file_header_size
             
             # Process different file types
             if file_type == 0x01:  # EFI_FV_FILETYPE_RAW
                 self._log("EFI_FV_FILETYPE_RAW")
-                buffer = data[offset + file_header_size:offset + file_size]
-                efi = EFI()
-                efi.type = 'RAW'
-                efi.guid = file_guid
+                buffer = bytes(data[offset + file_header_size:offset + file_size])
                 section = EFISection()
                 section.name = str(file_guid)
                 section.type = 'RAW'
-                section.decompressed_image = buffer
-                efi.section_elements = [section]
-                file_elements.append(efi)
+                section._decompressed_image = buffer
+                section.offset = data_origin
+                section.size = len(buffer)
+                section.header_size = 0
+                section.container = container
+                section.depth = item.depth
+                section.digest = self._hash(buffer)
+                section.compressed_digest = self._compressed_digest(container)
+                self._admit(section)
+                yield self._new_efi('RAW', file_guid, [section], item, offset, file_size, file_header_size)
             
             elif file_type == 0x02:  # EFI_FV_FILETYPE_FREEFORM
-                if file_guid == uuid.UUID('fc510ee7-ffdc-11d4-bd41-0080c73c8881'):
+                if file_guid.raw == APRIORI_GUID_BYTES:
                     self._log("EFI_FV_FILETYPE_DXE_APRIORI")
                     buffer = data[offset + file_header_size:offset + file_size]
-                    elements = self._handle_section_loop(buffer, 0, offset + file_header_size)
+                    elements = self._handle_section_loop(buffer, 0, offset + file_header_size, data_origin, container, item.depth)
                     
                     if len(elements) > 0 and elements[0].type == 'RAW':
-                        for i in range(0, len(elements[0].decompressed_image), 16):
-                            dependency_guid = byte_operations.read_guid(elements[0].decompressed_image, i)
-                            self._log(str(dependency_guid).upper())
+                        apriori_list = elements[0].decompressed_image
+                        for i in range(0, len(apriori_list), 16):
+                            dependency_guid = byte_operations.read_guid(apriori_list, i)
+                            self._log(dependency_guid.upper)
                             self.load_priority.add(dependency_guid)
+                            self.apriori_order.append(dependency_guid)
                 else:
                     self._log("EFI_FV_FILETYPE_FREEFORM")
                     buffer = data[offset + file_header_size:offset + file_size]
-                    elements = self._handle_section_loop(buffer, 0, offset + file_header_size)
-                    efi = EFI()
-                    efi.type = 'FREEFORM'
-                    efi.guid = file_guid
-                    efi.section_elements = elements
-                    file_elements.append(efi)
+                    elements = self._handle_section_loop(buffer, 0, offset + file_header_size, data_origin, container, item.depth)
+                    yield self._new_efi('FREEFORM', file_guid, elements, item, offset, file_size, file_header_size)
             
             elif file_type == 0x03:  # EFI_FV_FILETYPE_SECURITY_CORE
                 self._log("EFI_FV_FILETYPE_SECURITY_CORE")
                 buffer = data[offset + file_header_size:offset + file_size]
-                elements = self._handle_section_loop(buffer, 0, offset + file_header_size)
-                efi = EFI()
-                efi.type = 'SECURITY_CORE'
-                efi.guid = file_guid
-                efi.section_elements = elements
-                file_elements.append(efi)
+                elements = self._handle_section_loop(buffer, 0, offset + file_header_size, data_origin, container, item.depth)
+                yield self._new_efi('SECURITY_CORE', file_guid, elements, item, offset, file_size, file_header_size)
             
             elif file_type == 0x05:  # EFI_FV_FILETYPE_DXE_CORE
                 self._log("EFI_FV_FILETYPE_DXE_CORE")
                 buffer = data[offset + file_header_size:offset + file_size]
-                elements = self._handle_section_loop(buffer, 0, offset + file_header_size)
-                efi = EFI()
-                efi.type = 'DXE_CORE'
-                efi.guid = file_guid
-                efi.section_elements = elements
-                file_elements.append(efi)
+                elements = self._handle_section_loop(buffer, 0, offset + file_header_size, data_origin, container, item.depth)
+                yield self._new_efi('DXE_CORE', file_guid, elements, item, offset, file_size, file_header_size)
             
             elif file_type == 0x07:  # EFI_FV_FILETYPE_DRIVER
                 self._log("EFI_FV_FILETYPE_DRIVER")
                 buffer = data[offset + file_header_size:offset + file_size]
-                elements = self._handle_section_loop(buffer, 0, offset + file_header_size)
-                efi = EFI()
-                efi.type = 'DRIVER'
-                efi.guid = file_guid
-                efi.section_elements = elements
-                file_elements.append(efi)
+                elements = self._handle_section_loop(buffer, 0, offset + file_header_size, data_origin, container, item.depth)
+                yield self._new_efi('DRIVER', file_guid, elements, item, offset, file_size, file_header_size)
             
             elif file_type == 0x09:  # EFI_FV_FILETYPE_APPLICATION
                 self._log("EFI_FV_FILETYPE_APPLICATION")
                 buffer = data[offset + file_header_size:offset + file_size]
-                elements = self._handle_section_loop(buffer, 0, offset + file_header_size)
-                efi = EFI()
-                efi.type = 'APPLICATION'
-                efi.guid = file_guid
-                efi.section_elements = elements
-                file_elements.append(efi)
+                elements = self._handle_section_loop(buffer, 0, offset + file_header_size, data_origin, container, item.depth)
+                yield self._new_efi('APPLICATION', file_guid, elements, item, offset, file_size, file_header_size)
             
             elif file_type == 0x0B:  # EFI_FV_FILETYPE_FIRMWARE_VOLUME_IMAGE
                 self._log("EFI_FV_FILETYPE_FIRMWARE_VOLUME_IMAGE")
                 buffer = data[offset + file_header_size:offset + file_size]
-                elements = self._handle_section_loop(buffer, 0, offset + file_header_size)
-                for element in elements:
-                    if element.type == 'FV':
-                        file_elements.extend(self._handle_volume_image(element.decompressed_image, 0))
+                elements = self._handle_section_loop(buffer, 0, offset + file_header_size, data_origin, container, item.depth)
+                volumes = [
+                    self._handle_volume_image(memoryview(element.decompressed_image), 0, element.offset + element.header_size,
+                                              element.container, element.depth + 1)
+                    for element in elements if element.type == 'FV'
+                ]
+                
+                # Resume this volume after the nested volumes have been walked
+                next_offset = byte_operations.align(base, offset + file_size, 8)
+                stack.append(WorkItem(data, next_offset, base, origin, container, item.depth))
+                for volume in reversed(volumes):
+                    self._push_work(stack, volume)
+                return
             
             elif file_type == 0xF0:  # EFI_FV_FILETYPE_FFS_PAD
                 self._log("EFI_FV_FILETYPE_FFS_PAD")
             
             elif file_type in [0x00, 0xFF]:
-                return file_elements
+                break
             
             else:
                 self._log(f"Unsupported file type! 0x{file_type:02X} with size 0x{file_size:04X} at offset 0x{offset:04X}")
@@ -455,106 +887,128 @@ class UEFI:
             offset += file_size
             offset = byte_operations.align(base, offset, 8)
         
-        return file_elements
+        self._monitor.report('volume', container.offset, len(data), len(data), len(self.efis))
     
-    def _read_section_data_buffer(self, data: bytes, offset: int) -> bytes:
+    def _read_section_data_buffer(self, data: memoryview, offset: int) -> bytes:
         """Read section data buffer."""
         section_size, _ = self._read_section_metadata(data, offset)
-        return data[offset + 4:offset + section_size]
+        return bytes(data[offset + 4:offset + section_size])
+    
+    def _read_section(self, section_type: str, item: WorkItem, offset: int) -> EFISection:
+        """Read a leaf section located at offset within its container's region."""
+        section = EFISection()
+        section.type = section_type
+        section._decompressed_image = self._read_section_data_buffer(item.data, offset)
+        section.offset = item.origin + offset
+        section.size = len(section.decompressed_image) + 4
+        section.header_size = 4
+        section.container = item.container
+        section.depth = item.depth
+        section.digest = self._hash(section.decompressed_image)
+        section.compressed_digest = self._compressed_digest(item.container)
+        self._admit(section)
+        return section
+    
+    def _admit(self, section: EFISection):
+        """Account a new section payload against the memory budget, if any."""
+        if self.payloads is not None:
+            self.payloads.admit(section)
     
-    def _handle_section_loop(self, data: bytes, offset: int, base: int) -> List[EFISection]:
-        """Parse sections in a file."""
+    def _compressed_digest(self, container: Optional[EFIContainer]) -> Optional[str]:
+        """Return the digest of the compressed data a section was decoded from, if any."""
+        region = container.region if container is not None else None
+        return region.digest if region is not None else None
+    
+    def _handle_section_loop(self, data: memoryview, offset: int, base: int, origin: int = 0,
+                             container: Optional[EFIContainer] = None, depth: int = 0) -> List[EFISection]:
+        """Parse sections in a file.
+        
+        Encapsulation sections are decoded onto an explicit stack; their
+        sections are returned in place of the encapsulation section.
+        """
         file_elements = []
+        stack = [WorkItem(data, offset, base, origin, container, depth)]
         
-        while offset < len(data):
-            if offset + 4 > len(data):
-                raise ValueError("Invalid section data")
-            
-            section_size, section_type = self._read_section_metadata(data, offset)
-            
-            if offset + section_size > len(data) or section_size == 0:
-                raise ValueError("Invalid section size")
-            
-            if section_type == 0x02:  # EFI_SECTION_GUID_DEFINED
-                self._log("EFI_SECTION_GUID_DEFINED")
-                file_elements.extend(self._parse_guid_defined_section(data, offset, base))
-            
-            elif section_type == 0x10:  # EFI_SECTION_PE32
-                self._log("EFI_SECTION_PE32")
-                section = EFISection()
-                section.type = 'PE32'
-                section.decompressed_image = self._read_section_data_buffer(data, offset)
-                file_elements.append(section)
-            
-            elif section_type == 0x11:  # EFI_SECTION_PIC
-                self._log("EFI_SECTION_PIC")
-                section = EFISection()
-                section.type = 'PIC'
-                section.decompressed_image = self._read_section_data_buffer(data, offset)
-                file_elements.append(section)
+        while stack:
+            item = stack.pop()
+            data, offset, base = item.data, item.offset, item.base
             
-            elif section_type == 0x12:  # EFI_SECTION_TE
-                self._log("EFI_SECTION_TE")
-                section = EFISection()
-                section.type = 'TE'
-                section.decompressed_image = self._read_section_data_buffer(data, offset)
-                file_elements.append(section)
-            
-            elif section_type == 0x13:  # EFI_SECTION_DXE_DEPEX
-                self._log("EFI_SECTION_DXE_DEPEX")
-                section = EFISection()
-                section.type = 'DXE_DEPEX'
-                section.decompressed_image = self._read_section_data_buffer(data, offset)
-                file_elements.append(section)
-            
-            elif section_type == 0x14:  # EFI_SECTION_VERSION
-                self._log("EFI_SECTION_VERSION")
-            
-            elif section_type == 0x15:  # EFI_SECTION_USER_INTERFACE
-                self._log("EFI_SECTION_USER_INTERFACE")
-                section = EFISection()
-                section.type = 'UI'
-                section.decompressed_image = self._read_section_data_buffer(data, offset)
-                section.name = byte_operations.read_unicode_string(data, offset + 4, section_size - 4).rstrip('\x00 ')
-                file_elements.append(section)
-            
-            elif section_type == 0x17:  # EFI_SECTION_FIRMWARE_VOLUME_IMAGE
-                self._log("EFI_SECTION_FIRMWARE_VOLUME_IMAGE")
-                section = EFISection()
-                section.type = 'FV'
-                section.decompressed_image = self._read_section_data_buffer(data, offset)
-                file_elements.append(section)
-            
-            elif section_type == 0x18:  # EFI_SECTION_FREEFORM_SUBTYPE_GUID
-                self._log("EFI_SECTION_FREEFORM_SUBTYPE_GUID")
-                section = EFISection()
-                section.type = 'RAW'
-                section.decompressed_image = self._read_section_data_buffer(data, offset)
-                file_elements.append(section)
-            
-            elif section_type == 0x19:  # EFI_SECTION_RAW
-                self._log("EFI_SECTION_RAW")
-                section = EFISection()
-                section.type = 'RAW'
-                section.decompressed_image = self._read_section_data_buffer(data, offset)
-                file_elements.append(section)
-            
-            elif section_type == 0x1B:  # EFI_SECTION_PEI_DEPEX
-                self._log("EFI_SECTION_PEI_DEPEX")
-                section = EFISection()
-                section.type = 'PEI_DEPEX'
-                section.decompressed_image = self._read_section_data_buffer(data, offset)
-                file_elements.append(section)
-            
-            elif section_type in [0x00, 0xFF]:
-                return file_elements
-            
-            else:
-                self._log(f"Unsupported section type! 0x{section_type:02X} with size 0x{section_size:04X} at offset 0x{offset:04X}")
-                raise ValueError("Unsupported section type")
-            
-            offset += section_size
-            offset = byte_operations.align(base, offset, 4)
+            while offset < len(data):
+                self._monitor.check()
+                if offset + 4 > len(data):
+                    raise ValueError("Invalid section data")
+                
+                section_size, section_type = self._read_section_metadata(data, offset)
+                
+                if offset + section_size > len(data) or section_size == 0:
+                    raise ValueError("Invalid section size")
+                
+                if section_type == 0x02:  # EFI_SECTION_GUID_DEFINED
+                    self._log("EFI_SECTION_GUID_DEFINED")
+                    try:
+                        encapsulated = self._parse_guid_defined_section(item, offset)
+                    except ValueError as e:
+                        if not self.tolerant:
+                            raise
+                        self._log(f"Skipping GUID-defined section at 0x{item.origin + offset:X}: {e}")
+                        self.errors.append((item.origin + offset, e))
+                    else:
+                        # Resume this buffer after the encapsulated sections
+                        next_offset = byte_operations.align(base, offset + section_size, 4)
+                        stack.append(WorkItem(data, next_offset, base, item.origin, item.container, item.depth))
+                        self._push_work(stack, encapsulated)
+                        break
+                
+                elif section_type == 0x10:  # EFI_SECTION_PE32
+                    self._log("EFI_SECTION_PE32")
+                    file_elements.append(self._read_section('PE32', item, offset))
+                
+                elif section_type == 0x11:  # EFI_SECTION_PIC
+                    self._log("EFI_SECTION_PIC")
+                    file_elements.append(self._read_section('PIC', item, offset))
+                
+                elif section_type == 0x12:  # EFI_SECTION_TE
+                    self._log("EFI_SECTION_TE")
+                    file_elements.append(self._read_section('TE', item, offset))
+                
+                elif section_type == 0x13:  # EFI_SECTION_DXE_DEPEX
+                    self._log("EFI_SECTION_DXE_DEPEX")
+                    file_elements.append(self._read_section('DXE_DEPEX', item, offset))
+                
+                elif section_type == 0x14:  # EFI_SECTION_VERSION
+                    self._log("EFI_SECTION_VERSION")
+                
+                elif section_type == 0x15:  # EFI_SECTION_USER_INTERFACE
+                    self._log("EFI_SECTION_USER_INTERFACE")
+                    section = self._read_section('UI', item, offset)
+                    section.name = byte_operations.read_unicode_string(data, offset + 4, section_size - 4).rstrip('\x00 ')
+                    file_elements.append(section)
+                
+                elif section_type == 0x17:  # EFI_SECTION_FIRMWARE_VOLUME_IMAGE
+                    self._log("EFI_SECTION_FIRMWARE_VOLUME_IMAGE")
+                    file_elements.append(self._read_section('FV', item, offset))
+                
+                elif section_type == 0x18:  # EFI_SECTION_FREEFORM_SUBTYPE_GUID
+                    self._log("EFI_SECTION_FREEFORM_SUBTYPE_GUID")
+                    file_elements.append(self._read_section('RAW', item, offset))
+                
+                elif section_type == 0x19:  # EFI_SECTION_RAW
+                    self._log("EFI_SECTION_RAW")
+                    file_elements.append(self._read_section('RAW', item, offset))
+                
+                elif section_type == 0x1B:  # EFI_SECTION_PEI_DEPEX
+                    self._log("EFI_SECTION_PEI_DEPEX")
+                    file_elements.append(self._read_section('PEI_DEPEX', item, offset))
+                
+                elif section_type in [0x00, 0xFF]:
+                    break
+                
+                else:
+                    self._log(f"Unsupported section type! 0x{section_type:02X} with size 0x{section_size:04X} at offset 0x{offset:04X}")
+                    raise ValueError("Unsupported section type")
+                
+                offset += section_size
+                offset = byte_operations.align(base, offset, 4)
         
         return file_elements
     
@@ -572,14 +1026,15 @@ class UEFI:
         file_size = byte_operations.read_uint24(data, offset + 0x14)
         file_header_size = 0x18
         
-        if attributes == 0x41:
+        if attributes & 0x01:  # FFS_ATTRIB_LARGE_FILE
             file_size = byte_operations.read_uint64(data, offset + 0x18)
             file_header_size = 0x20
         
         return file_type, file_size, file_header_size, file_guid
     
-    def _parse_guid_defined_section(self, data: bytes, offset: int, base: int) -> List[EFISection]:
-        """Parse GUID-defined section (compressed)."""
+    def _parse_guid_defined_section(self, item: WorkItem, offset: int) -> WorkItem:
+        """Decompress a GUID-defined section and return the work item for its sections."""
+        data = item.data
         section_size, section_type = self._read_section_metadata(data, offset)
         
         if section_type != 0x02:
@@ -591,21 +1046,52 @@ class UEFI:
         compressed_offset = offset + section_header_size
         compressed_size = section_size - section_header_size
         
-        # Decompress based on GUID
-        lzma_guid1 = uuid.UUID('ee4e5898-3914-4259-9d6e-dc7bd79403cf')
-        lzma_guid2 = uuid.UUID('bd9921ea-ed91-404a-8b2f-b4d724747c8c')
-        gzip_guid = uuid.UUID('1d301fe9-be79-4353-91c2-d23bc959ae0c')
-        
-        if section_guid in [lzma_guid1, lzma_guid2]:
-            # LZMA decompression
-            decompressed_image = lzma_helper.decompress(data, compressed_offset, compressed_size)
-        elif section_guid == gzip_guid:
-            # GZip decompression
-            decompressed_image = gzip_helper.decompress(data, compressed_offset, compressed_size)
+        encapsulation = EFIContainer()
+        encapsulation.guid = section_guid
+        encapsulation.offset = item.origin + offset
+        encapsulation.size = section_size
+        encapsulation.data_offset = item.origin + compressed_offset
+        encapsulation.data_size = compressed_size
+        encapsulation.parent = item.container
+        
+        if section_guid.raw in LZMA_GUID_BYTES:
+            encapsulation.type = 'LZMA'
+            codec = lzma_helper
+        elif section_guid.raw == GZIP_GUID_BYTES:
+            encapsulation.type = 'GZIP'
+            codec = gzip_helper
         else:
             raise ValueError(f"Unsupported compression GUID: {section_guid}")
         
-        return self._handle_section_loop(decompressed_image, 0, base)
+        # Check the depth before decompressing anything
+        if item.depth + 1 > self.max_depth:
+            raise ValueError(f"Maximum nesting depth of {self.max_depth} exceeded")
+        
+        kind, limit, max_length = self._decompression_limit()
+        self._monitor.report('decompress', encapsulation.offset, 0, compressed_size, len(self.efis))
+        try:
+            decompressed_image = codec.decompress(data, compressed_offset, compressed_size, max_length)
+        except DecompressionLimitError:
+            raise DecompressionLimitError(
+                f"{encapsulation.type} section at 0x{encapsulation.offset:X} exceeds the per-{kind} limit "
+                f"of {limit} decompressed bytes", limit, kind, encapsulation.offset) from None
+        self.decompressed_bytes += len(decompressed_image)
+        self._monitor.report('decompress', encapsulation.offset, compressed_size, compressed_size, len(self.efis))
+        
+        # Digest both forms while they are still hot in cache
+        encapsulation.digest = self._hash(data[compressed_offset:compressed_offset + compressed_size])
+        encapsulation.decompressed_digest = self._hash(decompressed_image)
+        
+        return WorkItem(memoryview(decompressed_image), 0, item.base, 0, encapsulation, item.depth + 1)
+    
+    def _decompression_limit(self) -> Tuple[Optional[str], Optional[int], Optional[int]]:
+        """Return the binding limit ('section' or 'image'), its size, and the bytes the next section may expand to."""
+        remaining = self.max_image_size - self.decompressed_bytes if self.max_image_size is not None else None
+        if self.max_section_size is not None and (remaining is None or self.max_section_size <= remaining):
+            return 'section', self.max_section_size, self.max_section_size
+        if remaining is not None:
+            return 'image', self.max_image_size, remaining
+        return None, None, None
     
     def _verify_volume_checksum(self, data: bytes, offset: int) -> bool:
         """Verify volume header checksum."""
@@ -622,14 +1108,16 @@ class UEFI:
         attributes = byte_operations.read_uint8(data, offset + 0x13)
         file_size = byte_operations.read_uint24(data, offset + 0x14)
         
-        if attributes == 0x41:
+        if attributes & 0x01:  # FFS_ATTRIB_LARGE_FILE
             file_size = byte_operations.read_uint64(data, offset + 0x18)
             file_header_size = 0x20
         
-        header = bytearray(data[offset:offset + file_header_size - 1])
+        # The header checksum covers the whole header with both checksums and State as zero
+        header = bytearray(data[offset:offset + file_header_size])
         byte_operations.write_uint16(header, 0x10, 0)  # Clear checksum
+        header[0x17] = 0
         current_header_checksum = byte_operations.read_uint8(data, offset + 0x10)
-        calculated_header_checksum = byte_operations.calculate_checksum8(bytes(header), 0, file_header_size - 1)
+        calculated_header_checksum = byte_operations.calculate_checksum8(bytes(header), 0, file_header_size)
         
         if current_header_checksum != calculated_header_checksum:
             return False
@@ -0,0 +1,328 @@
+"""
+Builders for small synthetic firmware images used by the tests.
+"""
+
+import gzip
+import lzma
+import struct
+import uuid
+
+LZMA_GUID = uuid.UUID('ee4e5898-3914-4259-9d6e-dc7bd79403cf')
+GZIP_GUID = uuid.UUID('1d301fe9-be79-4353-91c2-d23bc959ae0c')
+FFS2_GUID = uuid.UUID('8c8ce578-8a3d-4f1c-9935-896185c32dd3')
+APRIORI_GUID = 'fc510ee7-ffdc-11d4-bd41-0080c73c8881'
+PAD_GUID = 'ffffffff-ffff-ffff-ffff-ffffffffffff'
+
+DXE_CORE = '11111111-1111-1111-1111-111111111111'
+FOO_DXE = '22222222-2222-2222-2222-222222222222'
+BAR_DXE = '33333333-3333-3333-3333-333333333333'
+LOGO = '44444444-4444-4444-4444-444444444444'
+RAW_FILE = '55555555-5555-5555-5555-555555555555'
+NESTED_FV = '66666666-6666-6666-6666-666666666666'
+GZ_DXE = '77777777-7777-7777-7777-777777777777'
+PROTOCOL = 'aaaaaaaa-0000-0000-0000-000000000001'
+PDB_GUID = 'bbbbbbbb-cccc-dddd-eeee-ffffffffffff'
+
+BUILD_ID = 'BOOT.XF.4.1-00123-TEST-1'
+
+# Section types
+PE32 = 0x10
+TE = 0x12
+DXE_DEPEX = 0x13
+UI = 0x15
+FV_IMAGE = 0x17
+RAW = 0x19
+
+
+def checksum8(data: bytes) -> int:
+    return (0x100 - (sum(data) & 0xFF)) & 0xFF
+
+
+def checksum16(data: bytes) -> int:
+    total = 0
+    for i in range(0, len(data) - 1, 2):
+        total = (total + struct.unpack_from('<H', data, i)[0]) & 0xFFFF
+    return (0x10000 - total) & 0xFFFF
+
+
+def section(section_type: int, body: bytes) -> bytes:
+    return struct.pack('<I', 4 + len(body))[:3] + bytes([section_type]) + body
+
+
+def sections(*parts: bytes) -> bytes:
+    out = b''
+    for part in parts:
+        out += b'\x00' * (-len(out) % 4) + part
+    return out
+
+
+def lzma_stream(data: bytes, preset: int = 6) -> bytes:
+    """An LZMA stream with the output size recorded in its header, as UEFI builds write it."""
+    stream = lzma.compress(data, format=lzma.FORMAT_ALONE, preset=preset)
+    return stream[:5] + struct.pack('<Q', len(data)) + stream[13:]
+
+
+def guid_defined(codec: str, inner: bytes, stream: bytes = None) -> bytes:
+    """A GUID-defined section compressing inner, or holding stream as is."""
+    if codec == 'lzma':
+        guid, stream = LZMA_GUID, stream if stream is not None else lzma_stream(inner)
+    else:
+        guid, stream = GZIP_GUID, stream if stream is not None else gzip.compress(inner)
+    return section(0x02, guid.bytes_le + struct.pack('<HH', 0x18, 1) + stream)
+
+
+def ffs(guid: str, file_type: int, body: bytes, checksum: bool = False) -> bytes:
+    """A file; with checksum, FFS_ATTRIB_CHECKSUM is set and the data checksum filled in."""
+    size = 0x18 + len(body)
+    header = bytearray(uuid.UUID(guid).bytes_le + b'\x00\x00' + bytes([file_type, 0x40 if checksum else 0])
+                       + struct.pack('<I', size)[:3] + b'\xF8')
+    header[0x10] = checksum8(header[:0x17])
+    header[0x11] = checksum8(body) if checksum else 0xAA
+    return bytes(header) + body
+
+
+def volume(files, size: int = None, free: int = 0, name: str = None) -> bytes:
+    """A volume holding files, of size bytes or followed by free bytes of free space.
+
+    With name, the volume has an extended header holding that FvName GUID in
+    a pad file before the files, as EDK2 GenFv writes it.
+    """
+    ext_header_offset = 0
+    if name is not None:
+        ext_header_offset = 0x48 + 0x18
+        files = [ffs(PAD_GUID, 0xF0, uuid.UUID(name).bytes_le + struct.pack('<I', 0x14))] + list(files)
+    body = b''
+    for f in files:
+        body += b'\xff' * (-len(body) % 8) + f
+    header_size = 0x48
+    total = header_size + len(body)
+    total += -total % 8 + free
+    if size is not None:
+        total = size
+    header = bytearray(b'\x00' * 16 + FFS2_GUID.bytes_le + struct.pack('<Q', total) + b'_FVH'
+                       + struct.pack('<I', 0x0004FEFF) + struct.pack('<HHHBB', header_size, 0, ext_header_offset, 0, 2)
+                       + struct.pack('<II', 0, 0) + b'\x00' * 8)
+    struct.pack_into('<H', header, 0x32, checksum16(bytes(header)))
+    out = bytes(header) + body
+    return out + b'\xff' * (total - len(out))
+
+
+def ui(name: str) -> bytes:
+    return section(UI, (name + '\x00').encode('utf-16le'))
+
+
+def pe(path: str) -> bytes:
+    return section(PE32, b'MZ' + b'\x00' * 58 + b'\x80\x00\x00\x00' + b'\x00' * 60
+                   + b'junk ' + path.encode() + b' more' + bytes(range(256)))
+
+
+def pe_payload(marker: bytes, size: int) -> bytes:
+    """A PE32 section payload starting with MZ and marker, padded to about size bytes."""
+    return b'MZ' + marker + bytes(range(256)) * (size // 256)
+
+
+# Layout of the images built by pe_image and te_image: one .text section
+# holding the debug directory at its start and the CodeView entry after it
+TEXT_RVA = 0x1000
+TEXT_OFFSET = 0x400
+TEXT_SIZE = 0x200
+CODEVIEW_RVA = TEXT_RVA + 0x20
+TE_STRIPPED_SIZE = 0x188
+
+
+def _text_section(codeview: str, pdb: str, age: int) -> bytes:
+    """The .text section: a debug directory with one CodeView entry (RSDS or NB10), or none."""
+    if codeview == 'RSDS':
+        entry = b'RSDS' + uuid.UUID(PDB_GUID).bytes_le + struct.pack('<I', age)
+    else:
+        entry = b'NB10' + struct.pack('<III', 0, 0x5F000000, age)
+    entry += pdb.encode() + b'\x00'
+    directory = struct.pack('<IIHHIIII', 0, 0x5F000000, 0, 0, 2, len(entry), CODEVIEW_RVA,
+                            TEXT_OFFSET + CODEVIEW_RVA - TEXT_RVA)
+    body = directory.ljust(CODEVIEW_RVA - TEXT_RVA, b'\x00') + entry
+    return body.ljust(TEXT_SIZE, b'\xcc')
+
+
+def _section_header(name: bytes, virtual_size: int) -> bytes:
+    return struct.pack('<8sIIIIIIHHI', name, virtual_size, TEXT_RVA, TEXT_SIZE, TEXT_OFFSET, 0, 0, 0, 0, 0x60000020)
+
+
+def pe_image(plus: bool = False, machine: int = 0xAA64, image_base: int = 0x10000, codeview: str = 'RSDS',
+             pdb: str = 'e:/build/Foo/DEBUG/Foo.dll', age: int = 1, debug: bool = True) -> bytes:
+    """A PE32 (or PE32+ with plus) EFI boot service driver with one .text section and a CodeView entry."""
+    image = bytearray(TEXT_OFFSET)
+    image[0:2] = b'MZ'
+    struct.pack_into('<I', image, 0x3C, 0x40)
+    optional_size = (112 if plus else 96) + 16 * 8
+    image[0x40:0x44] = b'PE\x00\x00'
+    struct.pack_into('<HHIIIHH', image, 0x44, machine, 1, 0x5F000000, 0, 0, optional_size, 0x2022)
+    optional = 0x58
+    if plus:
+        struct.pack_into('<HBBIIIIIQII', image, optional, 0x20B, 0, 0, TEXT_SIZE, 0, 0,
+                         TEXT_RVA + 0x100, TEXT_RVA, image_base, 0x1000, 0x200)
+        struct.pack_into('<IIIH', image, optional + 56, 0x2000, TEXT_OFFSET, 0, 11)
+        struct.pack_into('<I', image, optional + 108, 16)
+        directories = optional + 112
+    else:
+        struct.pack_into('<HBBIIIIIIIII', image, optional, 0x10B, 0, 0, TEXT_SIZE, 0, 0,
+                         TEXT_RVA + 0x100, TEXT_RVA, 0, image_base, 0x1000, 0x200)
+        struct.pack_into('<IIIH', image, optional + 56, 0x2000, TEXT_OFFSET, 0, 11)
+        struct.pack_into('<I', image, optional + 92, 16)
+        directories = optional + 96
+    if debug:
+        struct.pack_into('<II', image, directories + 6 * 8, TEXT_RVA, 28)
+    image[optional + optional_size:optional + optional_size + 40] = _section_header(b'.text', 0x180)
+    return bytes(image) + _text_section(codeview, pdb, age)
+
+
+def te_image(machine: int = 0xAA64, image_base: int = 0x10000, codeview: str = 'RSDS',
+             pdb: str = 'e:/build/Foo/DEBUG/Foo.dll', age: int = 1) -> bytes:
+    """A TE image of the same driver, its first TE_STRIPPED_SIZE bytes of PE headers replaced by the TE header."""
+    header = struct.pack('<2sHBBHIIQIIII', b'VZ', machine, 1, 11, TE_STRIPPED_SIZE, TEXT_RVA + 0x100, TEXT_RVA,
+                         image_base, 0, 0, TEXT_RVA, 28)
+    headers = header + _section_header(b'.text', 0x180)
+    delta = TE_STRIPPED_SIZE - len(header)
+    return headers.ljust(TEXT_OFFSET - delta, b'\x00') + _text_section(codeview, pdb, age)
+
+
+def payload(uefi, guid: str, section_type: str = 'PE32') -> bytes:
+    """The decompressed payload of the section_type section of file guid in a parsed image."""
+    return uefi.index.section(guid, section_type).decompressed_image
+
+
+def parsed_payload(data, guid: str, section_type: str = 'PE32') -> bytes:
+    """Parse data and return the decompressed payload of the section_type section of file guid."""
+    from python_uefi_reader import UEFI
+    return payload(UEFI(bytes(data), verbose=False), guid, section_type)
+
+
+def depex(guids) -> bytes:
+    body = b''.join(b'\x02' + uuid.UUID(g).bytes_le for g in guids) + b'\x03' * (len(guids) - 1)
+    return section(DXE_DEPEX, body + b'\x08')
+
+
+def build_path(name: str) -> str:
+    return f'e:/build/Build/X/RELEASE_CLANG/AARCH64/QcomPkg/Drivers/{name}/{name}/DEBUG/{name}.dll'
+
+
+def image(variant: int = 0, free: int = 0, apriori=(FOO_DXE, DXE_CORE)) -> bytes:
+    """An image with APRIORI, RAW and FREEFORM files, a volume in an LZMA section and a GZIP section."""
+    inner = volume([
+        ffs(FOO_DXE, 0x07, sections(depex([PROTOCOL]), pe(build_path('Foo')), ui('FooDxe'))),
+        ffs(BAR_DXE, 0x07, sections(pe(build_path(f'Bar{variant}')), ui('BarDxe'))),
+    ])
+    outer = volume([
+        ffs(APRIORI_GUID, 0x02, sections(section(RAW, b''.join(uuid.UUID(g).bytes_le for g in apriori)))),
+        ffs(DXE_CORE, 0x07, sections(pe(build_path('DxeCore')), ui('DxeCore'))),
+        ffs(LOGO, 0x02, sections(section(RAW, b'rawdata' * 10), ui('Logo File'))),
+        ffs(RAW_FILE, 0x01, b'rawfile-contents'),
+        ffs(NESTED_FV, 0x0B, sections(guid_defined('lzma', sections(section(FV_IMAGE, inner))))),
+        ffs(GZ_DXE, 0x07, sections(guid_defined('gzip', sections(pe(build_path('Gz')), ui('GzDxe'))))),
+    ], free=free)
+    return (b'\x00' * 0x100 + outer + b'\x00' * 32
+            + f'QC_IMAGE_VERSION_STRING={BUILD_ID}\x00'.encode() + b'\x00' * 64)
+
+
+def nested_volumes(depth: int) -> bytes:
+    """A volume holding a driver, enclosed in depth levels of FV image files with plain FV_IMAGE sections."""
+    data = volume([ffs(FOO_DXE, 0x07, sections(pe(build_path('Foo')), ui('FooDxe')))])
+    for _ in range(depth):
+        data = volume([ffs(NESTED_FV, 0x0B, section(FV_IMAGE, data))])
+    return data
+
+
+def single_file_image(body: bytes, guid: str = GZ_DXE) -> bytes:
+    """A volume with one driver holding body, followed by a plain driver."""
+    return volume([
+        ffs(guid, 0x07, body),
+        ffs(DXE_CORE, 0x07, sections(pe(build_path('Ok')), ui('Ok'))),
+    ])
+
+
+def elf(segments, elf_class: int = 2, big_endian: bool = False) -> bytes:
+    """An ELF file holding (p_type, data) segments, each aligned to 0x1000 in the file."""
+    order = '>' if big_endian else '<'
+    header_size, entry_size = (0x34, 0x20) if elf_class == 1 else (0x40, 0x38)
+    position = header_size + len(segments) * entry_size
+    body = b''
+    placed = []
+    for segment_type, data in segments:
+        padding = -position % 0x1000
+        body += b'\x00' * padding + data
+        position += padding
+        placed.append((segment_type, position, len(data)))
+        position += len(data)
+    ident = b'\x7fELF' + bytes([elf_class, 2 if big_endian else 1, 1]) + bytes(9)
+    if elf_class == 1:
+        header = ident + struct.pack(order + 'HHIIIIIHHHHHH', 2, 40, 1, 0, header_size, 0, 0,
+                                     header_size, entry_size, len(segments), 0, 0, 0)
+        table = b''.join(struct.pack(order + 'IIIIIIII', t, o, o, o, n, n, 7, 0x1000) for t, o, n in placed)
+    else:
+        header = ident + struct.pack(order + 'HHIQQQIHHHHHH', 2, 183, 1, 0, header_size, 0, 0,
+                                     header_size, entry_size, len(segments), 0, 0, 0)
+        table = b''.join(struct.pack(order + 'IIQQQQQQ', t, 7, o, o, o, n, n, 0x1000) for t, o, n in placed)
+    return header + table + body
+
+
+def checksummed_image() -> bytes:
+    """A volume whose files carry data checksums, with a driver in a plain nested volume and one in a GZIP section."""
+    inner = volume([ffs(FOO_DXE, 0x07, sections(pe(build_path('Foo')), ui('FooDxe')), checksum=True)], free=4096)
+    return volume([
+        ffs(NESTED_FV, 0x0B, sections(section(FV_IMAGE, inner)), checksum=True),
+        ffs(GZ_DXE, 0x07, sections(guid_defined('gzip', sections(pe(build_path('Gz')), ui('GzDxe')))), checksum=True),
+        ffs(RAW_FILE, 0x01, b'rawfile-contents', checksum=True),
+    ], free=8192)
+
+
+def verify_volume(data, offset: int = 0) -> int:
+    """Assert the header checksums of the volume at offset and of every file in it, and the
+    data checksums of files with FFS_ATTRIB_CHECKSUM, descending into nested and compressed
+    volumes; return the number of files checked.
+    """
+    header_size, = struct.unpack_from('<H', data, offset + 0x30)
+    length, = struct.unpack_from('<Q', data, offset + 0x20)
+    assert sum(struct.unpack_from(f'<{header_size // 2}H', data, offset)) & 0xFFFF == 0, "volume checksum"
+    count = 0
+    position = offset + header_size
+    end = offset + length
+    while True:
+        position += -(position - offset) % 8
+        if position + 0x18 > end or data[position:position + 0x18] == b'\xff' * 0x18:
+            return count
+        # FFS_ATTRIB_LARGE_FILE: the size is a UINT64 after the common header
+        file_header_size = 0x20 if data[position + 0x13] & 0x01 else 0x18
+        header = bytearray(data[position:position + file_header_size])
+        size = int.from_bytes(header[0x14:0x17] if file_header_size == 0x18 else header[0x18:0x20], 'little')
+        body = bytes(data[position + file_header_size:position + size])
+        file_checksum = header[0x11]
+        header[0x11] = header[0x17] = 0
+        assert sum(header) & 0xFF == 0, f"header checksum of file at 0x{position:X}"
+        if header[0x13] & 0x40:
+            assert (sum(body) + file_checksum) & 0xFF == 0, f"data checksum of file at 0x{position:X}"
+        else:
+            assert file_checksum == 0xAA, f"data checksum of file at 0x{position:X}"
+        count += 1
+        if header[0x12] not in (0x01, 0xF0):
+            count += _verify_sections(body)
+        position += size
+
+
+def _verify_sections(data: bytes) -> int:
+    count = 0
+    position = 0
+    while position + 4 <= len(data):
+        size = int.from_bytes(data[position:position + 3], 'little')
+        section_type = data[position + 3]
+        if section_type == 0x02:
+            guid = uuid.UUID(bytes_le=data[position + 4:position + 20])
+            data_offset, = struct.unpack_from('<H', data, position + 20)
+            stream = data[position + data_offset:position + size]
+            if guid == LZMA_GUID:
+                inner = lzma.decompress(stream, format=lzma.FORMAT_ALONE)
+            else:
+                inner = gzip.decompress(stream)
+            count += _verify_sections(inner)
+        elif section_type == FV_IMAGE:
+            count += verify_volume(data[position + 4:position + size])
+        position += size + (-size % 4)
+    return count
@@ -0,0 +1,95 @@
+import os
+import stat
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+from python_uefi_reader.blob_store import LINK_MODES, BlobStore
+
+
+@pytest.fixture
+def umask():
+    mask = os.umask(0o022)
+    yield 0o022
+    os.umask(mask)
+
+
+def _tree(root):
+    files = {}
+    for directory, _, names in os.walk(str(root)):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, str(root))] = f.read()
+    return files
+
+
+def _mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+@pytest.mark.parametrize('link', LINK_MODES)
+def test_identical_payloads_are_stored_once(link, tmp_path, umask):
+    store = BlobStore(str(tmp_path / 'store'), link)
+    store.write(str(tmp_path / 'a'), b'payload')
+    store.write(str(tmp_path / 'b'), b'payload')
+    store.write(str(tmp_path / 'c'), b'other payload')
+
+    assert (store.blobs_written, store.blobs_reused) == (2, 1)
+    blob = store.put(b'payload')
+    for name in ('a', 'b'):
+        path = str(tmp_path / name)
+        assert open(path, 'rb').read() == b'payload'
+        assert _mode(path) == 0o666 & ~umask
+        if link == 'hardlink':
+            assert os.path.samefile(path, blob)
+        elif link == 'symlink':
+            assert os.readlink(path) == os.path.abspath(blob)
+        else:
+            assert not os.path.islink(path) and not os.path.samefile(path, blob)
+    assert _mode(blob) == 0o666 & ~umask
+    assert [name for name in os.listdir(os.path.dirname(blob)) if name.startswith('.tmp-')] == []
+
+
+@pytest.mark.parametrize('link', LINK_MODES)
+def test_existing_files_are_replaced(link, tmp_path):
+    store = BlobStore(str(tmp_path / 'store'), link)
+    path = tmp_path / 'file'
+    path.write_bytes(b'old')
+    store.write(str(path), b'new')
+    assert path.read_bytes() == b'new'
+    assert store.put(b'old') != store.put(b'new')
+
+
+def test_blob_paths_are_content_addressed(tmp_path):
+    import hashlib
+    store = BlobStore(str(tmp_path), algorithm='sha1')
+    digest = hashlib.sha1(b'payload').hexdigest()
+    assert store.put(b'payload') == os.path.join(str(tmp_path), digest[:2], digest)
+    assert open(store.blob_path(digest), 'rb').read() == b'payload'
+
+
+def test_unknown_link_mode(tmp_path):
+    with pytest.raises(ValueError, match='link mode'):
+        BlobStore(str(tmp_path), 'junction')
+
+
+@pytest.mark.parametrize('link', LINK_MODES)
+def test_extraction_through_the_store(link, tmp_path, umask):
+    plain = tmp_path / 'plain'
+    UEFI(firmware.image(), verbose=False).extract_uefi(str(plain), timestamp=None)
+    store = BlobStore(str(tmp_path / 'store'), link)
+    written = []
+    for variant, output in ((0, 'a'), (1, 'b')):
+        UEFI(firmware.image(variant), verbose=False).extract_uefi(str(tmp_path / output), store)
+        written.append(store.blobs_written)
+
+    expected = {name: data for name, data in _tree(plain).items() if not name.endswith('.inf')}
+    assert {name: data for name, data in _tree(tmp_path / 'a').items() if name in expected} == expected
+    # Only the BarDxe payload differs between the two variants
+    assert written[1] == written[0] + 1
+    assert sum(len(names) for _, _, names in os.walk(str(tmp_path / 'store'))) == written[1]
+    for directory, _, names in os.walk(str(tmp_path / 'b')):
+        for name in names:
+            assert _mode(os.path.join(directory, name)) == 0o666 & ~umask
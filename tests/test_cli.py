@@ -0,0 +1,110 @@
+import os
+import sys
+
+import pytest
+
+import firmware
+from python_uefi_reader import __main__ as cli
+from python_uefi_reader import daemon
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / 'uefi.img'
+    path.write_bytes(firmware.image())
+    return str(path)
+
+
+def _run(main, monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['uefi-reader'] + [str(a) for a in args])
+    main()
+
+
+def _generated_on(output):
+    headers = set()
+    for root, _, names in os.walk(str(output)):
+        for name in names:
+            if name.endswith('.inf'):
+                with open(os.path.join(root, name)) as f:
+                    headers.update(line for line in f if line.startswith('# GENERATED ON:'))
+    return headers
+
+
+@pytest.mark.parametrize('environment, argument, expected', [
+    ('0', None, '1970-01-01 00:00:00'),
+    ('86400', '1700000000', '2023-11-14 22:13:20'),
+    ('', '1700000000', '2023-11-14 22:13:20'),
+    ('not a number', '1700000000', '2023-11-14 22:13:20'),
+])
+def test_timestamp(environment, argument, expected, image_path, tmp_path, monkeypatch):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', environment)
+    args = [image_path, tmp_path / 'out'] + (['--timestamp', argument] if argument else [])
+    _run(cli.main, monkeypatch, *args)
+    assert _generated_on(tmp_path / 'out') == {f'# GENERATED ON: {expected}Z\n'}
+
+
+@pytest.mark.parametrize('environment', [None, '', '  '])
+def test_unset_or_empty_source_date_epoch_uses_now(environment, image_path, tmp_path, monkeypatch):
+    if environment is None:
+        monkeypatch.delenv('SOURCE_DATE_EPOCH', raising=False)
+    else:
+        monkeypatch.setenv('SOURCE_DATE_EPOCH', environment)
+    _run(cli.main, monkeypatch, image_path, tmp_path / 'out')
+    [header] = _generated_on(tmp_path / 'out')
+    assert not header.startswith('# GENERATED ON: 1970')
+
+
+def test_invalid_source_date_epoch(image_path, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', 'yesterday')
+    with pytest.raises(SystemExit) as e:
+        _run(cli.main, monkeypatch, image_path, tmp_path / 'out')
+    assert e.value.code == 2
+    assert "SOURCE_DATE_EPOCH: invalid timestamp: 'yesterday'" in capsys.readouterr().err
+    assert not (tmp_path / 'out').exists()
+
+    # Commands that take no timestamp do not read it
+    _run(cli.main, monkeypatch, image_path, tmp_path / 'inventory.ndjson', '--inventory')
+    assert (tmp_path / 'inventory.ndjson').stat().st_size > 0
+
+
+@pytest.mark.parametrize('value', ['', 'soon', str(10 ** 30)])
+def test_invalid_timestamp_argument(value, image_path, tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv('SOURCE_DATE_EPOCH', raising=False)
+    with pytest.raises(SystemExit) as e:
+        _run(cli.main, monkeypatch, image_path, tmp_path / 'out', '--timestamp', value)
+    assert e.value.code == 2
+    assert 'invalid timestamp' in capsys.readouterr().err
+
+
+def test_pinned_timestamp_is_reproducible(image_path, tmp_path, monkeypatch):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1700000000')
+    for name in ('a.zip', 'b.zip'):
+        _run(cli.main, monkeypatch, image_path, tmp_path / name, '--archive', 'zip', '--manifest', 'json')
+    assert (tmp_path / 'a.zip').read_bytes() == (tmp_path / 'b.zip').read_bytes()
+
+
+@pytest.mark.parametrize('value', ['yesterday', '99999999999999', '-99999999999999'])
+@pytest.mark.parametrize('main', [cli.main, daemon.main], ids=['cli', 'daemon'])
+def test_source_date_epoch_out_of_range(main, value, image_path, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', value)
+    args = ['extract'] if main is daemon.main else []
+    with pytest.raises(SystemExit) as e:
+        _run(main, monkeypatch, *args, image_path, tmp_path / 'out')
+    assert e.value.code == 2
+    assert f"SOURCE_DATE_EPOCH: invalid timestamp: {value!r}" in capsys.readouterr().err
+    assert not (tmp_path / 'out').exists()
+
+
+def test_daemon_client_rejects_invalid_timestamp_argument(image_path, tmp_path, monkeypatch, capsys):
+    monkeypatch.delenv('SOURCE_DATE_EPOCH', raising=False)
+    with pytest.raises(SystemExit) as e:
+        _run(daemon.main, monkeypatch, 'extract', image_path, tmp_path / 'out', '--timestamp', '99999999999999')
+    assert e.value.code == 2
+    assert "invalid timestamp: '99999999999999'" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('value', [99999999999999, 'soon'])
+def test_daemon_rejects_invalid_timestamp_requests(value, image_path, tmp_path):
+    request = {'command': 'extract', 'image': image_path, 'output': str(tmp_path / 'out'), 'timestamp': value}
+    with pytest.raises(ValueError, match='invalid timestamp'):
+        daemon.Daemon().handle(request)
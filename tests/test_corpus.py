@@ -0,0 +1,120 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import firmware
+from python_uefi_reader import Corpus, UEFI
+
+
+@pytest.fixture
+def images(tmp_path):
+    paths = []
+    for variant in range(2):
+        path = str(tmp_path / f'uefi{variant}.img')
+        with open(path, 'wb') as f:
+            f.write(firmware.image(variant))
+        paths.append(path)
+    return paths
+
+
+def _update(corpus, paths, **options):
+    with ThreadPoolExecutor(2) as executor:
+        return corpus.update(paths, executor, **options)
+
+
+def test_update_and_queries(tmp_path, images):
+    with Corpus(str(tmp_path / 'corpus.db')) as corpus:
+        result = _update(corpus, images)
+        assert sorted(result.indexed) == images and result.failed == []
+        assert len(corpus) == 2 and images[0] in corpus
+        assert corpus.build_ids() == [firmware.BUILD_ID]
+
+        assert [m.path for m in corpus.find_guid(firmware.FOO_DXE.upper())] == images
+        assert {m.name for m in corpus.find_name('*Dxe')} == {'FooDxe', 'BarDxe', 'GzDxe'}
+        assert [m.name for m in corpus.find_module('*/Bar1/*')] == ['BarDxe']
+
+        uefi = UEFI(firmware.image(), verbose=False)
+        bar = uefi.index.section(firmware.BAR_DXE, 'PE32').decompressed_image
+        matches = corpus.find_digest(hashlib.sha256(bar).hexdigest(), 'PE32')
+        assert [(m.path, m.section_type) for m in matches] == [(images[0], 'PE32')]
+
+        assert _update(corpus, images).unchanged == images
+        result = _update(corpus, images[:1], prune=True)
+        assert result.removed == [images[1]] and len(corpus) == 1
+        assert corpus.remove(images[0]) and not corpus.remove(images[0])
+
+
+def test_failed_images_are_reported(tmp_path):
+    path = str(tmp_path / 'junk.img')
+    with open(path, 'wb') as f:
+        f.write(b'not firmware')
+    with Corpus(str(tmp_path / 'corpus.db')) as corpus:
+        result = _update(corpus, [path])
+    assert [p for p, _ in result.failed] == [path]
+
+
+def test_hash_algorithm_is_recorded(tmp_path, images):
+    db = str(tmp_path / 'corpus.db')
+    with Corpus(db, 'blake2b') as corpus:
+        _update(corpus, images[:1])
+    with Corpus(db) as corpus:
+        assert corpus.hash_algorithm == 'blake2b'
+        uefi = UEFI(firmware.image(), verbose=False)
+        payload = uefi.index.section(firmware.DXE_CORE, 'PE32').decompressed_image
+        assert [m.name for m in corpus.find_digest(hashlib.blake2b(payload).hexdigest())] == ['DxeCore']
+    with Corpus(db, 'BLAKE2B') as corpus:
+        assert corpus.hash_algorithm == 'blake2b'
+    with pytest.raises(ValueError, match='blake2b digests'):
+        Corpus(db, 'sha256')
+    with Corpus(str(tmp_path / 'new.db')) as corpus:
+        assert corpus.hash_algorithm == 'sha256'
+
+
+def test_unknown_hash_algorithm(tmp_path):
+    db = str(tmp_path / 'corpus.db')
+    with pytest.raises(ValueError):
+        Corpus(db, 'no-such-hash')
+    with Corpus(db) as corpus:
+        assert corpus.hash_algorithm == 'sha256'
+    assert os.path.exists(db)
+
+
+def _plans(corpus, query):
+    statements = []
+    corpus._db.set_trace_callback(statements.append)
+    try:
+        query()
+    finally:
+        corpus._db.set_trace_callback(None)
+    return ' '.join(row[-1] for statement in statements
+                    for row in corpus._db.execute('EXPLAIN QUERY PLAN ' + statement))
+
+
+def test_prefix_queries_use_indexes(tmp_path, images):
+    with Corpus(str(tmp_path / 'corpus.db')) as corpus:
+        _update(corpus, images)
+        assert [m.name for m in corpus.find_module('QcomPkg/Drivers/Bar1/*')] == ['BarDxe']
+        assert [m.name for m in corpus.find_module('QcomPkg/*/Bar1.dll')] == ['BarDxe']
+        for query in (lambda: corpus.find_guid(firmware.FOO_DXE),
+                      lambda: corpus.find_name('Foo*'),
+                      lambda: corpus.find_module('QcomPkg/*'),
+                      lambda: corpus.find_digest('00' * 32, 'PE32'),
+                      lambda: corpus.by_build_id(firmware.BUILD_ID)):
+            plan = _plans(corpus, query)
+            assert 'SCAN' not in plan, plan
+        assert 'SCAN' in _plans(corpus, lambda: corpus.find_name('*Dxe'))
+
+
+def test_connection_is_closed_on_any_error(tmp_path, monkeypatch):
+    import sqlite3
+    path = tmp_path / 'corpus.db'
+    path.write_bytes(b'not a database' * 100)
+    connections = []
+    connect = sqlite3.connect
+    monkeypatch.setattr(sqlite3, 'connect', lambda *a, **k: connections.append(connect(*a, **k)) or connections[-1])
+    with pytest.raises(sqlite3.DatabaseError):
+        Corpus(str(path))
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[0].execute('SELECT 1')
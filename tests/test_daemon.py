@@ -0,0 +1,172 @@
+import json
+import os
+import socket
+import stat
+import tempfile
+import threading
+
+import pytest
+
+import firmware
+from python_uefi_reader.daemon import Daemon, DaemonClient, ImageCache, serve
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason="needs Unix sockets")
+
+
+@pytest.fixture
+def workdir():
+    # Short, so the socket path fits in sun_path
+    with tempfile.TemporaryDirectory(prefix='uefid') as path:
+        yield path
+
+
+@pytest.fixture
+def image_path(workdir):
+    path = os.path.join(workdir, 'uefi.img')
+    with open(path, 'wb') as f:
+        f.write(firmware.image())
+    return path
+
+
+def _serve(address, **options):
+    ready = threading.Event()
+    thread = threading.Thread(target=serve, args=(address, Daemon(ImageCache(2))),
+                              kwargs=dict(options, ready=ready), daemon=True)
+    thread.start()
+    assert ready.wait(5)
+    return thread
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def test_unix_socket_end_to_end(workdir, image_path):
+    address = os.path.join(workdir, 'd.sock')
+    thread = _serve(address)
+    assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+
+    with DaemonClient(address) as client:
+        assert client.probe(image_path)['build_id'] == firmware.BUILD_ID
+        records = [json.loads(line) for line in client.inventory(image_path).splitlines()]
+        assert records[-1]['build_id'] == firmware.BUILD_ID
+        assert client.section(image_path, firmware.DXE_CORE).startswith(b'MZ')
+        output = os.path.join(workdir, 'out')
+        assert client.extract(image_path, output, timestamp=0) == firmware.BUILD_ID
+        assert os.path.exists(os.path.join(output, firmware.BUILD_ID, 'DXE.inc'))
+        assert client.stats()['hits'] >= 2
+        with pytest.raises(ValueError, match='No PE32 section'):
+            client.section(image_path, firmware.LOGO)
+        client.shutdown()
+    thread.join(5)
+    assert not os.path.exists(address)
+
+
+def test_serve_refuses_a_live_socket(workdir):
+    address = os.path.join(workdir, 'd.sock')
+    _serve(address)
+    with pytest.raises(ValueError, match='already listening'):
+        serve(address)
+    with DaemonClient(address) as client:
+        assert client.stats()['cached'] == 0
+        client.shutdown()
+
+
+def test_serve_replaces_a_stale_socket(workdir):
+    address = os.path.join(workdir, 'd.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(address)
+    stale.close()
+    _serve(address)
+    with DaemonClient(address) as client:
+        client.shutdown()
+
+
+def test_serve_does_not_remove_other_files(workdir):
+    address = os.path.join(workdir, 'notes.txt')
+    with open(address, 'w') as f:
+        f.write('keep')
+    with pytest.raises(ValueError, match='not a socket'):
+        serve(address)
+    assert os.path.exists(address)
+
+
+def test_tcp_requires_the_token(workdir, image_path):
+    address = ('127.0.0.1', _free_port())
+    token_path = os.path.join(workdir, 'd.token')
+    thread = _serve(address, token_path=token_path)
+    if hasattr(os, 'getuid'):
+        assert stat.S_IMODE(os.stat(token_path).st_mode) == 0o600
+
+    with socket.create_connection(address) as raw:
+        raw.sendall(json.dumps({'command': 'probe', 'image': image_path, 'token': 'guess'}).encode() + b'\n')
+        header = json.loads(raw.makefile('rb').readline())
+    assert not header['ok'] and 'PermissionError' in header['error']
+
+    with DaemonClient(address, token_path) as client:
+        assert client.probe(image_path)['build_id'] == firmware.BUILD_ID
+        client.shutdown()
+    thread.join(5)
+    assert not os.path.exists(token_path)
+
+
+def test_binding_leaves_the_umask_alone(workdir):
+    umask = os.umask(0o022)
+    try:
+        address = os.path.join(workdir, 'd.sock')
+        _serve(address)
+        assert os.umask(0o022) == 0o022
+        assert stat.S_IMODE(os.stat(address).st_mode) == 0o600
+        with DaemonClient(address) as client:
+            client.shutdown()
+    finally:
+        os.umask(umask)
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="needs Unix permissions")
+def test_client_refuses_sockets_others_can_use(workdir):
+    address = os.path.join(workdir, 'd.sock')
+    _serve(address)
+    os.chmod(address, 0o666)
+    with pytest.raises(ValueError, match='private'):
+        DaemonClient(address)
+    os.chmod(address, 0o600)
+
+    other = os.path.join(workdir, 'notes.txt')
+    with open(other, 'w') as f:
+        f.write('not a socket')
+    os.chmod(other, 0o600)
+    with pytest.raises(ValueError, match='not a socket'):
+        DaemonClient(other)
+
+    with DaemonClient(address) as client:
+        client.shutdown()
+
+
+def test_cache_is_bounded_by_bytes(workdir):
+    paths = []
+    for variant in range(3):
+        path = os.path.join(workdir, f'uefi{variant}.img')
+        with open(path, 'wb') as f:
+            f.write(firmware.image(variant))
+        paths.append(path)
+    size = ImageCache().get(paths[0]).resident_bytes
+    assert size > len(firmware.image())
+
+    cache = ImageCache(capacity=8, max_bytes=2 * size + size // 2)
+    for path in paths:
+        cache.get(path)
+    assert len(cache) == 2 and cache.bytes <= cache.max_bytes
+    cache.get(paths[2])
+    assert cache.hits == 1
+    cache.get(paths[0])
+    assert cache.misses == 4
+
+    small = ImageCache(max_bytes=size - 1)
+    assert small.get(paths[0]) is not small.get(paths[0])
+    assert (len(small), small.bytes, small.misses) == (0, 0, 2)
+
+    cache.clear()
+    assert (len(cache), cache.bytes) == (0, 0)
@@ -0,0 +1,108 @@
+import uuid
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+from python_uefi_reader.depex import MAX_DEPTH, decode
+
+A = 'aaaaaaaa-0000-0000-0000-00000000000a'
+B = 'aaaaaaaa-0000-0000-0000-00000000000b'
+
+
+def _push(guid):
+    return b'\x02' + uuid.UUID(guid).bytes_le
+
+
+def test_queries_accept_guid_strings():
+    graph = UEFI(firmware.image(), verbose=False).dependency_graph
+    for foo in (firmware.FOO_DXE, firmware.FOO_DXE.upper(), uuid.UUID(firmware.FOO_DXE)):
+        assert foo in graph
+        assert graph.expression(foo).protocols == {uuid.UUID(firmware.PROTOCOL)}
+        assert not graph.is_satisfiable(foo)
+        assert graph.is_satisfiable(foo, [firmware.PROTOCOL])
+        assert graph.missing(foo) == [uuid.UUID(firmware.PROTOCOL)]
+        assert graph.missing(foo, {firmware.PROTOCOL.upper()}) == []
+    assert graph.dependents(firmware.PROTOCOL) == [uuid.UUID(firmware.FOO_DXE)]
+    assert graph.expression(firmware.LOGO) is None
+    assert uuid.UUID(firmware.FOO_DXE) in graph.satisfiable([firmware.PROTOCOL])
+
+
+def test_dispatch_order_accepts_guid_strings():
+    image = firmware.volume([
+        firmware.ffs(firmware.FOO_DXE, 0x07, firmware.sections(firmware.depex([firmware.PROTOCOL]), firmware.ui('Foo'))),
+        firmware.ffs(firmware.BAR_DXE, 0x07, firmware.sections(firmware.ui('Bar'))),
+    ])
+    graph = UEFI(image, verbose=False).dependency_graph
+    assert graph.dispatch_order() == [uuid.UUID(firmware.BAR_DXE)]
+    assert graph.dispatch_order([firmware.PROTOCOL]) == [uuid.UUID(firmware.FOO_DXE), uuid.UUID(firmware.BAR_DXE)]
+    assert graph.dispatch_order(produces={firmware.BAR_DXE.upper(): [firmware.PROTOCOL]}) == [
+        uuid.UUID(firmware.BAR_DXE), uuid.UUID(firmware.FOO_DXE)]
+
+
+def test_general_expressions():
+    expression = decode(_push(A) + b'\x05' + _push(B) + b'\x04\x08')
+    assert expression.required is None
+    assert expression.evaluate(set())
+    assert expression.evaluate({uuid.UUID(A), uuid.UUID(B)})
+    assert not expression.evaluate({uuid.UUID(A)})
+    assert str(expression).startswith('(NOT ')
+
+
+@pytest.mark.parametrize('depth, ok', [(MAX_DEPTH, True), (MAX_DEPTH + 1, False), (100000, False)])
+def test_nesting_depth(depth, ok):
+    # PUSH A, NOT * (depth - 1): one level per opcode, as a chain of ANDs would be
+    data = _push(A) + b'\x05' * (depth - 1) + b'\x08'
+    if ok:
+        assert decode(data).evaluate(set()) == (depth % 2 == 0)
+    else:
+        with pytest.raises(ValueError, match='nested deeper'):
+            decode(data)
+
+
+def test_long_conjunction_stays_a_set():
+    data = _push(A) + b''.join(_push(str(uuid.UUID(int=i))) + b'\x03' for i in range(MAX_DEPTH - 1)) + b'\x08'
+    assert len(decode(data).required) == MAX_DEPTH
+
+
+@pytest.mark.parametrize('data, message', [
+    (b'\x03\x08', 'underflow'),
+    (_push(A) + _push(B) + b'\x08', 'leaves 2 values'),
+    (b'\x02' + bytes(8), 'Truncated'),
+    (b'\x20\x08', 'Unknown'),
+    (_push(A), 'no END'),
+])
+def test_malformed(data, message):
+    with pytest.raises(ValueError, match=message):
+        decode(data)
+
+
+def _driver(guid, depex_body=None):
+    parts = [firmware.section(firmware.DXE_DEPEX, depex_body)] if depex_body is not None else []
+    return firmware.ffs(guid, 0x07, firmware.sections(*parts, firmware.ui(guid[-4:])))
+
+
+def _guid(i):
+    return f'bbbbbbbb-0000-0000-0000-{i:012x}'
+
+
+def test_before_and_after_drivers_are_dispatched_around_their_target():
+    x, y, z, w = (_guid(i) for i in range(4))
+    image = firmware.volume([
+        _driver(w, b'\x01' + uuid.UUID(y).bytes_le + b'\x08'),  # AFTER y
+        _driver(y, b'\x01' + uuid.UUID(x).bytes_le + b'\x08'),  # AFTER x
+        _driver(z, b'\x00' + uuid.UUID(x).bytes_le + b'\x08'),  # BEFORE x
+        _driver(x),
+    ])
+    graph = UEFI(image, verbose=False).dependency_graph
+    assert graph.dispatch_order() == [uuid.UUID(g) for g in (z, x, y, w)]
+
+
+@pytest.mark.parametrize('opcode', [b'\x00', b'\x01'])
+def test_long_before_and_after_chains(opcode):
+    count = 3000
+    drivers = [_driver(_guid(0))]
+    drivers += [_driver(_guid(i), opcode + uuid.UUID(_guid(i - 1)).bytes_le + b'\x08') for i in range(1, count)]
+    graph = UEFI(firmware.volume(drivers), verbose=False).dependency_graph
+    expected = [uuid.UUID(_guid(i)) for i in range(count)]
+    assert graph.dispatch_order() == (expected if opcode == b'\x01' else expected[::-1])
@@ -0,0 +1,112 @@
+import uuid
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI, IndexFile, diff_images
+
+
+@pytest.fixture(params=['uefi', 'hashed', 'index'])
+def load(request, tmp_path):
+    """Turn image bytes into the kind of diff input under test."""
+    opened = []
+
+    def load(data: bytes):
+        if request.param == 'uefi':
+            return UEFI(data, verbose=False)
+        if request.param == 'hashed':
+            return UEFI(data, verbose=False, hash_algorithm='sha256')
+        name = f'uefi{len(opened)}'
+        image_path = str(tmp_path / f'{name}.img')
+        with open(image_path, 'wb') as f:
+            f.write(data)
+        UEFI(data, verbose=False).save_index(str(tmp_path / f'{name}.idx'))
+        opened.append(IndexFile(str(tmp_path / f'{name}.idx'), image_path))
+        return opened[-1]
+
+    yield load
+    for index in opened:
+        index.close()
+
+
+def _guids(entries):
+    return [str(entry.guid) for entry in entries]
+
+
+def test_identical_images(load):
+    result = diff_images(load(firmware.image()), load(firmware.image()))
+    assert not result
+    assert result.unchanged == len(UEFI(firmware.image(), verbose=False).efis)
+
+
+def test_changed_section(load):
+    result = diff_images(load(firmware.image(0)), load(firmware.image(1)))
+    assert result
+    [change] = result.changed
+    assert (str(change.guid), change.name, change.old_type, change.new_type) == \
+        (firmware.BAR_DXE, 'BarDxe', 'DRIVER', 'DRIVER')
+    assert [(s.type, s.ordinal, s.change) for s in change.sections] == [('PE32', 0, 'changed')]
+    assert result.added == result.removed == []
+    assert not result.apriori_reordered
+
+
+def test_added_and_removed_files(load):
+    old = firmware.volume([
+        firmware.ffs(firmware.DXE_CORE, 0x07, firmware.sections(firmware.pe(firmware.build_path('DxeCore')))),
+        firmware.ffs(firmware.FOO_DXE, 0x07, firmware.sections(firmware.ui('FooDxe'))),
+    ])
+    new = firmware.volume([
+        firmware.ffs(firmware.DXE_CORE, 0x07, firmware.sections(firmware.pe(firmware.build_path('DxeCore')))),
+        firmware.ffs(firmware.BAR_DXE, 0x07, firmware.sections(firmware.ui('BarDxe'))),
+        firmware.ffs(firmware.LOGO, 0x02, firmware.sections(firmware.ui('Logo'), firmware.ui('Logo'))),
+    ])
+    result = diff_images(load(old), load(new))
+    assert _guids(result.removed) == [firmware.FOO_DXE]
+    assert _guids(result.added) == [firmware.BAR_DXE, firmware.LOGO]
+    assert result.removed[0].name == 'FooDxe'
+    assert result.changed == [] and result.unchanged == 1
+
+
+def test_apriori_is_compared_as_a_sequence(load):
+    old = load(firmware.image(apriori=(firmware.FOO_DXE, firmware.DXE_CORE)))
+    reordered = diff_images(old, load(firmware.image(apriori=(firmware.DXE_CORE, firmware.FOO_DXE))))
+    assert reordered and reordered.apriori_reordered
+    assert reordered.apriori_added == reordered.apriori_removed == []
+    assert reordered.changed == []
+
+    extended = diff_images(old, load(firmware.image(apriori=(firmware.FOO_DXE, firmware.BAR_DXE, firmware.DXE_CORE))))
+    assert extended.apriori_added == [uuid.UUID(firmware.BAR_DXE)]
+    assert not extended.apriori_reordered
+
+    shrunk = diff_images(old, load(firmware.image(apriori=(firmware.DXE_CORE,))))
+    assert shrunk.apriori_removed == [uuid.UUID(firmware.FOO_DXE)]
+    assert not shrunk.apriori_reordered
+
+
+def test_uefi_against_index(tmp_path):
+    image_path = str(tmp_path / 'uefi.img')
+    with open(image_path, 'wb') as f:
+        f.write(firmware.image(1))
+    UEFI(firmware.image(1), verbose=False).save_index(str(tmp_path / 'uefi.idx'))
+    with IndexFile(str(tmp_path / 'uefi.idx'), image_path) as index:
+        assert index.apriori_order == [uuid.UUID(firmware.FOO_DXE), uuid.UUID(firmware.DXE_CORE)]
+        result = UEFI(firmware.image(0), verbose=False, hash_algorithm='sha256').diff(index)
+    assert [str(change.guid) for change in result.changed] == [firmware.BAR_DXE]
+
+
+def test_unchanged_index_files_are_not_decompressed(tmp_path):
+    indexes = []
+    for name, variant in (('old', 0), ('new', 0), ('bar', 1)):
+        with open(str(tmp_path / f'{name}.img'), 'wb') as f:
+            f.write(firmware.image(variant))
+        UEFI(firmware.image(variant), verbose=False).save_index(str(tmp_path / f'{name}.idx'))
+        indexes.append(IndexFile(str(tmp_path / f'{name}.idx'), str(tmp_path / f'{name}.img')))
+    old, new, bar = indexes
+    try:
+        assert not diff_images(old, new)
+        assert old.decompressed_bytes == new.decompressed_bytes == 0
+        assert diff_images(old, bar)
+        assert bar.decompressed_bytes > 0
+    finally:
+        for index in indexes:
+            index.close()
@@ -0,0 +1,52 @@
+import gzip
+import hashlib
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+
+
+def test_no_digests_by_default():
+    uefi = UEFI(firmware.image(), verbose=False)
+    assert all(efi.digest is None for efi in uefi.efis)
+    assert all(s.digest is None for efi in uefi.efis for s in efi.section_elements)
+
+
+@pytest.mark.parametrize('algorithm', ['sha256', 'blake2b', 'md5'])
+def test_digests(algorithm):
+    image = firmware.image()
+    uefi = UEFI(image, verbose=False, hash_algorithm=algorithm)
+
+    def digest(data):
+        return hashlib.new(algorithm, bytes(data)).hexdigest()
+
+    core = uefi.index.get(firmware.DXE_CORE)
+    assert core.digest == digest(image[core.offset:core.offset + core.size])
+    for efi in uefi.efis:
+        for section in efi.section_elements:
+            assert section.digest == digest(section.decompressed_image)
+
+    plain = uefi.index.section(firmware.DXE_CORE, 'PE32')
+    assert plain.compressed_digest is None
+
+    gz = uefi.index.section(firmware.GZ_DXE, 'PE32')
+    region = gz.container.region
+    assert region.type == 'GZIP'
+    stream = image[region.data_offset:region.offset + region.size]
+    assert gz.compressed_digest == region.digest == digest(stream)
+    inner = firmware.sections(firmware.pe(firmware.build_path('Gz')), firmware.ui('GzDxe'))
+    assert gzip.decompress(stream) == inner
+    assert region.decompressed_digest == digest(inner)
+
+    foo = uefi.index.section(firmware.FOO_DXE, 'PE32')
+    assert foo.compressed_digest is not None and foo.compressed_digest != gz.compressed_digest
+
+
+def test_identical_payloads_share_digests():
+    first = UEFI(firmware.image(0), verbose=False, hash_algorithm='sha256')
+    second = UEFI(firmware.image(1), verbose=False, hash_algorithm='sha256')
+    for guid, same in ((firmware.DXE_CORE, True), (firmware.BAR_DXE, False)):
+        a = first.index.section(guid, 'PE32').digest
+        b = second.index.section(guid, 'PE32').digest
+        assert (a == b) == same
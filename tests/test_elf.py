@@ -0,0 +1,75 @@
+import struct
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI, elf
+from python_uefi_reader.probe import probe_buffer
+
+# A hash segment and a loader segment with bytes that look like a volume header or build ID
+HASH = bytes(0x28) + b'_FVH' + b'QC_IMAGE_VERSION_STRING=DECOY-HASH\x00' + b'\xaa' * 0x40
+LOADER = bytes(0x40) + b'_FVH' + bytes(0x100)
+
+
+def _xbl(elf_class=2, big_endian=False):
+    return firmware.elf([(elf.PT_NULL, HASH), (elf.PT_LOAD, LOADER), (elf.PT_LOAD, firmware.image())],
+                        elf_class, big_endian)
+
+
+@pytest.mark.parametrize('elf_class', [elf.ELFCLASS32, elf.ELFCLASS64])
+@pytest.mark.parametrize('big_endian', [False, True])
+def test_volume_is_found_in_its_segment(elf_class, big_endian):
+    data = _xbl(elf_class, big_endian)
+    raw = UEFI(firmware.image(), verbose=False)
+    uefi = UEFI(data, verbose=False)
+
+    assert [s.type for s in uefi.segments] == [elf.PT_NULL, elf.PT_LOAD, elf.PT_LOAD]
+    assert [s.is_loadable for s in uefi.segments] == [False, True, True]
+    volume = uefi.segments[2].offset
+    assert data[volume:volume + len(firmware.image())] == firmware.image()
+    assert [efi.guid for efi in uefi.efis] == [efi.guid for efi in raw.efis]
+    assert uefi.efis[0].path[0].offset == volume + raw.efis[0].path[0].offset
+    assert uefi.build_id == firmware.BUILD_ID
+
+    result = probe_buffer(data)
+    assert result.volumes[0][0] == uefi.efis[0].path[0].offset
+    assert result.build_id == firmware.BUILD_ID
+
+
+def test_segments():
+    data = _xbl()
+    segments = elf.read_segments(data)
+    assert [(s.index, s.file_size) for s in segments] == [(0, len(HASH)), (1, len(LOADER)), (2, len(firmware.image()))]
+    assert elf.loadable_ranges(segments) == [(s.offset, s.end) for s in segments[1:]]
+    assert elf.search_ranges(data) == elf.loadable_ranges(segments)
+    assert elf.search_ranges(firmware.image()) == [(0, len(firmware.image()))]
+
+    truncated = data[:segments[2].offset + 0x100]
+    assert elf.read_segments(truncated)[2].end == len(truncated)
+
+
+@pytest.mark.parametrize('patch, message', [
+    (lambda d: b'\x7fELX' + d[4:], 'Not an ELF'),
+    (lambda d: d[:4] + b'\x03' + d[5:], 'class'),
+    (lambda d: d[:5] + b'\x03' + d[6:], 'byte order'),
+    (lambda d: d[:0x20] + struct.pack('<Q', len(d)) + d[0x28:], 'beyond the end'),
+    (lambda d: d[:0x36] + struct.pack('<H', 8) + d[0x38:], 'too small'),
+])
+def test_invalid_program_headers(patch, message):
+    with pytest.raises(ValueError, match=message):
+        elf.read_segments(patch(_xbl()))
+
+
+def test_unreadable_program_headers_search_the_whole_image():
+    data = _xbl()
+    data = data[:0x20] + struct.pack('<Q', len(data)) + data[0x28:]
+    uefi = UEFI(data, verbose=False)
+    assert uefi.segments == []
+    assert len(uefi.efis) == 6
+    assert elf.search_ranges(data) == [(0, len(data))]
+
+
+def test_no_volume_in_the_segments():
+    data = firmware.elf([(elf.PT_LOAD, LOADER), (elf.PT_NULL, firmware.image())])
+    with pytest.raises(ValueError, match='No firmware volume'):
+        UEFI(data, verbose=False)
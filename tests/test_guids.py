@@ -0,0 +1,43 @@
+import gc
+import pickle
+import uuid
+
+import firmware
+from python_uefi_reader import UEFI, guids
+
+
+def test_interning_shares_one_object_per_value():
+    raw = uuid.UUID(firmware.FOO_DXE).bytes_le
+    guid = guids.intern_guid(raw)
+    assert guids.intern_guid(bytes(raw)) is guid
+    assert guids.guid_from_string(firmware.FOO_DXE) is guid
+    assert guid == uuid.UUID(firmware.FOO_DXE) and hash(guid) == hash(uuid.UUID(firmware.FOO_DXE))
+    assert guid.raw == raw
+    assert str(guid) == firmware.FOO_DXE and guid.upper == firmware.FOO_DXE.upper()
+    assert pickle.loads(pickle.dumps(guid)) is guid
+    assert guids.intern_guid(guids.DXE_APRIORI_GUID.raw).name == 'DXE_APRIORI'
+
+
+def test_unreferenced_guids_are_released():
+    gc.collect()
+    before = guids.interned_count()
+    raw = bytes(range(0xA0, 0xB0))
+    guid = guids.intern_guid(raw)
+    assert guids.interned_count() == before + 1
+
+    del guid
+    gc.collect()
+    assert guids.interned_count() == before
+    assert guids.intern_guid(raw).raw == raw
+
+
+def test_guids_of_a_parsed_image_are_released_with_it():
+    gc.collect()
+    before = guids.interned_count()
+    uefi = UEFI(firmware.image(), verbose=False)
+    assert guids.interned_count() > before
+    assert guids.intern_guid(uuid.UUID(firmware.GZ_DXE).bytes_le) is uefi.index.get(firmware.GZ_DXE).guid
+
+    del uefi
+    gc.collect()
+    assert guids.interned_count() == before
@@ -0,0 +1,72 @@
+import uuid
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI, UEFIIndex
+
+
+@pytest.fixture(scope='module')
+def uefi():
+    return UEFI(firmware.image(), verbose=False)
+
+
+def test_lookups_by_guid(uefi):
+    index = uefi.index
+    assert len(index) == len(uefi.efis)
+    assert index.guids() == [efi.guid for efi in uefi.efis]
+    for efi in uefi.efis:
+        for key in (efi.guid, str(efi.guid), str(efi.guid).upper()):
+            assert key in index
+            assert index.get(key) is efi
+            assert index.files(key) == [efi]
+            assert index.sections(key) == efi.section_elements
+    assert firmware.NESTED_FV not in index
+    assert index.get(firmware.NESTED_FV) is None
+    assert index.files(firmware.NESTED_FV) == [] and index.sections(firmware.NESTED_FV) == []
+
+
+def test_lookups_by_section_type(uefi):
+    index = uefi.index
+    foo = index.get(firmware.FOO_DXE)
+    assert index.section(firmware.FOO_DXE, 'PE32') is foo.section_elements[1]
+    assert index.sections(firmware.FOO_DXE, 'DXE_DEPEX') == [foo.section_elements[0]]
+    assert index.section(firmware.FOO_DXE, 'TE') is None
+    assert index.section(firmware.LOGO, 'RAW').decompressed_image == b'rawdata' * 10
+
+    pe32 = index.by_section_type('PE32')
+    assert [str(efi.guid) for efi, _ in pe32] == [firmware.DXE_CORE, firmware.FOO_DXE, firmware.BAR_DXE,
+                                                  firmware.GZ_DXE]
+    assert all(section.type == 'PE32' and section in efi.section_elements for efi, section in pe32)
+    assert index.by_section_type('TE') == []
+
+
+def test_lookups_by_name(uefi):
+    index = uefi.index
+    assert index.names() == ['DxeCore', 'Logo File', 'FooDxe', 'BarDxe', 'GzDxe']
+    assert index.by_name('Logo File') == [index.get(firmware.LOGO)]
+    assert index.by_name('NoSuchDxe') == []
+
+
+def test_repeated_guids_keep_every_file():
+    inner = firmware.volume([firmware.ffs(firmware.FOO_DXE, 0x07, firmware.sections(firmware.ui('Inner')))])
+    image = firmware.volume([
+        firmware.ffs(firmware.FOO_DXE, 0x07, firmware.sections(firmware.ui('Outer'))),
+        firmware.ffs(firmware.NESTED_FV, 0x0B, firmware.section(firmware.FV_IMAGE, inner)),
+    ])
+    index = UEFI(image, verbose=False).index
+    assert len(index) == 2 and index.guids() == [uuid.UUID(firmware.FOO_DXE)]
+    assert [f.section_elements[0].name for f in index.files(firmware.FOO_DXE)] == ['Outer', 'Inner']
+    assert index.get(firmware.FOO_DXE).section_elements[0].name == 'Outer'
+    assert [s.name for s in index.sections(firmware.FOO_DXE, 'UI')] == ['Outer', 'Inner']
+    assert len(index.by_name('Inner')) == 1
+
+
+def test_index_built_from_files(uefi):
+    index = UEFIIndex(uefi.efis[:2])
+    assert len(index) == 2
+    assert firmware.DXE_CORE in index and firmware.FOO_DXE not in index
+    index.add(uefi.efis[3])
+    assert index.get(firmware.FOO_DXE) is uefi.efis[3]
+    with pytest.raises(ValueError):
+        index.get('not a guid')
@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+import firmware
+from python_uefi_reader import IndexFile, UEFI, index_file
+from python_uefi_reader.limits import DecompressionLimitError
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    image_path = str(tmp_path / 'uefi.img')
+    index_path = str(tmp_path / 'uefi.idx')
+    with open(image_path, 'wb') as f:
+        f.write(firmware.image())
+    uefi = UEFI(firmware.image(), verbose=False)
+    uefi.save_index(index_path)
+    return uefi, index_path, image_path
+
+
+def test_round_trip(indexed):
+    uefi, index_path, image_path = indexed
+    with IndexFile(index_path, image_path) as index:
+        assert index.build_id == firmware.BUILD_ID
+        assert index.image_size == uefi.image_size
+        assert len(index.file_records()) == len(uefi.efis)
+        assert index.load_priority == uefi.load_priority
+        assert index.get(firmware.FOO_DXE).name == 'FooDxe'
+        assert index.get(firmware.FOO_DXE.upper()).name == 'FooDxe'
+        assert [r.type for r in index.encapsulations(index.get(firmware.FOO_DXE))] == ['LZMA']
+        for efi in uefi.efis:
+            (record,) = index.files(efi.guid)
+            assert (record.type, record.offset, record.size) == (efi.type, efi.offset, efi.size)
+            sections = index.sections(record)
+            assert [s.type for s in sections] == [s.type for s in efi.section_elements]
+            for section_record, section in zip(sections, efi.section_elements):
+                assert index.read(section_record) == section.decompressed_image
+        pe_record = index.section(firmware.BAR_DXE, 'PE32')
+        assert index.image_info(pe_record) is uefi.index.section(firmware.BAR_DXE, 'PE32').image_info is None
+
+
+def test_payloads_need_the_image(indexed):
+    _, index_path, _ = indexed
+    with IndexFile(index_path) as index:
+        with pytest.raises(ValueError, match='No image path'):
+            index.read(index.section(firmware.DXE_CORE, 'PE32'))
+
+
+def test_wrong_image_is_never_used(indexed, tmp_path):
+    _, index_path, image_path = indexed
+    with open(image_path, 'ab') as f:
+        f.write(b'\x00')
+    with IndexFile(index_path, image_path) as index:
+        record = index.section(firmware.DXE_CORE, 'PE32')
+        for _ in range(2):
+            with pytest.raises(ValueError, match='does not match'):
+                index.read(record)
+
+
+def test_decompression_limits(indexed):
+    uefi, index_path, image_path = indexed
+    with IndexFile(index_path, image_path, max_section_size=64) as index:
+        assert index.read(index.section(firmware.DXE_CORE, 'PE32')).startswith(b'MZ')
+        with pytest.raises(DecompressionLimitError) as raised:
+            index.read(index.section(firmware.GZ_DXE, 'PE32'))
+        assert raised.value.kind == 'section'
+    with IndexFile(index_path, image_path, max_image_size=uefi.decompressed_bytes - 1) as index:
+        index.read(index.section(firmware.FOO_DXE, 'PE32'))
+        with pytest.raises(DecompressionLimitError) as raised:
+            index.read(index.section(firmware.GZ_DXE, 'PE32'))
+        assert raised.value.kind == 'image'
+
+
+def test_large_file_sizes(indexed, tmp_path):
+    uefi, _, image_path = indexed
+    uefi.efis[0].size = 0x1_0000_0018
+    index_path = str(tmp_path / 'large.idx')
+    uefi.save_index(index_path)
+    with IndexFile(index_path, image_path) as index:
+        assert index.files(uefi.efis[0].guid)[0].size == 0x1_0000_0018
+
+
+def _open_descriptors():
+    return len(os.listdir('/proc/self/fd'))
+
+
+@pytest.mark.parametrize('size', [0, 8, index_file.HEADER.size - 1, index_file.HEADER.size + 10, -1])
+def test_truncated_files_are_rejected_and_closed(indexed, tmp_path, size):
+    _, index_path, _ = indexed
+    with open(index_path, 'rb') as f:
+        data = f.read()
+    path = tmp_path / 'truncated.idx'
+    path.write_bytes(data[:size])
+    before = _open_descriptors() if os.path.isdir('/proc/self/fd') else None
+    with pytest.raises(ValueError):
+        IndexFile(str(path))
+    if before is not None:
+        assert _open_descriptors() == before
+
+
+def test_unterminated_strings_are_rejected(indexed, tmp_path):
+    uefi, index_path, _ = indexed
+    with open(index_path, 'rb') as f:
+        data = bytearray(f.read())
+    header = index_file.HEADER.unpack_from(data, 0)
+    string_table_offset, string_table_size, build_id = header[5:8]
+    data[string_table_offset + build_id:string_table_offset + string_table_size] = \
+        b'x' * (string_table_size - build_id)
+    path = tmp_path / 'strings.idx'
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match='Invalid string'):
+        IndexFile(str(path))
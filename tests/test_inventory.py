@@ -0,0 +1,119 @@
+import io
+import json
+import sys
+
+import firmware
+from python_uefi_reader import UEFI
+from python_uefi_reader import __main__ as cli
+from python_uefi_reader.inventory import INVENTORY_VERSION
+
+FILE_KEYS = {'record', 'guid', 'type', 'name', 'module', 'offset', 'size', 'header_size', 'codec', 'path', 'digest'}
+SECTION_KEYS = {'record', 'file', 'ordinal', 'type', 'name', 'offset', 'size', 'header_size', 'payload_size',
+                'codec', 'depth', 'path', 'digest', 'image'}
+
+
+def _records(text: str) -> list:
+    assert text.endswith('\n')
+    return [json.loads(line) for line in text.splitlines()]
+
+
+def _inventory(data: bytes, **kwargs) -> list:
+    stream = io.StringIO()
+    UEFI.write_inventory(data, stream, **kwargs)
+    return _records(stream.getvalue())
+
+
+def test_records_follow_parse_order():
+    records = _inventory(firmware.image())
+    files = [r for r in records if r['record'] == 'file']
+    assert [r['guid'] for r in files] == [
+        firmware.DXE_CORE, firmware.LOGO, firmware.RAW_FILE, firmware.FOO_DXE, firmware.BAR_DXE, firmware.GZ_DXE]
+    assert all(set(r) == FILE_KEYS for r in files)
+
+    # Each file record is followed by the records of its sections, numbered in order
+    current = None
+    for record in records[:-1]:
+        if record['record'] == 'file':
+            current, ordinal = record['guid'], 0
+        else:
+            assert set(record) == SECTION_KEYS
+            assert (record['file'], record['ordinal']) == (current, ordinal)
+            ordinal += 1
+
+
+def test_file_and_section_fields():
+    records = _inventory(firmware.image())
+    by_guid = {r['guid']: r for r in records if r['record'] == 'file'}
+
+    core = by_guid[firmware.DXE_CORE]
+    assert (core['type'], core['name'], core['module']) == ('DRIVER', 'DxeCore', 'QcomPkg/Drivers/DxeCore/DxeCore.inf')
+    assert core['codec'] is None
+    assert core['path'] == [{'type': 'FV', 'offset': 0x100, 'size': core['path'][0]['size']}]
+    assert (by_guid[firmware.LOGO]['type'], by_guid[firmware.LOGO]['module']) == ('FREEFORM', None)
+    assert (by_guid[firmware.RAW_FILE]['type'], by_guid[firmware.RAW_FILE]['name']) == ('RAW', None)
+
+    foo = by_guid[firmware.FOO_DXE]
+    assert foo['codec'] == 'LZMA'
+    assert [c['type'] for c in foo['path']] == ['FV', 'LZMA', 'FV']
+
+    sections = [r for r in records if r['record'] == 'section']
+    [depex] = [r for r in sections if r['type'] == 'DXE_DEPEX']
+    assert (depex['file'], depex['depth'], depex['codec']) == (firmware.FOO_DXE, 2, 'LZMA')
+    [gzip] = [r for r in sections if r['file'] == firmware.GZ_DXE and r['type'] == 'PE32']
+    assert (gzip['codec'], gzip['depth'], gzip['payload_size']) == ('GZIP', 1, gzip['size'] - gzip['header_size'])
+    [logo] = [r for r in sections if r['file'] == firmware.LOGO and r['type'] == 'RAW']
+    assert logo['payload_size'] == len(b'rawdata' * 10)
+
+
+def test_image_record_is_last():
+    data = firmware.image(apriori=(firmware.GZ_DXE, firmware.DXE_CORE, firmware.FOO_DXE))
+    records = _inventory(data)
+    assert [r['record'] for r in records].count('image') == 1
+    assert records[-1] == {
+        'record': 'image',
+        'version': INVENTORY_VERSION,
+        'build_id': firmware.BUILD_ID,
+        'image_size': len(data),
+        'files': 6,
+        'apriori': [firmware.GZ_DXE, firmware.DXE_CORE, firmware.FOO_DXE],
+    }
+
+
+def test_digests():
+    records = _inventory(firmware.image(), hash_algorithm='sha256')
+    assert all(len(r['digest']) == 64 for r in records if r['record'] != 'image')
+    assert all(r['digest'] is None for r in _inventory(firmware.image()) if r['record'] != 'image')
+
+
+def test_records_are_written_while_parsing():
+    stream = io.StringIO()
+    seen = []
+
+    def progress(event):
+        if event.phase == 'volume':
+            seen.append(stream.getvalue().count('\n'))
+
+    UEFI.write_inventory(firmware.image(), stream, progress=progress)
+    total = len(_records(stream.getvalue()))
+    assert seen[0] == 0
+    assert 0 < max(seen) < total
+
+
+def test_parsed_image_writes_the_same_records():
+    stream = io.StringIO()
+    UEFI(firmware.image(), verbose=False).write_inventory_to(stream)
+    assert _records(stream.getvalue()) == _inventory(firmware.image())
+
+
+def test_cli_writes_inventory_without_payloads(tmp_path, monkeypatch, capsys):
+    image_path = tmp_path / 'uefi.img'
+    image_path.write_bytes(firmware.image())
+
+    monkeypatch.setattr(sys, 'argv', ['uefi-reader', str(image_path), str(tmp_path / 'inventory.ndjson'), '--inventory'])
+    cli.main()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['inventory.ndjson', 'uefi.img']
+    assert _records((tmp_path / 'inventory.ndjson').read_text()) == _inventory(firmware.image())
+
+    monkeypatch.setattr(sys, 'argv', ['uefi-reader', str(image_path), '-', '--inventory'])
+    cli.main()
+    assert _records(capsys.readouterr().out) == _inventory(firmware.image())
@@ -0,0 +1,89 @@
+import gzip
+import struct
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+from python_uefi_reader.limits import DecompressionError, DecompressionLimitError
+
+PAYLOAD = firmware.section(firmware.RAW, bytes(4 * 1024 * 1024))
+
+
+def _bomb(codec, recorded_size=None):
+    stream = None
+    if codec == 'lzma' and recorded_size is not None:
+        stream = firmware.lzma_stream(PAYLOAD, preset=1)
+        stream = stream[:5] + struct.pack('<Q', recorded_size) + stream[13:]
+    return firmware.single_file_image(firmware.sections(firmware.guid_defined(codec, PAYLOAD, stream),
+                                                        firmware.ui('Bomb')))
+
+
+def _corrupt(codec):
+    if codec == 'lzma':
+        stream = firmware.lzma_stream(b'x' * 4096)
+        stream = stream[:13] + b'\xff' * 32 + stream[45:]
+    else:
+        stream = bytearray(gzip.compress(b'x' * 4096))
+        stream[12:40] = b'\xff' * 28
+        stream = bytes(stream)
+    return firmware.single_file_image(firmware.sections(firmware.guid_defined(codec, b'', stream)))
+
+
+def _truncated(codec):
+    stream = firmware.lzma_stream(bytes(range(256)) * 64) if codec == 'lzma' else gzip.compress(bytes(range(256)) * 64)
+    return firmware.single_file_image(firmware.sections(firmware.guid_defined(codec, b'', stream[:len(stream) // 2])))
+
+
+def test_default_limits_allow_normal_images():
+    uefi = UEFI(firmware.image(), verbose=False)
+    assert len(uefi.efis) == 6
+    assert uefi.errors == []
+    assert uefi.decompressed_bytes > 0
+
+
+@pytest.mark.parametrize('codec, recorded_size', [('lzma', None), ('lzma', 1000), ('gzip', None)])
+def test_section_limit(codec, recorded_size):
+    with pytest.raises(DecompressionLimitError) as raised:
+        UEFI(_bomb(codec, recorded_size), verbose=False, max_section_size=1024 * 1024)
+    assert raised.value.kind == 'section'
+    assert raised.value.limit == 1024 * 1024
+
+
+def test_image_limit():
+    with pytest.raises(DecompressionLimitError) as raised:
+        UEFI(firmware.image(), verbose=False, max_image_size=64)
+    assert raised.value.kind == 'image'
+
+
+def test_no_limit():
+    uefi = UEFI(_bomb('gzip'), verbose=False, max_section_size=None, max_image_size=None)
+    assert len(uefi.efis[0].section_elements[0].decompressed_image) == len(PAYLOAD) - 4
+
+
+def test_tolerant_records_limit_errors():
+    uefi = UEFI(_bomb('lzma'), verbose=False, max_section_size=1024 * 1024, tolerant=True)
+    assert len(uefi.errors) == 1
+    assert isinstance(uefi.errors[0][1], DecompressionLimitError)
+    assert [s.type for s in uefi.efis[0].section_elements] == ['UI']
+    assert len(uefi.efis) == 2
+
+
+@pytest.mark.parametrize('codec', ['lzma', 'gzip'])
+@pytest.mark.parametrize('build', [_corrupt, _truncated])
+def test_corrupt_stream_raises_value_error(codec, build):
+    with pytest.raises(ValueError):
+        UEFI(build(codec), verbose=False)
+
+
+@pytest.mark.parametrize('codec', ['lzma', 'gzip'])
+def test_tolerant_records_corrupt_streams(codec):
+    uefi = UEFI(_corrupt(codec), verbose=False, tolerant=True)
+    assert len(uefi.errors) == 1
+    assert isinstance(uefi.errors[0][1], DecompressionError)
+    assert len(uefi.efis) == 2
+
+
+def test_depth_is_checked_before_decompressing():
+    with pytest.raises(ValueError, match='nesting depth'):
+        UEFI(firmware.image(), verbose=False, max_depth=0)
@@ -0,0 +1,122 @@
+import io
+import os
+import tarfile
+import time
+import warnings
+import zipfile
+from datetime import datetime, timezone
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+from python_uefi_reader.output import ARCHIVE_FORMATS, ArchiveOutput
+
+TIMESTAMP = datetime(2023, 11, 14, tzinfo=timezone.utc)
+
+
+def _duplicates_image() -> bytes:
+    """An image with two FREEFORM files named Logo File and a RAW file repeated in a nested volume."""
+    inner = firmware.volume([firmware.ffs(firmware.RAW_FILE, 0x01, b'inner-raw')])
+    return firmware.volume([
+        firmware.ffs(firmware.LOGO, 0x02, firmware.sections(firmware.section(firmware.RAW, b'first'),
+                                                            firmware.ui('Logo File'))),
+        firmware.ffs(firmware.RAW_FILE, 0x01, b'outer-raw'),
+        firmware.ffs(firmware.NESTED_FV, 0x0B, firmware.section(firmware.FV_IMAGE, inner)),
+        firmware.ffs(firmware.BAR_DXE, 0x02, firmware.sections(firmware.section(firmware.RAW, b'second'),
+                                                               firmware.ui('Logo File'))),
+    ])
+
+
+def _tree(root) -> dict:
+    files = {}
+    for directory, _, names in os.walk(str(root)):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, str(root)).replace(os.sep, '/')] = f.read()
+    return files
+
+
+def _members(data: bytes, archive_format: str) -> list:
+    if archive_format == 'zip':
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            return [(info.filename, archive.read(info)) for info in archive.infolist()]
+    with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+        return [(member.name, archive.extractfile(member).read()) for member in archive.getmembers()]
+
+
+def _extract(data: bytes, archive_format: str, prefix: str = '') -> bytes:
+    target = io.BytesIO()
+    UEFI(data, verbose=False).extract_uefi(ArchiveOutput(target, archive_format, prefix, mtime=0),
+                                           timestamp=TIMESTAMP)
+    return target.getvalue()
+
+
+@pytest.mark.parametrize('archive_format', ARCHIVE_FORMATS)
+@pytest.mark.parametrize('data', [firmware.image(), _duplicates_image()], ids=['image', 'duplicates'])
+def test_archive_matches_directory(archive_format, data, tmp_path):
+    UEFI(data, verbose=False).extract_uefi(str(tmp_path / 'out'), timestamp=TIMESTAMP)
+    expected = _tree(tmp_path / 'out')
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        members = _members(_extract(data, archive_format), archive_format)
+    names = [name for name, _ in members]
+    assert len(names) == len(set(names))
+    assert dict(members) == expected
+
+
+def test_duplicate_raw_files_keep_the_last():
+    members = dict(_members(_extract(_duplicates_image(), 'tar'), 'tar'))
+    assert members['RawFiles/Logo_File'] == b'second'
+    assert members[f'RawFiles/{firmware.RAW_FILE}'] == b'inner-raw'
+    assert {'DXE.inc', 'DXE.dsc.inc', 'APRIORI.inc'} <= set(members)
+
+
+@pytest.mark.parametrize('archive_format', ['tar', 'zip'])
+def test_archive_prefix_and_metadata(archive_format):
+    members = _members(_extract(firmware.image(), archive_format, prefix='/fw/'), archive_format)
+    assert all(name.startswith('fw/') for name, _ in members)
+    assert 'fw/DXE.inc' in dict(members)
+
+    data = _extract(firmware.image(), archive_format)
+    if archive_format == 'zip':
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            info = archive.infolist()[0]
+            assert info.date_time == (1980, 1, 1, 0, 0, 0)
+            assert info.external_attr >> 16 == 0o644
+    else:
+        with tarfile.open(fileobj=io.BytesIO(data)) as archive:
+            member = archive.getmembers()[0]
+            assert (member.mtime, member.mode) == (0, 0o644)
+
+
+def test_archive_to_file_and_unsupported_format(tmp_path):
+    path = tmp_path / 'out.tar.gz'
+    UEFI(firmware.image(), verbose=False).extract_uefi(ArchiveOutput(str(path), 'tar.gz'), timestamp=TIMESTAMP)
+    assert 'DXE.inc' in dict(_members(path.read_bytes(), 'tar.gz'))
+
+    with pytest.raises(ValueError, match='Unsupported archive format'):
+        ArchiveOutput(io.BytesIO(), '7z')
+
+
+def test_zip_bytes_do_not_depend_on_the_time_zone(monkeypatch):
+    if not hasattr(time, 'tzset'):
+        pytest.skip("time.tzset is not available")
+    archives = []
+    try:
+        for zone in ('UTC', 'Asia/Bangkok', 'America/New_York'):
+            monkeypatch.setenv('TZ', zone)
+            time.tzset()
+            target = io.BytesIO()
+            output = ArchiveOutput(target, 'zip', mtime=1700000000)
+            output.write_bytes('a.bin', b'payload')
+            output.close()
+            archives.append(target.getvalue())
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    assert archives[0] == archives[1] == archives[2]
+    with zipfile.ZipFile(io.BytesIO(archives[0])) as archive:
+        assert archive.infolist()[0].date_time == (2023, 11, 14, 22, 13, 20)
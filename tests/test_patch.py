@@ -0,0 +1,63 @@
+import mmap
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+
+OUTER = 0x100
+
+
+@pytest.mark.parametrize('growth', [0, -64, 2048])
+def test_patch_in_place(growth):
+    original = firmware.image(free=4096)
+    buffer = bytearray(original)
+    uefi = UEFI(original, verbose=False)
+    size = len(uefi.index.section(firmware.DXE_CORE, 'PE32').decompressed_image) + growth
+    payload = firmware.pe_payload(b'patched', size)[:size]
+    uefi.patch(buffer, firmware.DXE_CORE, payload)
+
+    assert len(buffer) == len(original)
+    firmware.verify_volume(buffer, OUTER)
+    assert firmware.parsed_payload(buffer, firmware.DXE_CORE) == payload
+    for guid in (firmware.FOO_DXE, firmware.BAR_DXE, firmware.GZ_DXE):
+        assert firmware.parsed_payload(buffer, guid) == uefi.index.section(guid, 'PE32').decompressed_image
+    assert firmware.parsed_payload(buffer, firmware.LOGO, 'RAW') == uefi.index.section(firmware.LOGO, 'RAW').decompressed_image
+    assert buffer[:OUTER] == original[:OUTER]
+    assert buffer[-100:] == original[-100:]
+
+
+def test_nested_volume_updates_enclosing_checksums():
+    buffer = bytearray(firmware.checksummed_image())
+    uefi = UEFI(bytes(buffer), verbose=False)
+    uefi.patch(buffer, firmware.FOO_DXE, firmware.pe_payload(b'foo', 1024))
+    assert firmware.verify_volume(buffer) == 4
+    assert firmware.parsed_payload(buffer, firmware.FOO_DXE) == firmware.pe_payload(b'foo', 1024)
+
+
+def test_raw_file():
+    buffer = bytearray(firmware.checksummed_image())
+    UEFI(bytes(buffer), verbose=False).patch(buffer, firmware.RAW_FILE, b'other contents!', 'RAW')
+    firmware.verify_volume(buffer)
+    assert firmware.parsed_payload(buffer, firmware.RAW_FILE, 'RAW') == b'other contents!'
+
+
+def test_writable_mmap(tmp_path):
+    path = tmp_path / 'uefi.img'
+    path.write_bytes(firmware.image(free=4096))
+    with open(str(path), 'r+b') as f, mmap.mmap(f.fileno(), 0) as buffer:
+        UEFI(bytes(buffer), verbose=False).patch(buffer, firmware.DXE_CORE, firmware.pe_payload(b'mapped', 512))
+    data = path.read_bytes()
+    firmware.verify_volume(data, OUTER)
+    assert firmware.parsed_payload(data, firmware.DXE_CORE) == firmware.pe_payload(b'mapped', 512)
+
+
+@pytest.mark.parametrize('image, guid, section_type, payload, message', [
+    (firmware.image(free=4096), firmware.GZ_DXE, 'PE32', b'MZ', 'compressed'),
+    (firmware.image(), firmware.DXE_CORE, 'PE32', firmware.pe_payload(b'big', 4096), 'free space'),
+    (firmware.image(), firmware.LOGO, 'PE32', b'MZ', 'No PE32 section'),
+])
+def test_refused_patches(image, guid, section_type, payload, message):
+    buffer = bytearray(image)
+    with pytest.raises(ValueError, match=message):
+        UEFI(image, verbose=False).patch(buffer, guid, payload, section_type)
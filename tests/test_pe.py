@@ -0,0 +1,159 @@
+import io
+import json
+import struct
+
+import pytest
+
+import firmware
+from python_uefi_reader import IndexFile, UEFI
+from python_uefi_reader.pe import analyze
+
+PDB = 'e:/build/Foo/DEBUG/Foo.dll'
+
+
+def _images_image() -> bytes:
+    """A volume with a PE32 driver, an X64 PE32+ driver in a GZIP section and a TE driver."""
+    return firmware.volume([
+        firmware.ffs(firmware.FOO_DXE, 0x07, firmware.sections(
+            firmware.section(firmware.PE32, firmware.pe_image()), firmware.ui('FooDxe'))),
+        firmware.ffs(firmware.BAR_DXE, 0x07, firmware.sections(firmware.guid_defined('gzip', firmware.sections(
+            firmware.section(firmware.PE32, firmware.pe_image(plus=True, machine=0x8664)), firmware.ui('BarDxe'))))),
+        firmware.ffs(firmware.GZ_DXE, 0x07, firmware.sections(
+            firmware.section(firmware.TE, firmware.te_image(codeview='NB10')), firmware.ui('TeDxe'))),
+    ])
+
+
+@pytest.mark.parametrize('plus, image_format, image_base', [(False, 'PE32', 0x10000), (True, 'PE32+', 0x1_0000_0000)])
+def test_pe_headers(plus, image_format, image_base):
+    info = analyze(firmware.pe_image(plus=plus, image_base=image_base))
+    assert info.format == image_format
+    assert (info.machine, info.machine_name) == (0xAA64, 'AARCH64')
+    assert (info.entry_point, info.image_base) == (firmware.TEXT_RVA + 0x100, image_base)
+    assert (info.image_size, info.headers_size) == (0x2000, firmware.TEXT_OFFSET)
+    assert (info.subsystem, info.subsystem_name) == (11, 'EFI_BOOT_SERVICE_DRIVER')
+    assert info.timestamp == 0x5F000000
+    assert info.stripped_size == 0
+
+    [text] = info.sections
+    assert (text.name, text.virtual_address, text.virtual_size) == ('.text', firmware.TEXT_RVA, 0x180)
+    assert (text.raw_offset, text.raw_size, text.characteristics) == (firmware.TEXT_OFFSET, firmware.TEXT_SIZE,
+                                                                      0x60000020)
+    assert info.file_offset(firmware.TEXT_RVA + 0x10) == firmware.TEXT_OFFSET + 0x10
+    assert info.file_offset(0x40) == 0x40
+    assert info.file_offset(firmware.TEXT_RVA + firmware.TEXT_SIZE) is None
+
+
+def test_te_headers():
+    info = analyze(firmware.te_image(image_base=0x20000))
+    assert (info.format, info.machine_name, info.subsystem_name) == ('TE', 'AARCH64', 'EFI_BOOT_SERVICE_DRIVER')
+    assert (info.entry_point, info.image_base, info.timestamp) == (firmware.TEXT_RVA + 0x100, 0x20000, None)
+    assert info.stripped_size == firmware.TE_STRIPPED_SIZE
+    assert info.headers_size == firmware.TE_STRIPPED_SIZE + 40
+    # TE images do not record their size; it ends with the last section
+    assert info.image_size == firmware.TEXT_RVA + 0x180
+    # Offsets within the payload are PE file offsets less the headers the TE header replaced
+    delta = firmware.TE_STRIPPED_SIZE - 40
+    assert info.file_offset(firmware.TEXT_RVA) == firmware.TEXT_OFFSET - delta
+    assert info.sections[0].raw_offset == firmware.TEXT_OFFSET
+
+
+@pytest.mark.parametrize('build', [firmware.pe_image, lambda **kw: firmware.pe_image(plus=True, **kw),
+                                   firmware.te_image], ids=['PE32', 'PE32+', 'TE'])
+def test_codeview_entries(build):
+    info = analyze(build(pdb=PDB, age=7))
+    [entry] = info.debug
+    assert (entry.type, entry.timestamp, entry.rva) == (2, 0x5F000000, firmware.CODEVIEW_RVA)
+    assert (entry.pdb_path, str(entry.pdb_guid), entry.age) == (PDB, firmware.PDB_GUID, 7)
+    assert info.file_offset(entry.rva) == entry.offset
+    assert info.pdb_path == PDB
+
+    [nb10] = analyze(build(codeview='NB10', pdb='Foo.pdb', age=3)).debug
+    assert (nb10.pdb_path, nb10.pdb_guid, nb10.age) == ('Foo.pdb', None, 3)
+
+
+def test_images_without_debug_directory_or_known_types():
+    info = analyze(firmware.pe_image(machine=0x1234, debug=False))
+    assert (info.debug, info.pdb_path) == ([], None)
+    assert info.machine_name == '0x1234'
+    info.subsystem = 99
+    assert info.subsystem_name == '99'
+
+
+def test_invalid_images():
+    image = bytearray(firmware.pe_image())
+    for data, message in [
+        (b'\x7fELF' + bytes(64), 'Not a PE32 or TE image'),
+        (b'MZ' + bytes(0x3E), 'Missing PE signature'),
+        (bytes(image[:0x50]), 'Truncated image header'),
+        (firmware.te_image()[:30], 'Truncated image header'),
+    ]:
+        with pytest.raises(ValueError, match=message):
+            analyze(data)
+
+    struct.pack_into('<H', image, 0x58, 0x107)
+    with pytest.raises(ValueError, match='Unknown optional header magic 0x107'):
+        analyze(bytes(image))
+
+    image = bytearray(firmware.pe_image())
+    struct.pack_into('<I', image, 0x58 + 96 + 6 * 8, 0x8000)
+    with pytest.raises(ValueError, match='Debug directory at RVA 0x8000 is outside the image'):
+        analyze(bytes(image))
+
+
+def test_sections_memoize_image_info():
+    uefi = UEFI(_images_image(), verbose=False)
+    section = uefi.index.section(firmware.FOO_DXE, 'PE32')
+    info = section.image_info
+    assert info.format == 'PE32'
+    assert section.image_info is info
+
+    # Replacing the payload decodes it again
+    section.decompressed_image = firmware.te_image()
+    assert section.image_info.format == 'TE'
+    section.decompressed_image = b'not an image'
+    assert section.image_info is None
+    assert uefi.index.section(firmware.FOO_DXE, 'UI').image_info is None
+
+
+def test_index_apis():
+    uefi = UEFI(_images_image(), verbose=False)
+    assert uefi.index.image_info(firmware.FOO_DXE).format == 'PE32'
+    assert uefi.index.image_info(firmware.BAR_DXE).machine_name == 'X64'
+    assert uefi.index.image_info(firmware.GZ_DXE).format == 'TE'
+    assert uefi.index.image_info(firmware.DXE_CORE) is None
+    assert [(str(efi.guid), info.format) for efi, _, info in uefi.index.images()] == [
+        (firmware.FOO_DXE, 'PE32'), (firmware.BAR_DXE, 'PE32+'), (firmware.GZ_DXE, 'TE')]
+    assert [str(efi.guid) for efi, _, _ in uefi.index.images('AARCH64')] == [firmware.FOO_DXE, firmware.GZ_DXE]
+
+
+def test_index_file_reads_headers_from_the_image(tmp_path):
+    data = _images_image()
+    image_path = tmp_path / 'uefi.img'
+    image_path.write_bytes(data)
+    UEFI(data, verbose=False).save_index(str(tmp_path / 'uefi.idx'))
+    with IndexFile(str(tmp_path / 'uefi.idx'), str(image_path)) as index:
+        info = index.image_info(index.section(firmware.BAR_DXE, 'PE32'))
+        assert (info.format, info.machine_name, info.pdb_path) == ('PE32+', 'X64', PDB)
+        assert index.image_info(index.section(firmware.BAR_DXE, 'PE32')) is info
+        assert index.image_info(index.section(firmware.GZ_DXE, 'TE')).format == 'TE'
+        assert index.image_info(index.section(firmware.GZ_DXE, 'UI')) is None
+
+
+def test_inventory_records_carry_headers():
+    stream = io.StringIO()
+    UEFI.write_inventory(_images_image(), stream)
+    images = {(r['file'], r['type']): r['image'] for r in map(json.loads, stream.getvalue().splitlines())
+              if r['record'] == 'section'}
+    assert images[(firmware.BAR_DXE, 'PE32')] == {
+        'format': 'PE32+',
+        'machine': 'X64',
+        'entry_point': firmware.TEXT_RVA + 0x100,
+        'image_base': 0x10000,
+        'image_size': 0x2000,
+        'subsystem': 'EFI_BOOT_SERVICE_DRIVER',
+        'sections': [{'name': '.text', 'virtual_address': firmware.TEXT_RVA, 'virtual_size': 0x180,
+                      'raw_offset': firmware.TEXT_OFFSET, 'raw_size': firmware.TEXT_SIZE}],
+        'pdb_path': PDB,
+    }
+    assert images[(firmware.GZ_DXE, 'TE')]['format'] == 'TE'
+    assert images[(firmware.FOO_DXE, 'UI')] is None
@@ -0,0 +1,71 @@
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+from python_uefi_reader.probe import find_build_id, find_volumes, probe, probe_buffer
+
+
+def test_probe_reports_headers_only():
+    image = firmware.image()
+    result = probe_buffer(image)
+    assert result.image_size == len(image)
+    assert result.build_id == firmware.BUILD_ID
+    assert result.volume_count == 1
+    offset, size = result.volumes[0]
+    assert offset == 0x100 and image[offset + 0x28:offset + 0x2C] == b'_FVH'
+    assert size == int.from_bytes(image[offset + 0x20:offset + 0x28], 'little')
+    # The files of the LZMA-compressed volume are not counted, nor the sections of drivers
+    assert result.file_count == 6
+    assert result.compressed_sections == 1
+
+
+def test_probe_file(tmp_path):
+    path = tmp_path / 'uefi.img'
+    path.write_bytes(firmware.image())
+    result = UEFI.probe(str(path))
+    assert (result.build_id, result.volumes, result.file_count) == \
+        (firmware.BUILD_ID, probe_buffer(firmware.image()).volumes, 6)
+
+    path.write_bytes(b'')
+    result = probe(str(path))
+    assert (result.image_size, result.build_id, result.volumes, result.file_count) == (0, '', [], 0)
+
+
+def test_uncompressed_nested_volumes_are_counted():
+    result = probe_buffer(firmware.nested_volumes(3))
+    assert result.volume_count == 1
+    assert result.file_count == 4
+    assert result.compressed_sections == 0
+
+
+@pytest.mark.parametrize('depth', [32, 33])
+def test_nesting_depth_is_bounded_as_when_parsing(depth):
+    data = firmware.nested_volumes(depth)
+    if depth <= 32:
+        assert probe_buffer(data).file_count == depth + 1
+        assert [str(efi.guid) for efi in UEFI(data, verbose=False).efis] == [firmware.FOO_DXE]
+    else:
+        for parse in (probe_buffer, lambda d: UEFI(d, verbose=False)):
+            with pytest.raises(ValueError, match='nesting depth'):
+                parse(data)
+
+
+def test_deep_nesting_does_not_recurse():
+    data = firmware.nested_volumes(1200)
+    with pytest.raises(ValueError, match='nesting depth'):
+        probe_buffer(data)
+    assert probe_buffer(data, max_depth=1200).file_count == 1201
+
+
+def test_find_build_id():
+    assert find_build_id(b'xx QC_IMAGE_VERSION_STRING=BOOT.XF.1-2_3.\x00') == 'BOOT.XF.1-2_3'
+    assert find_build_id(b'QC_IMAGE_VERSION_STRING=\x00 QC_IMAGE_VERSION_STRING=ok') == 'ok'
+    assert find_build_id(b'QC_IMAGE_VERSION_STRING=first', [(5, 30)]) == ''
+    assert find_build_id(b'no marker') == ''
+
+
+def test_find_volumes_skips_corrupt_headers():
+    image = bytearray(firmware.image())
+    assert [offset for offset, _ in find_volumes(image, [(0, len(image))])] == [0x100]
+    image[0x100 + 0x32] ^= 0xFF
+    assert list(find_volumes(image, [(0, len(image))])) == []
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI, CancellationToken, DeadlineExceeded, OperationCancelled
+
+
+def _files(root):
+    return [f for _, _, files in os.walk(root) for f in files]
+
+
+def test_parse_reports_volumes_and_decompression():
+    events = []
+    UEFI(firmware.image(), verbose=False, progress=events.append)
+    phases = {e.phase for e in events}
+    assert phases == {'volume', 'decompress'}
+    assert sum(1 for e in events if e.phase == 'decompress') == 4
+    last = [e for e in events if e.phase == 'volume'][-1]
+    assert last.done == last.total and last.entries == 6
+
+
+def test_cancel_and_timeout():
+    token = CancellationToken()
+    token.cancel()
+    with pytest.raises(OperationCancelled):
+        UEFI(firmware.image(), verbose=False, cancel=token)
+    with pytest.raises(DeadlineExceeded):
+        UEFI(firmware.image(), verbose=False, timeout=0)
+
+
+def test_extract_reports_each_file(tmp_path):
+    events = []
+    UEFI(firmware.image(), verbose=False).extract_uefi(str(tmp_path), progress=events.append)
+    assert [e.done for e in events] == list(range(len(events)))
+    assert events[-1].done == events[-1].total == len(_files(str(tmp_path)))
+
+
+def test_async_forwards_progress_and_timeout(tmp_path):
+    async def run():
+        events = []
+        uefi = await UEFI.parse_async(firmware.image(), verbose=False, progress=events.append, files_per_step=1)
+        assert events
+        extracted = []
+        await uefi.extract_async(str(tmp_path / 'out'), progress=extracted.append)
+        assert extracted[-1].phase == 'extract'
+        with pytest.raises(DeadlineExceeded):
+            await uefi.extract_async(str(tmp_path / 'late'), timeout=0)
+        token = CancellationToken()
+        token.cancel()
+        with pytest.raises(OperationCancelled):
+            await UEFI.parse_async(firmware.image(), verbose=False, cancel=token)
+    asyncio.run(run())
+
+
+def test_cancelling_the_extract_task_stops_the_extraction(tmp_path):
+    started, release = threading.Event(), threading.Event()
+
+    def progress(event):
+        if not started.is_set():
+            started.set()
+            release.wait(5)
+
+    async def run(executor):
+        uefi = UEFI(firmware.image(), verbose=False)
+        task = asyncio.ensure_future(uefi.extract_async(str(tmp_path), executor=executor, progress=progress))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        release.set()
+
+    executor = ThreadPoolExecutor(1)
+    asyncio.run(run(executor))
+    executor.shutdown(wait=True)
+    assert len(_files(str(tmp_path))) == 1
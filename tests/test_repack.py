@@ -0,0 +1,161 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI, CompressionCache
+
+OUTER = 0x100
+NAME = '88888888-8888-8888-8888-888888888888'
+
+
+def _parse(data):
+    return UEFI(data, verbose=False)
+
+
+def _replace(uefi, guid, section_type, payload):
+    uefi.index.section(guid, section_type).decompressed_image = payload
+
+
+def test_unchanged_image_is_copied():
+    assert _parse(firmware.image()).repack() == firmware.image()
+
+
+@pytest.mark.parametrize('guid', [firmware.DXE_CORE, firmware.FOO_DXE, firmware.BAR_DXE, firmware.GZ_DXE])
+@pytest.mark.parametrize('size', [0, 4096])
+def test_modified_sections_round_trip(guid, size):
+    uefi = _parse(firmware.image(free=16384))
+    payload = firmware.pe_payload(b'patched', size)
+    _replace(uefi, guid, 'PE32', payload)
+    data = uefi.repack()
+
+    assert len(data) == len(firmware.image(free=16384))
+    firmware.verify_volume(data, OUTER)
+    repacked = _parse(data)
+    assert firmware.payload(repacked, guid) == payload
+    for other in (firmware.DXE_CORE, firmware.FOO_DXE, firmware.BAR_DXE, firmware.GZ_DXE):
+        if other != guid:
+            assert firmware.payload(repacked, other) == firmware.payload(_parse(firmware.image()), other)
+    assert repacked.build_id == firmware.BUILD_ID
+    assert [efi.guid for efi in repacked.efis] == [efi.guid for efi in uefi.efis]
+
+
+def test_raw_and_ui_sections():
+    uefi = _parse(firmware.image(free=4096))
+    _replace(uefi, firmware.LOGO, 'RAW', b'new logo bytes')
+    _replace(uefi, firmware.BAR_DXE, 'UI', firmware.ui('Renamed')[4:])
+    data = uefi.repack()
+    firmware.verify_volume(data, OUTER)
+    repacked = _parse(data)
+    assert firmware.payload(repacked, firmware.LOGO, 'RAW') == b'new logo bytes'
+    assert repacked.index.section(firmware.BAR_DXE, 'UI').name == 'Renamed'
+
+
+def test_outer_volume_does_not_grow():
+    uefi = _parse(firmware.image())
+    _replace(uefi, firmware.DXE_CORE, 'PE32', firmware.pe_payload(b'big', 8192))
+    with pytest.raises(ValueError):
+        uefi.repack()
+
+
+def test_file_data_checksums_are_updated():
+    image = firmware.checksummed_image()
+    firmware.verify_volume(image)
+    uefi = _parse(image)
+    _replace(uefi, firmware.FOO_DXE, 'PE32', firmware.pe_payload(b'foo', 1024))
+    _replace(uefi, firmware.GZ_DXE, 'PE32', firmware.pe_payload(b'gz', 1024))
+    data = uefi.repack()
+    assert firmware.verify_volume(data) == 4
+    assert firmware.payload(_parse(data), firmware.FOO_DXE) == firmware.pe_payload(b'foo', 1024)
+
+
+def test_parallel_compression_and_cache():
+    cache = CompressionCache()
+    outputs = []
+    for executor in (None, ThreadPoolExecutor(4)):
+        uefi = _parse(firmware.image(free=16384))
+        _replace(uefi, firmware.FOO_DXE, 'PE32', firmware.pe_payload(b'foo', 2048))
+        _replace(uefi, firmware.GZ_DXE, 'PE32', firmware.pe_payload(b'gz', 2048))
+        outputs.append(uefi.repack(executor, cache=cache))
+        if executor is not None:
+            executor.shutdown()
+    assert outputs[0] == outputs[1]
+    assert len(cache) == 2
+    firmware.verify_volume(outputs[0], OUTER)
+
+
+def test_compression_properties():
+    for match_properties in (True, False):
+        uefi = _parse(firmware.image(free=16384))
+        _replace(uefi, firmware.FOO_DXE, 'PE32', firmware.pe_payload(b'foo', 512))
+        data = uefi.repack(preset=1, match_properties=match_properties)
+        assert firmware.payload(_parse(data), firmware.FOO_DXE) == firmware.pe_payload(b'foo', 512)
+
+
+def _named_volume(*pad_files):
+    return firmware.volume([
+        firmware.ffs(firmware.DXE_CORE, 0x07, firmware.sections(firmware.pe(firmware.build_path('DxeCore')))),
+        *pad_files,
+        firmware.ffs(firmware.LOGO, 0x02, firmware.sections(firmware.section(firmware.RAW, b'logo'))),
+    ], free=4096, name=NAME)
+
+
+def test_extended_header_is_kept():
+    image = _named_volume()
+    uefi = _parse(image)
+    _replace(uefi, firmware.DXE_CORE, 'PE32', firmware.pe_payload(b'patched', 1024))
+    data = uefi.repack()
+
+    assert len(data) == len(image)
+    assert data[:0x78] == image[:0x32] + data[0x32:0x34] + image[0x34:0x78]
+    assert data[0x60:0x70] == uuid.UUID(NAME).bytes_le
+    firmware.verify_volume(data)
+    repacked = _parse(data)
+    assert firmware.payload(repacked, firmware.DXE_CORE) == firmware.pe_payload(b'patched', 1024)
+    assert firmware.payload(repacked, firmware.LOGO, 'RAW') == b'logo'
+
+
+def test_pad_files_with_data_stay_in_place():
+    image = _named_volume(firmware.ffs(firmware.PAD_GUID, 0xF0, b'\xff' * 40),
+                          firmware.ffs(firmware.PAD_GUID, 0xF0, b'keep me!'))
+    position = image.index(b'keep me!') - 0x18
+    uefi = _parse(image)
+    _replace(uefi, firmware.DXE_CORE, 'PE32', firmware.pe_payload(b'x', 0))
+    data = uefi.repack()
+
+    firmware.verify_volume(data)
+    assert data[position:position + 0x20] == image[position:position + 0x20]
+    assert firmware.payload(_parse(data), firmware.LOGO, 'RAW') == b'logo'
+
+    # Files before a kept pad file cannot grow past it
+    _replace(uefi, firmware.DXE_CORE, 'PE32', firmware.pe_payload(b'x', 1024))
+    with pytest.raises(ValueError, match='pad file'):
+        uefi.repack()
+
+
+def test_files_growing_past_16_mib_get_a_large_header():
+    image = firmware.volume([
+        firmware.ffs(firmware.FOO_DXE, 0x07, firmware.sections(
+            firmware.pe(firmware.build_path('Foo')), firmware.section(firmware.RAW, b'raw'), firmware.ui('FooDxe'))),
+        firmware.ffs(firmware.DXE_CORE, 0x07, firmware.sections(firmware.pe(firmware.build_path('DxeCore')))),
+    ], free=19 * 1024 * 1024)
+    pe_payload = firmware.pe_payload(b'large', 9 * 1024 * 1024)
+    raw_payload = b'\x5a' * (9 * 1024 * 1024)
+    uefi = _parse(image)
+    _replace(uefi, firmware.FOO_DXE, 'PE32', pe_payload)
+    _replace(uefi, firmware.FOO_DXE, 'RAW', raw_payload)
+    data = uefi.repack()
+
+    assert len(data) == len(image)
+    assert firmware.verify_volume(data) == 2
+    # FFS_ATTRIB_LARGE_FILE alone; the 24-bit size field is all ones and the UINT64 size follows
+    assert data[0x48 + 0x13] == 0x01
+    assert data[0x48 + 0x14:0x48 + 0x17] == b'\xff\xff\xff'
+    repacked = _parse(data)
+    foo = repacked.index.get(firmware.FOO_DXE)
+    assert (foo.header_size, foo.size) == (0x20, int.from_bytes(data[0x48 + 0x18:0x48 + 0x20], 'little'))
+    assert foo.size > 0xFFFFFF
+    assert firmware.payload(repacked, firmware.FOO_DXE) == pe_payload
+    assert firmware.payload(repacked, firmware.FOO_DXE, 'RAW') == raw_payload
+    assert firmware.payload(repacked, firmware.DXE_CORE) == firmware.payload(uefi, firmware.DXE_CORE)
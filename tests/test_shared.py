@@ -0,0 +1,110 @@
+import gc
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+from python_uefi_reader.shared import parse_file
+
+pytestmark = pytest.mark.skipif(sys.version_info < (3, 8), reason="shared memory needs Python 3.8")
+
+
+def _payloads(uefi):
+    return [(efi.guid, s.type, s.decompressed_image) for efi in uefi.efis for s in efi.section_elements]
+
+
+def _tree(root):
+    return sorted(os.path.relpath(os.path.join(d, f), root) for d, _, files in os.walk(root) for f in files)
+
+
+def test_round_trip(tmp_path):
+    uefi = UEFI(firmware.image(), verbose=False)
+    shared = uefi.share().open()
+    try:
+        assert isinstance(shared.image, memoryview) and shared.image.readonly
+        assert bytes(shared.image) == firmware.image()
+        assert shared.build_id == uefi.build_id
+        assert _payloads(shared) == _payloads(uefi)
+        assert shared.index.section(firmware.FOO_DXE, 'PE32') is not None
+        assert str(shared.dependency_graph.expression(firmware.FOO_DXE)) == str(
+            uefi.dependency_graph.expression(firmware.FOO_DXE))
+        assert shared.repack() == uefi.repack()
+
+        uefi.extract_uefi(str(tmp_path / 'a'), timestamp=None)
+        shared.extract_uefi(str(tmp_path / 'b'), timestamp=None)
+        assert _tree(str(tmp_path / 'a')) == _tree(str(tmp_path / 'b'))
+    finally:
+        shared.shared.close()
+    with pytest.raises(ValueError):
+        shared.image[0]
+    with pytest.raises(ValueError, match='closed'):
+        shared.efis[0].section_elements[0].decompressed_image
+    shared.shared.close()
+
+
+def test_modified_payloads_leave_the_segment():
+    shared = UEFI(firmware.image(), verbose=False).share().open()
+    section = shared.index.section(firmware.FOO_DXE, 'PE32')
+    section.decompressed_image = section.decompressed_image + b'\x00' * 16
+    shared.shared.close()
+    assert section.decompressed_image.endswith(b'\x00' * 16)
+
+
+def test_close_refuses_while_slices_are_alive():
+    shared = UEFI(firmware.image(), verbose=False).share().open()
+    head = shared.image[:16]
+    with pytest.raises(ValueError, match='still referenced'):
+        shared.shared.close()
+    assert bytes(head) == firmware.image()[:16]
+    head.release()
+    shared.shared.close()
+
+
+def _open_descriptors():
+    return set(os.listdir('/proc/self/fd'))
+
+
+def _parse_and_count_descriptors(path, **options):
+    """Run parse_file in the worker; return its result and the descriptors it left open.
+
+    Resident sections and their PayloadStore refer to each other, so without
+    close the spill file would stay open until the cycle collector runs.
+    """
+    gc.disable()
+    try:
+        before = _open_descriptors()
+        result = parse_file(path, **options)
+        return result, _open_descriptors() - before
+    finally:
+        gc.enable()
+
+
+@pytest.mark.parametrize('options', [{}, {'memory_budget': 1000}], ids=['in-memory', 'spilled'])
+def test_parse_file_in_a_worker(options, tmp_path):
+    path = str(tmp_path / 'uefi.img')
+    with open(path, 'wb') as f:
+        f.write(firmware.image())
+    with ProcessPoolExecutor(1) as pool:
+        result = pool.submit(parse_file, path, **options).result()
+        if os.path.isdir('/proc/self/fd'):
+            for _ in range(3):
+                shared, leaked = pool.submit(_parse_and_count_descriptors, path, **options).result()
+                assert leaked == set()
+                shared.open().close()
+    with result.open() as uefi:
+        assert _payloads(uefi) == _payloads(UEFI(firmware.image(), verbose=False))
+
+
+def test_context_manager_removes_the_segment():
+    with UEFI(firmware.image(), verbose=False, memory_budget=0) as uefi:
+        result = uefi.share()
+    with result.open() as shared:
+        assert _payloads(shared) == _payloads(UEFI(firmware.image(), verbose=False))
+        section = shared.efis[0].section_elements[0]
+    with pytest.raises(ValueError, match='closed'):
+        section.decompressed_image
+    with pytest.raises(FileNotFoundError):
+        result.open()
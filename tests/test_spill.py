@@ -0,0 +1,140 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+from python_uefi_reader import __main__ as cli
+from python_uefi_reader.spill import PayloadStore
+
+
+def _sections(uefi):
+    return [s for efi in uefi.efis for s in efi.section_elements]
+
+
+def _payloads(uefi):
+    return [(efi.guid, s.type, s.decompressed_image) for efi in uefi.efis for s in efi.section_elements]
+
+
+def _tree(root):
+    files = {}
+    for directory, _, names in os.walk(str(root)):
+        for name in names:
+            with open(os.path.join(directory, name), 'rb') as f:
+                files[os.path.relpath(os.path.join(directory, name), str(root))] = f.read()
+    return files
+
+
+TOTAL = sum(len(s.decompressed_image) for s in _sections(UEFI(firmware.image(), verbose=False)))
+# Also counts the payloads of sections outside the file list: APRIORI and FV images
+ADMITTED = UEFI(firmware.image(), verbose=False, memory_budget=1 << 30).payloads.resident_bytes
+
+
+@pytest.mark.parametrize('budget', [0, 1000, ADMITTED - 40])
+def test_payloads_over_budget_are_spilled(budget):
+    plain = UEFI(firmware.image(), verbose=False)
+    with UEFI(firmware.image(), verbose=False, memory_budget=budget) as uefi:
+        store = uefi.payloads
+        assert 0 <= store.resident_bytes <= budget
+        assert store.resident_bytes + store.spilled_bytes == ADMITTED > TOTAL
+        assert uefi.resident_bytes == len(uefi.image) + store.resident_bytes
+
+        # The payloads admitted first are spilled first
+        spilled = [s._spilled is not None for s in _sections(uefi)]
+        assert spilled == sorted(spilled, reverse=True)
+        assert any(spilled)
+        assert sum(s._spilled[1] for s in _sections(uefi) if s._spilled is not None) <= store.spilled_bytes
+        assert _payloads(uefi) == _payloads(plain)
+
+
+def test_nothing_is_spilled_within_budget():
+    with UEFI(firmware.image(), verbose=False, memory_budget=ADMITTED) as uefi:
+        assert (uefi.payloads.resident_bytes, uefi.payloads.spilled_bytes) == (ADMITTED, 0)
+        assert uefi.payloads._file is None
+        assert all(s._spilled is None for s in _sections(uefi))
+
+
+def test_spilled_payloads_load_on_every_access():
+    with UEFI(firmware.image(), verbose=False, memory_budget=0) as uefi:
+        section = uefi.index.section(firmware.FOO_DXE, 'PE32')
+        first = section.decompressed_image
+        assert section._decompressed_image is None
+        assert section.decompressed_image == first and section.decompressed_image is not first
+
+        with ThreadPoolExecutor(8) as pool:
+            sections = _sections(uefi) * 8
+            assert list(pool.map(lambda s: s.decompressed_image, sections)) == [s.decompressed_image
+                                                                                for s in sections]
+
+
+def test_replaced_payloads_are_admitted_again():
+    with UEFI(firmware.image(free=16384), verbose=False, memory_budget=2048) as uefi:
+        section = uefi.index.section(firmware.FOO_DXE, 'PE32')
+        spilled_before = uefi.payloads.spilled_bytes
+        section.decompressed_image = firmware.pe_payload(b'patched', 4096)
+        assert section.decompressed_image == firmware.pe_payload(b'patched', 4096)
+        # The new payload is over the budget on its own, so it and everything resident is spilled
+        assert uefi.payloads.resident_bytes == 0
+        assert uefi.payloads.spilled_bytes > spilled_before
+        assert firmware.parsed_payload(uefi.repack(), firmware.FOO_DXE) == firmware.pe_payload(b'patched', 4096)
+
+
+def test_extraction_matches(tmp_path):
+    UEFI(firmware.image(), verbose=False).extract_uefi(str(tmp_path / 'plain'), timestamp=None)
+    with UEFI(firmware.image(), verbose=False, memory_budget=0) as uefi:
+        uefi.extract_uefi(str(tmp_path / 'spilled'), timestamp=None)
+    plain, spilled = _tree(tmp_path / 'plain'), _tree(tmp_path / 'spilled')
+    assert plain.keys() == spilled.keys()
+    assert all(plain[path] == spilled[path] for path in plain if not path.endswith('.inf'))
+
+
+def test_close_deletes_the_scratch_file():
+    uefi = UEFI(firmware.image(), verbose=False, memory_budget=1000)
+    resident = next(s for s in _sections(uefi) if s._spilled is None)
+    spilled = next(s for s in _sections(uefi) if s._spilled is not None)
+    payload = resident.decompressed_image
+
+    uefi.close()
+    assert uefi.payloads._file is None
+    assert resident.decompressed_image == payload
+    with pytest.raises(ValueError, match='Payload store is closed'):
+        spilled.decompressed_image
+    uefi.close()
+
+    with UEFI(firmware.image(), verbose=False, memory_budget=0) as uefi:
+        store = uefi.payloads
+    assert store._file is None
+
+    # Without a budget or shared memory there is nothing to release
+    with UEFI(firmware.image(), verbose=False) as uefi:
+        assert uefi.payloads is None and uefi.shared is None
+
+
+def test_spill_directory(tmp_path):
+    store = PayloadStore(0, str(tmp_path))
+    with UEFI(firmware.image(), verbose=False) as uefi:
+        for section in _sections(uefi):
+            store.admit(section)
+        assert store.spilled_bytes == TOTAL
+        if os.path.isdir('/proc/self/fd'):
+            assert os.readlink(f'/proc/self/fd/{store._file.fileno()}').startswith(str(tmp_path))
+        assert [s.decompressed_image for s in _sections(uefi)] == [s._decompressed_image for s in
+                                                                   _sections(UEFI(firmware.image(), verbose=False))]
+        store.close()
+
+
+def test_negative_budget():
+    with pytest.raises(ValueError, match='must not be negative'):
+        UEFI(firmware.image(), verbose=False, memory_budget=-1)
+
+
+def test_cli_memory_budget(tmp_path, monkeypatch):
+    image_path = tmp_path / 'uefi.img'
+    image_path.write_bytes(firmware.image())
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '0')
+    for name, extra in (('plain', []), ('spilled', ['--memory-budget', '0'])):
+        monkeypatch.setattr(sys, 'argv', ['uefi-reader', str(image_path), str(tmp_path / name)] + extra)
+        cli.main()
+    assert _tree(tmp_path / 'plain') == _tree(tmp_path / 'spilled')
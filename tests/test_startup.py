@@ -0,0 +1,50 @@
+"""
+Guards the startup cost of the command line tool and of the parser module.
+
+Each import runs in a fresh interpreter, so modules loaded by other tests do
+not hide an eager import.
+"""
+
+import subprocess
+import sys
+
+import pytest
+
+# Only needed by some commands; imported where they are used
+HEAVY_STDLIB = ['asyncio', 'concurrent.futures', 'csv', 'datetime', 'gzip', 'hashlib', 'json', 'lzma',
+                'mmap', 'multiprocessing', 'pickle', 'shutil', 'socketserver', 'sqlite3', 'tarfile',
+                'tempfile', 'zipfile']
+FEATURE_MODULES = ['corpus', 'daemon', 'depex', 'diff', 'elf', 'index_file', 'inventory', 'patch', 'pe',
+                   'probe', 'repack', 'shared', 'spill']
+
+
+def _loaded_after(statement: str):
+    script = f"import sys\n{statement}\nprint('\\n'.join(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, check=True,
+                            universal_newlines=True)
+    return set(result.stdout.split())
+
+
+@pytest.mark.parametrize('statement, extra', [
+    ('import python_uefi_reader.__main__', ['uefi']),
+    ('import python_uefi_reader.uefi', ['blob_store', 'output', 'templates']),
+    ('import python_uefi_reader', ['uefi', 'blob_store', 'output', 'templates']),
+])
+def test_no_eager_imports(statement, extra):
+    loaded = _loaded_after(statement)
+    unexpected = [m for m in HEAVY_STDLIB if m in loaded]
+    unexpected += [m for m in FEATURE_MODULES + extra if f'python_uefi_reader.{m}' in loaded]
+    assert unexpected == []
+
+
+def test_public_names_resolve_on_access():
+    import python_uefi_reader
+    for name in python_uefi_reader.__all__:
+        assert getattr(python_uefi_reader, name) is not None
+    with pytest.raises(AttributeError):
+        python_uefi_reader.no_such_name
+
+
+def test_daemon_client_does_not_load_the_parser():
+    loaded = _loaded_after('import python_uefi_reader.daemon')
+    assert [m for m in FEATURE_MODULES + ['uefi'] if m != 'daemon' and f'python_uefi_reader.{m}' in loaded] == []
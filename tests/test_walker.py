@@ -0,0 +1,63 @@
+import sys
+import uuid
+
+import pytest
+
+import firmware
+from python_uefi_reader import UEFI
+
+DEPTH = 1200
+
+
+def _guid(level: int, position: int) -> str:
+    return str(uuid.UUID(int=level << 8 | position))
+
+
+def _bracketed_volumes(depth: int) -> bytes:
+    """Nested volumes where each level holds a driver before and after the FV image file of the next level."""
+    data = firmware.volume([firmware.ffs(_guid(depth, 0), 0x07, firmware.sections(firmware.ui('Leaf')))])
+    for level in reversed(range(depth)):
+        data = firmware.volume([
+            firmware.ffs(_guid(level, 0), 0x07, firmware.sections(firmware.ui(f'Before{level}'))),
+            firmware.ffs(firmware.NESTED_FV, 0x0B, firmware.section(firmware.FV_IMAGE, data)),
+            firmware.ffs(_guid(level, 2), 0x07, firmware.sections(firmware.ui(f'After{level}'))),
+        ])
+    return data
+
+
+def test_deep_nesting_does_not_recurse():
+    assert DEPTH > sys.getrecursionlimit()
+    data = firmware.nested_volumes(DEPTH)
+    uefi = UEFI(data, verbose=False, max_depth=DEPTH)
+
+    [efi] = uefi.efis
+    assert str(efi.guid) == firmware.FOO_DXE
+    assert len(efi.path) == DEPTH + 1
+    assert all(container.type == 'FV' for container in efi.path)
+    assert efi.path[0].offset == 0 and efi.path[0].size == len(data)
+
+
+def test_deep_nesting_limit_is_exact():
+    data = firmware.nested_volumes(DEPTH)
+    with pytest.raises(ValueError, match=f'Maximum nesting depth of {DEPTH - 1} exceeded'):
+        UEFI(data, verbose=False, max_depth=DEPTH - 1)
+    with pytest.raises(ValueError, match='nesting depth'):
+        UEFI(data, verbose=False)
+
+
+@pytest.mark.parametrize('depth', [1, 5, 300])
+def test_nested_files_come_where_their_volume_sits(depth):
+    uefi = UEFI(_bracketed_volumes(depth), verbose=False, max_depth=depth)
+    expected = ([_guid(level, 0) for level in range(depth + 1)]
+                + [_guid(level, 2) for level in reversed(range(depth))])
+    assert [str(efi.guid) for efi in uefi.efis] == expected
+    assert [len(efi.path) for efi in uefi.efis] == \
+        list(range(1, depth + 2)) + list(reversed(range(1, depth + 1)))
+
+
+def test_files_follow_image_order():
+    uefi = UEFI(firmware.image(), verbose=False)
+    assert [str(efi.guid) for efi in uefi.efis] == [
+        firmware.DXE_CORE, firmware.LOGO, firmware.RAW_FILE, firmware.FOO_DXE, firmware.BAR_DXE, firmware.GZ_DXE]
+    outer = [efi for efi in uefi.efis if len(efi.path) == 1]
+    assert [efi.offset for efi in outer] == sorted(efi.offset for efi in outer)